@@ -0,0 +1,348 @@
+"""
+Benchmark prompt and model variants on the parse pipeline.
+
+    poetry run python benchmarks/bench_parse.py [--model mistral --model llama3.1]
+        [--prompt prompts/terse.txt] [--concurrency 4] [--compare results/before.json]
+    poetry run python benchmarks/bench_parse.py --stub
+
+Every variant (model x prompt template) parses the labeled English, Shona and
+Ndebele messages in corpus.jsonl through message_handler.run_parse, the code
+behind /parse, with a cap on calls in flight. Learning is off, so a run never
+teaches the normalization store. The report records token counts, eval
+duration, tokens/sec, JSON validity, intent accuracy and accuracy of the
+REQUIRED_FIELDS the corpus labels. It is written as JSON so that a later run
+can be diffed against it with --compare.
+
+--stub starts local stub backends that answer with the corpus labels (and
+some malformed replies), to check the harness itself without a model.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+from llm_service import message_handler, normalization, stub_ollama  # noqa: E402
+from llm_service.ollama_pool import BackendPool, OLLAMA_HOSTS  # noqa: E402
+
+CORPUS_PATH = os.path.join(BENCH_DIR, "corpus.jsonl")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+NUMERIC_FIELDS = ("quantity", "price", "rating")
+
+# Metrics shown by --compare, and whether a higher value is better.
+COMPARED = {
+    "json_valid_rate": True,
+    "intent_accuracy": True,
+    "field_accuracy": True,
+    "latency_p50_ms": False,
+    "latency_p95_ms": False,
+    "prompt_tokens_mean": False,
+    "eval_tokens_mean": False,
+    "eval_duration_mean_ms": False,
+    "tokens_per_sec": True,
+}
+
+
+# --------------------------------------
+# Corpus & Variants
+# --------------------------------------
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _sha(text):
+    return hashlib.sha256(text.encode()).hexdigest()[:12]
+
+
+def load_variants(models, prompt_paths):
+    templates = [("current", message_handler.PROMPT_TEMPLATE)]
+    for path in prompt_paths:
+        with open(path, encoding="utf-8") as f:
+            templates.append((os.path.splitext(os.path.basename(path))[0], f.read()))
+    return [
+        {"name": f"{model}/{prompt_name}", "model": model, "prompt": prompt_name,
+         "template": template, "template_sha": _sha(template)}
+        for model in models for prompt_name, template in templates
+    ]
+
+
+# --------------------------------------
+# Scoring
+# --------------------------------------
+def _canonical(kind, value):
+    hit = normalization.store.lookup(kind, str(value)) if value else None
+    return (hit["normalized"] if hit else " ".join(str(value or "").split())).casefold()
+
+
+def _number(value):
+    match = NUMBER.search(str(value)) if value is not None else None
+    return float(match.group()) if match else None
+
+
+def field_correct(field, expected, fields):
+    if field == "product_name":
+        got = fields.get("normalized_product") or fields.get("product_name")
+        return _canonical("product", got) == _canonical("product", expected)
+    if field == "location":
+        return _canonical("location", fields.get("location")) == _canonical("location", expected)
+    if field in NUMERIC_FIELDS:
+        got = _number(fields.get(field))
+        return got is not None and got == _number(expected)
+    strip = lambda v: re.sub(r"[\s\-]", "", str(v or "")).casefold()  # noqa: E731
+    return strip(fields.get(field)) == strip(expected)
+
+
+def scored_fields(case):
+    """Labeled fields that the labeled intent requires."""
+    required = message_handler.REQUIRED_FIELDS.get(case["intent"], [])
+    return [f for f in required if f in case["fields"]]
+
+
+# --------------------------------------
+# Running
+# --------------------------------------
+def run_case(case, variant, pool):
+    message = case["message"].strip().lower()  # as handle_message does
+    start = time.perf_counter()
+    result = {"id": case["id"], "lang": case["lang"]}
+    try:
+        parsed, resp = message_handler.run_parse(
+            message, template=variant["template"], model=variant["model"], pool=pool, learn=False
+        )
+    except ValueError as e:
+        result.update(outcome="invalid_json", error=str(e))
+    except Exception as e:
+        result.update(outcome="error", error=str(e))
+    else:
+        fields = parsed.get("fields") or {}
+        result.update(
+            outcome="ok",
+            intent_ok=parsed.get("intent") == case["intent"],
+            fields={f: field_correct(f, case["fields"][f], fields) for f in scored_fields(case)},
+            prompt_tokens=resp.get("prompt_eval_count") or 0,
+            eval_tokens=resp.get("eval_count") or 0,
+            eval_duration_ms=(resp.get("eval_duration") or 0) / 1e6,
+        )
+    result["latency_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def _quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)] if ordered else None
+
+
+def _rate(hits, total):
+    return round(hits / total, 4) if total else None
+
+
+def summarize(results, corpus):
+    cases = {c["id"]: c for c in corpus}
+    ok = [r for r in results if r["outcome"] == "ok"]
+    answered = [r for r in results if r["outcome"] != "error"]
+    field_hits, field_total = defaultdict(int), defaultdict(int)
+    for r in results:
+        for field in scored_fields(cases[r["id"]]):
+            field_total[field] += 1
+            field_hits[field] += bool(r.get("fields", {}).get(field))
+    eval_tokens = sum(r["eval_tokens"] for r in ok)
+    eval_seconds = sum(r["eval_duration_ms"] for r in ok) / 1000
+    mean = lambda key: round(sum(r[key] for r in ok) / len(ok), 1) if ok else None  # noqa: E731
+    latencies = [r["latency_ms"] for r in results]
+    return {
+        "cases": len(results),
+        "errors": len(results) - len(answered),
+        "json_valid_rate": _rate(len(ok), len(answered)),
+        "intent_accuracy": _rate(sum(r["intent_ok"] for r in ok), len(results)),
+        "field_accuracy": _rate(sum(field_hits.values()), sum(field_total.values())),
+        "per_field": {f: _rate(field_hits[f], field_total[f]) for f in sorted(field_total)},
+        "latency_p50_ms": round(_quantile(latencies, 0.5), 1) if latencies else None,
+        "latency_p95_ms": round(_quantile(latencies, 0.95), 1) if latencies else None,
+        "prompt_tokens_mean": mean("prompt_tokens"),
+        "eval_tokens_mean": mean("eval_tokens"),
+        "eval_duration_mean_ms": mean("eval_duration_ms"),
+        "tokens_per_sec": round(eval_tokens / eval_seconds, 1) if eval_seconds else None,
+    }
+
+
+def run_variant(variant, corpus, pool, concurrency, repeat):
+    work = [case for _ in range(repeat) for case in corpus]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda case: run_case(case, variant, pool), work))
+    summary = summarize(results, corpus)
+    summary["wall_sec"] = round(time.perf_counter() - start, 2)
+    summary["per_language"] = {
+        lang: summarize([r for r in results if r["lang"] == lang], corpus)
+        for lang in sorted({c["lang"] for c in corpus})
+    }
+    for per_lang in summary["per_language"].values():
+        per_lang.pop("per_field")
+    summary["failures"] = [
+        {k: r[k] for k in ("id", "outcome", "error", "intent_ok", "fields") if k in r}
+        for r in results
+        if r["outcome"] != "ok" or not r["intent_ok"] or not all(r["fields"].values())
+    ]
+    return summary
+
+
+# --------------------------------------
+# Stub Backends
+# --------------------------------------
+def stub_responder(corpus, invalid_rate, seed=0):
+    """Answer with each message's label; now and then reply with chatty, invalid JSON."""
+    labels = {c["message"].strip().lower(): c for c in corpus}
+    rng = random.Random(seed)
+
+    def respond(prompt):
+        match = stub_ollama.MESSAGE_PATTERN.search(prompt)
+        case = labels.get(match.group(1) if match else prompt)
+        reply = {"intent": case["intent"], "fields": dict(case["fields"])} if case else {"intent": None, "fields": {}}
+        if rng.random() < invalid_rate:
+            return "Sure! Here is the JSON you asked for: " + json.dumps(reply)
+        return reply
+
+    return respond
+
+
+def start_stubs(corpus, count, latency, invalid_rate):
+    responder = stub_responder(corpus, invalid_rate)
+    servers = [stub_ollama.serve(0, latency=latency, jitter=latency / 4, responder=responder) for _ in range(count)]
+    return [f"http://127.0.0.1:{server.server_port}" for server in servers]
+
+
+# --------------------------------------
+# Reporting
+# --------------------------------------
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(report):
+    print(f"{'variant':<28}{'json ok':>8}{'intent':>8}{'fields':>8}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'prompt tok':>11}{'eval tok':>9}{'tok/s':>8}")
+    for name, s in report["variants"].items():
+        print(f"{name:<28}{s['json_valid_rate'] or 0:>8.2%}{s['intent_accuracy'] or 0:>8.2%}"
+              f"{s['field_accuracy'] or 0:>8.2%}{s['latency_p50_ms'] or 0:>9.0f}{s['latency_p95_ms'] or 0:>9.0f}"
+              f"{s['prompt_tokens_mean'] or 0:>11.0f}{s['eval_tokens_mean'] or 0:>9.0f}{s['tokens_per_sec'] or 0:>8.1f}")
+        for lang, per_lang in s["per_language"].items():
+            print(f"  {lang:<26}{per_lang['json_valid_rate'] or 0:>8.2%}{per_lang['intent_accuracy'] or 0:>8.2%}"
+                  f"{per_lang['field_accuracy'] or 0:>8.2%}")
+
+
+def compare(report, baseline, max_accuracy_drop=None, max_latency_increase=None):
+    """Print per-metric deltas against `baseline`; return the list of regressions over the limits."""
+    if report["run"]["corpus_sha"] != baseline["run"]["corpus_sha"]:
+        print("WARNING: the corpus changed since the baseline; accuracy is not directly comparable")
+    regressions = []
+    for name, s in report["variants"].items():
+        before = baseline["variants"].get(name)
+        if before is None:
+            print(f"{name}: not in baseline")
+            continue
+        if before.get("template_sha") != s.get("template_sha"):
+            print(f"{name}: prompt template changed ({before.get('template_sha')} -> {s.get('template_sha')})")
+        print(f"{name}:")
+        for metric, higher_is_better in COMPARED.items():
+            old, new = before.get(metric), s.get(metric)
+            if old is None or new is None:
+                continue
+            delta = new - old
+            better = delta > 0 if higher_is_better else delta < 0
+            print(f"  {metric:<24}{old:>10}{new:>10}  {'+' if delta >= 0 else ''}{round(delta, 4)}"
+                  f"{'' if not delta else ('  better' if better else '  worse')}")
+            if (max_accuracy_drop is not None and metric.endswith(("accuracy", "rate"))
+                    and -delta > max_accuracy_drop):
+                regressions.append(f"{name} {metric} dropped by {-delta:.2%}")
+            if (max_latency_increase is not None and metric == "latency_p95_ms" and old
+                    and delta / old > max_latency_increase):
+                regressions.append(f"{name} p95 latency up {delta / old:.0%}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", action="append", default=[], help="Repeat to compare models.")
+    parser.add_argument("--prompt", action="append", default=[],
+                        help="Prompt template file to run besides the current PROMPT_TEMPLATE; repeatable.")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--hosts", default=",".join(OLLAMA_HOSTS), help="Comma-separated Ollama endpoints.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Most calls in flight at once.")
+    parser.add_argument("--repeat", type=int, default=1, help="Run the corpus this many times per variant.")
+    parser.add_argument("--out", default=None, help="Report path (default results/parse-<time>.json).")
+    parser.add_argument("--compare", default=None, help="Earlier report to diff against.")
+    parser.add_argument("--max-accuracy-drop", type=float, default=None, help="e.g. 0.02; exit 1 beyond it.")
+    parser.add_argument("--max-latency-increase", type=float, default=None, help="e.g. 0.2 for +20%% p95.")
+    parser.add_argument("--stub", action="store_true", help="Run against local stub backends.")
+    parser.add_argument("--stub-backends", type=int, default=2)
+    parser.add_argument("--stub-latency", type=float, default=0.05)
+    parser.add_argument("--stub-invalid-rate", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    corpus = load_corpus(args.corpus)
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus_sha = _sha(f.read())
+    hosts = (start_stubs(corpus, args.stub_backends, args.stub_latency, args.stub_invalid_rate)
+             if args.stub else [h.strip() for h in args.hosts.split(",") if h.strip()])
+    # No hedging: duplicate calls would skew the latency and token numbers.
+    pool = BackendPool(hosts, hedge=False, health_interval=0)
+    for backend in pool.backends:
+        backend.client()  # keep the ollama import out of the first latency sample
+
+    report = {
+        "run": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "corpus_sha": corpus_sha,
+            "cases": len(corpus),
+            "repeat": args.repeat,
+            "concurrency": args.concurrency,
+            "stub": args.stub,
+            "hosts": hosts,
+        },
+        "variants": {},
+    }
+    for variant in load_variants(args.model or [message_handler.LLM_MODEL], args.prompt):
+        print(f"Running {variant['name']} on {len(corpus) * args.repeat} messages...", flush=True)
+        summary = run_variant(variant, corpus, pool, args.concurrency, args.repeat)
+        report["variants"][variant["name"]] = {
+            "model": variant["model"], "prompt": variant["prompt"], "template_sha": variant["template_sha"],
+            **summary,
+        }
+
+    out = args.out or os.path.join(RESULTS_DIR, f"parse-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print_summary(report)
+    print(f"Report written to {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.max_accuracy_drop, args.max_latency_increase)
+        for regression in regressions:
+            print(f"FAIL: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+"""
+Production gunicorn settings. The app is imported once in the master
+(preload_app) and forked into gevent workers; anything holding sockets or
+threads is (re)created per worker in post_fork.
+"""
+import os
+
+# Patch before the app is preloaded so locks and queues created at import
+# time are gevent-aware in the workers.
+from gevent import monkey
+monkey.patch_all()
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8001")
+worker_class = "gevent"
+workers = int(os.getenv("GUNICORN_WORKERS", "5"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    # Counters left over from a previous run would otherwise be summed in.
+    metrics_dir = os.getenv("METRICS_DIR")
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            os.unlink(os.path.join(metrics_dir, name))
+
+
+def post_fork(server, worker):
+    from llm_service import logging_config, ollama_pool, redis_client
+    logging_config.restart_after_fork()
+    # get_redis() and get_pool() also check the pid, this just drops the
+    # inherited connections early.
+    redis_client._client = None
+    redis_client._near = None
+    ollama_pool._pool = None
@@ -0,0 +1,144 @@
+import os
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+
+import redis
+
+from .idempotency import TransientReply
+from .redis_client import get_redis, get_user_state
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Admission Control Configuration
+# --------------------------------------
+# Per-phone token bucket: a burst of PHONE_BUCKET_CAPACITY messages, then
+# PHONE_BUCKET_REFILL_PER_SEC sustained (0.2/s = one message every 5 seconds).
+PHONE_BUCKET_CAPACITY = int(os.getenv("PHONE_BUCKET_CAPACITY", "5"))
+PHONE_BUCKET_REFILL_PER_SEC = float(os.getenv("PHONE_BUCKET_REFILL_PER_SEC", "0.2"))
+
+# Fleet-wide budget of concurrent LLM calls, shared by every gunicorn worker.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# How long a caller may queue for a slot before being shed.
+LLM_SLOT_WAIT_SEC = float(os.getenv("LLM_SLOT_WAIT_SEC", "2"))
+# Slots held longer than this are reclaimed (e.g. the worker holding it died).
+LLM_SLOT_LEASE_SEC = int(os.getenv("LLM_SLOT_LEASE_SEC", "120"))
+
+LLM_SLOTS_KEY = "admission:llm_slots"
+
+
+def bucket_key(phone):
+    # Hash-tagged like the conversation keys, so it shares the phone's slot.
+    return f"admission:bucket:{{{phone}}}"
+
+# Shedding is temporary, so a redelivery of the message is admitted afresh.
+BUSY_MSG = TransientReply("⏳ We're very busy right now. Please try again in a minute.")
+
+# Answers to a pending confirmation never reach the LLM and are never shed.
+# Parses served from the parse cache skip admission control as well.
+PRIORITY_MESSAGES = {"yes", "no"}
+
+# --------------------------------------
+# Lua Scripts
+# --------------------------------------
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+  tokens = capacity
+  ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return allowed
+"""
+
+ACQUIRE_SLOT_LUA = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+  redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[4])
+  return 1
+end
+return 0
+"""
+
+_scripts = {}
+
+
+def _script(source, key):
+    # Script objects are bound to a client; clients are per process and, when
+    # sharded, per shard.
+    client = get_redis(key)
+    script = _scripts.get((source, id(client)))
+    if script is None or script.registered_client is not client:
+        script = _scripts[(source, id(client))] = client.register_script(source)
+    return script
+
+
+def is_priority(phone, message):
+    # Without a pending confirmation "yes" goes to the LLM like any other text.
+    return message in PRIORITY_MESSAGES and bool(get_user_state(phone).get("awaiting_confirmation"))
+
+
+def allow_phone(phone):
+    """Take one token from the phone's bucket. Fails open if Redis is down."""
+    try:
+        allowed = _script(TOKEN_BUCKET_LUA, bucket_key(phone))(
+            keys=[bucket_key(phone)],
+            args=[PHONE_BUCKET_CAPACITY, PHONE_BUCKET_REFILL_PER_SEC, time.time()]
+        )
+    except redis.RedisError:
+        logger.warning("Token bucket unavailable, admitting %s", phone)
+        return True
+
+    if not allowed:
+        logger.warning("Rate limit exceeded for %s, shedding message", phone)
+    return bool(allowed)
+
+
+@contextmanager
+def llm_slot():
+    """
+    Hold one of the LLM_MAX_CONCURRENCY fleet-wide LLM slots for the duration
+    of the block. Yields False if no slot freed up within LLM_SLOT_WAIT_SEC.
+    """
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + LLM_SLOT_WAIT_SEC
+    acquired = False
+    try:
+        while True:
+            acquired = bool(_script(ACQUIRE_SLOT_LUA, LLM_SLOTS_KEY)(
+                keys=[LLM_SLOTS_KEY],
+                args=[time.time(), LLM_MAX_CONCURRENCY, LLM_SLOT_LEASE_SEC, token]
+            ))
+            if acquired or time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+    except redis.RedisError:
+        logger.warning("LLM slot budget unavailable, admitting request")
+        yield True
+        return
+
+    if not acquired:
+        logger.warning("LLM concurrency budget exhausted, shedding request")
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                get_redis(LLM_SLOTS_KEY).zrem(LLM_SLOTS_KEY, token)
+            except redis.RedisError:
+                logger.warning("Failed to release LLM slot; it will expire with its lease")
@@ -1,36 +1,38 @@
 import os
 import logging
-import json
 from flask import Flask, request, jsonify
 from datetime import datetime, timezone
 from llm_service.flask_config import Config
-import ollama
+from llm_service import idempotency, metrics, normalization, ollama_pool
+from llm_service.logging_config import configure_logging
 
-from llm_service.message_handler import handle_message  # <-- import your handler
+from llm_service.message_handler import handle_message, parse_message, notify_user  # <-- import your handler
 from llm_service.redis_client import get_history, clear_history, clear_user_state
 
 # --------------------------------------
 # Setup Logging
 # --------------------------------------
 LOG_FILE = "llm_service.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler(LOG_FILE), logging.StreamHandler()]
-)
 logger = logging.getLogger(__name__)
 
+EMPTY_TWIML = """<?xml version="1.0" encoding="UTF-8"?>
+<Response></Response>
+"""
 
 # --------------------------------------
 # Flask App Factory
 # --------------------------------------
 def create_app():
+    configure_logging(os.getenv("LOG_FILE", LOG_FILE), "llm_service")
     app = Flask(__name__)
     app.config.from_object(Config)
+    metrics.init_app(app)
+    normalization.init_app(app)
+    ollama_pool.init_app(app)
 
     @app.route("/health", methods=["GET"])
     def health_check():
-        logger.info("Health check accessed")
+        logger.info("Health check accessed", extra={"sampled": True})
         return {
             "status": "ok",
             "service": "llm_service",
@@ -44,13 +46,8 @@ def create_app():
         if not msg:
             return jsonify({"error": "No message provided"}), 400
 
-        prompt = PROMPT_TEMPLATE.format(message=msg)
-        logger.info("LLM prompt sent for parsing")
         try:
-            resp = ollama.chat(model="mistral", messages=[{"role": "user", "content": prompt}])
-            raw = resp["message"]["content"]
-            logger.info(f"LLM raw response: {raw}")
-            parsed = json.loads(raw)
+            parsed = parse_message(msg)
             return jsonify(parsed), 200
         except Exception as e:
             logger.exception("LLM parsing failed")
@@ -62,15 +59,26 @@ def create_app():
             incoming = request.form
             phone = incoming.get("From", "").split(":")[-1]
             message = incoming.get("Body", "").strip()
-            logger.info(f"Incoming WhatsApp message from {phone}: '{message}'")
+            logger.info("Incoming WhatsApp message from %s: '%s'", phone, message)
 
             if not phone or not message:
                 logger.warning("Missing phone or message in request")
                 return "Missing phone or message", 400
 
-            # Delegate to your message handler
-            response = handle_message(phone, message)
-            logger.info(f"Response to {phone}: '{response}'")
+            # Twilio retries slow deliveries with the same MessageSid; those
+            # get the first delivery's reply instead of a second LLM call.
+            sid = incoming.get("MessageSid")
+            try:
+                response = idempotency.run_once(sid, lambda: handle_message(phone, message, message_sid=sid),
+                                                deliver_late=lambda reply: notify_user(phone, reply))
+            except idempotency.StillProcessing:
+                response = idempotency.hand_off(sid)
+                if response is None:
+                    # The first delivery sends its reply with notify_user when it finishes.
+                    metrics.WEBHOOK_DUPLICATES.inc("in_flight")
+                    logger.info("Delivery %s is still being processed, acknowledging retry", sid)
+                    return EMPTY_TWIML, 200, {'Content-Type': 'application/xml'}
+            logger.info("Response to %s: '%s'", phone, response)
 
             return f"""<?xml version="1.0" encoding="UTF-8"?>
 <Response>
@@ -85,7 +93,7 @@ def create_app():
     @app.route("/history/<phone>", methods=["GET"])
     def view_history(phone):
         try:
-            logger.info(f"History requested for {phone}")
+            logger.info("History requested for %s", phone)
             return jsonify({"phone": phone, "messages": get_history(phone)}), 200
         except Exception as e:
             logger.exception("Error retrieving history")
@@ -96,7 +104,7 @@ def create_app():
         try:
             clear_user_state(phone)
             clear_history(phone)
-            logger.info(f"State and history reset for {phone}")
+            logger.info("State and history reset for %s", phone)
             return jsonify({"status": "reset", "phone": phone}), 200
         except Exception as e:
             logger.exception("Error resetting user state")
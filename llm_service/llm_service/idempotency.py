@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import uuid
+import logging
+
+import redis
+
+from . import metrics
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Webhook Deduplication Configuration
+# --------------------------------------
+# Twilio gives up on a webhook after 15 seconds and retries it with the same
+# MessageSid. The first delivery claims the sid; retries wait for or replay
+# its reply instead of running the handler (and the LLM) again.
+#
+# The claim must outlive the slowest handler run, LLM call included.
+WEBHOOK_CLAIM_TTL_SEC = int(os.getenv("WEBHOOK_CLAIM_TTL_SEC", "300"))
+WEBHOOK_RESULT_TTL_SEC = int(os.getenv("WEBHOOK_RESULT_TTL_SEC", "86400"))
+# How long a retry waits for the first delivery to finish; below Twilio's timeout.
+WEBHOOK_WAIT_SEC = float(os.getenv("WEBHOOK_WAIT_SEC", "10"))
+
+POLL_MIN_SEC = 0.05
+POLL_MAX_SEC = 0.5
+
+
+def message_key(sid):
+    return f"webhook:{{{sid}}}"
+
+
+def unanswered_key(sid):
+    """Set when a retry was acknowledged without the reply; same slot as message_key."""
+    return f"webhook:{{{sid}}}:unanswered"
+
+
+class StillProcessing(Exception):
+    """The first delivery of this message has not finished within WEBHOOK_WAIT_SEC."""
+
+
+class TransientReply(str):
+    """
+    A reply to a failure that may pass ("busy", "try again"). It is sent but
+    not kept, so a retry of the message runs the handler again.
+    """
+
+
+def _release(key, token):
+    try:
+        client = get_redis(key)
+        state = client.get(key)
+        if state and json.loads(state).get("token") == token:
+            client.delete(key)
+    except redis.RedisError:
+        logger.warning("Failed to release webhook claim %s; it expires with its TTL", key)
+
+
+def _wait_for_reply(key):
+    """Return the stored reply, None if the claim vanished, or raise StillProcessing."""
+    deadline = time.monotonic() + WEBHOOK_WAIT_SEC
+    delay = POLL_MIN_SEC
+    while True:
+        state = get_redis(key).get(key)
+        if state is None:
+            return None
+        state = json.loads(state)
+        if state["state"] == "done":
+            return state["reply"]
+        if time.monotonic() >= deadline:
+            raise StillProcessing(key)
+        time.sleep(delay)
+        delay = min(delay * 2, POLL_MAX_SEC)
+
+
+def hand_off(sid):
+    """
+    Called when a retry gives up waiting (StillProcessing) and is about to
+    be acknowledged without a reply; by then Twilio has dropped the first
+    delivery's response too. Marks the message unanswered so the first
+    delivery sends its reply out of band, and returns None. If the first
+    delivery finished in the meantime, returns its reply for the retry to
+    answer with instead. Exactly one of the two takes the marker back.
+    """
+    key, marker = message_key(sid), unanswered_key(sid)
+    try:
+        client = get_redis(key)
+        client.set(marker, "1", ex=WEBHOOK_CLAIM_TTL_SEC)
+        state = client.get(key)
+        if state is not None and json.loads(state)["state"] == "done" and client.delete(marker):
+            return json.loads(state)["reply"]
+    except redis.RedisError:
+        logger.warning("Failed to hand off reply for %s", sid)
+    return None
+
+
+def _deliver_late(sid, reply, deliver):
+    try:
+        if not get_redis(unanswered_key(sid)).delete(unanswered_key(sid)):
+            return
+    except redis.RedisError:
+        logger.warning("Could not check whether %s was answered; not sending it again", sid)
+        return
+    logger.info("Retry of %s was answered empty, sending the reply separately", sid)
+    metrics.WEBHOOK_DUPLICATES.inc("delivered_late")
+    deliver(reply)
+
+
+def run_once(sid, handler, deliver_late=None):
+    """
+    Return handler()'s reply for the message `sid`, running it at most once
+    per sid while the reply is kept. A TransientReply is not kept, so the
+    next delivery runs handler() again. A duplicate that arrives while the
+    first delivery is running waits for its reply; StillProcessing is raised
+    if it does not come in time. If such a retry was then handed off
+    (hand_off), the reply is also passed to deliver_late(). Without a sid, or
+    with Redis down, handler() just runs.
+    """
+    if not sid:
+        return handler()
+
+    key = message_key(sid)
+    token = uuid.uuid4().hex
+    for _ in range(2):
+        try:
+            claimed = get_redis(key).set(key, json.dumps({"state": "pending", "token": token}),
+                                         nx=True, ex=WEBHOOK_CLAIM_TTL_SEC)
+            if claimed:
+                break
+            reply = _wait_for_reply(key)
+        except redis.RedisError:
+            logger.warning("Webhook deduplication unavailable, processing %s", sid)
+            return handler()
+        if reply is not None:
+            logger.info("Replaying stored reply for duplicate delivery of %s", sid)
+            metrics.WEBHOOK_DUPLICATES.inc("replayed")
+            return reply
+        # The first delivery failed and released its claim: take over.
+    else:
+        return handler()
+
+    try:
+        reply = handler()
+    except Exception:
+        _release(key, token)
+        raise
+    if isinstance(reply, TransientReply):
+        _release(key, token)
+    else:
+        try:
+            get_redis(key).set(key, json.dumps({"state": "done", "reply": reply}), ex=WEBHOOK_RESULT_TTL_SEC)
+        except redis.RedisError:
+            logger.warning("Failed to store reply for %s; a retry would run again", sid)
+            return reply
+    # Only after the reply is stored, so a concurrent hand_off() either sees
+    # it or leaves the marker for this check.
+    if deliver_late is not None:
+        _deliver_late(sid, reply, deliver_late)
+    return reply
@@ -0,0 +1,139 @@
+import os
+import re
+import json
+import queue
+import atexit
+import logging
+import itertools
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Kept identical in llm_service and marketplace_service, which are built and
+# deployed as separate packages; change both copies together.
+
+# --------------------------------------
+# Logging Configuration
+# --------------------------------------
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Keep 1 in N debug records and 1 in N records marked extra={"sampled": True}
+# (health checks and other high-volume, low-value lines).
+LOG_DEBUG_SAMPLE_EVERY = int(os.getenv("LOG_DEBUG_SAMPLE_EVERY", "10"))
+LOG_SAMPLED_EVERY = int(os.getenv("LOG_SAMPLED_EVERY", "100"))
+
+# The phones the services log: E.164 as Twilio sends it ("+263771234567",
+# also inside "whatsapp:+263..." and "user:{+263...}") and the marketplace's
+# 263XXXXXXXXX. Other long numbers (amounts, references) are left alone.
+PHONE_PATTERN = re.compile(r"(?<![\w+])(?:\+\d{9,15}|263\d{9})(?!\d)")
+
+_listener = None
+_queue_handler = None
+
+
+def redact(text):
+    """Mask phone numbers, keeping the last three digits for correlation."""
+    return PHONE_PATTERN.sub(lambda m: "***" + m.group()[-3:], text)
+
+
+class SamplingFilter(logging.Filter):
+    """Deterministic 1-in-N sampling; runs on the request path so it stays cheap."""
+
+    def __init__(self, debug_every, sampled_every):
+        super().__init__()
+        self.debug_every = max(debug_every, 1)
+        self.sampled_every = max(sampled_every, 1)
+        self._debug_seen = itertools.count()
+        self._sampled_seen = itertools.count()
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG:
+            return next(self._debug_seen) % self.debug_every == 0
+        if getattr(record, "sampled", False):
+            return next(self._sampled_seen) % self.sampled_every == 0
+        return True
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler that enqueues the record untouched. The stock handler formats
+    the message on the caller's thread; here %-interpolation, redaction and
+    JSON encoding all happen on the listener thread.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Dropping a log line is better than blocking a request on disk I/O.
+            pass
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "msg": redact(record.getMessage()),
+        }
+        if record.exc_info:
+            entry["exc"] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(log_file, service):
+    """
+    Route all logging through an in-memory queue drained by a background
+    writer thread. Safe to call more than once; only the first call applies.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter(service)
+    file_handler = RotatingFileHandler(log_file, maxBytes=5*1024*1024, backupCount=3)
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler = LazyQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter(LOG_DEBUG_SAMPLE_EVERY, LOG_SAMPLED_EVERY))
+
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def restart_after_fork():
+    """The writer thread does not survive fork(); give the child a fresh one."""
+    global _listener
+    if _listener is None:
+        return
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler.queue = log_queue
+    _listener = QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Drain the queue, stop the writer thread and detach from the root logger."""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
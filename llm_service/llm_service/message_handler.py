@@ -1,17 +1,26 @@
 import requests
 import os
 import json
+import time
 import logging
+import redis
 from .redis_client import (
     get_user_state,
     set_user_state,
     clear_user_state,
-    add_to_history
+    add_to_history,
+    get_cached_parse,
+    cache_parse
 )
+from . import admission, metrics, normalization, ollama_pool
+from .idempotency import TransientReply
 
 logger = logging.getLogger(__name__)
 
-LLM_SERVICE_URL = os.getenv("LLM_SERVICE_URL", "http://127.0.0.1:11434/api/chat")
+# Leave unset to parse in-process through the Ollama pool; set it to hand
+# parsing to another llm_service's /parse endpoint instead.
+LLM_SERVICE_URL = os.getenv("LLM_SERVICE_URL", "")
+LLM_MODEL = os.getenv("LLM_MODEL", "mistral")
 LISTINGS_API_URL = os.getenv("LISTINGS_API_URL", "http://marketplace_api:5000/listings")
 REGISTER_API_URL = os.getenv("REGISTER_API_URL", "http://marketplace_api:5000/register")
 REVIEW_API_URL = os.getenv("REVIEW_API_URL", "http://marketplace_api:5000")
@@ -27,31 +36,128 @@ You are a helpful assistant for a rural WhatsApp marketplace.
 When a user sends a message, your job is to:
 1. Determine the intent. One of: [register, sell, buy, review, product_info]
 2. Extract any relevant fields from the message.
-3. Normalize the location into a district format (e.g., “Gweru” → “Gweru Urban”).
-4. Normalize the product name for matching (e.g., “broilers” → “chickens”).
-5. Classify the product into a category (e.g., “chickens” → “livestock”).
+{normalization_steps}
 
 Respond with valid JSON exactly like this:
 
-{
+{{
   "intent": "<intent>",
-  "fields": {
+  "fields": {{
     "product_name": "...",
     "normalized_product": "...",
     "category": "...",
     "location": "...",
+    "raw_location": "...",
     // plus other fields as needed
-  }
-}
+  }}
+}}
 
 User message: "{message}"
 """
 
-# --------------------------------------
-# Ollama Configuration
-# --------------------------------------
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434/api/chat")
-ollama.base_url = OLLAMA_HOST
+# Normalization steps, dropped from the prompt for terms the store already knows.
+LOCATION_STEP = (
+    "Normalize the location into a district format (e.g., “Gweru” → “Gweru Urban”) "
+    "and copy the location exactly as written into raw_location."
+)
+PRODUCT_STEPS = (
+    "Normalize the product name for matching (e.g., “broilers” → “chickens”).",
+    "Classify the product into a category (e.g., “chickens” → “livestock”).",
+)
+QUANTITY_STEP = (
+    "Also give any quantity as quantity_amount (a number) and quantity_unit, one of: {units} "
+    "(e.g., “2 tonnes” → 2 and “tonne”; “5 goats” → 5 and “each”). For a buyer's limits "
+    "(e.g., “under $30, at least 5”) add max_price, min_price, min_quantity or max_quantity as numbers."
+)
+
+# Optional buyer limits passed through to the marketplace search.
+SEARCH_FILTERS = ("min_price", "max_price", "min_quantity", "max_quantity")
+
+
+def build_prompt(message, template=PROMPT_TEMPLATE):
+    """
+    Return (prompt, known terms). Terms found in the normalization store are
+    handed to the LLM as facts instead of asking it to normalize them.
+    """
+    known = normalization.store.scan(message)
+    steps = []
+    if "location" in known:
+        raw, hit = known["location"]
+        steps.append(f"The location “{raw}” is the district “{hit['normalized']}”; use that as location.")
+    else:
+        steps.append(LOCATION_STEP)
+    if "product" in known:
+        raw, hit = known["product"]
+        steps.append(
+            f"The product “{raw}” normalizes to “{hit['normalized']}”"
+            + (f" in category “{hit['category']}”" if hit.get("category") else "")
+            + "; use those values."
+        )
+    else:
+        steps.extend(PRODUCT_STEPS)
+    unit_codes = normalization.units.codes()
+    if unit_codes:
+        steps.append(QUANTITY_STEP.format(units=", ".join(unit_codes)))
+    numbered = "\n".join(f"{i}. {step}" for i, step in enumerate(steps, start=3))
+    return template.format(normalization_steps=numbered, message=message), known
+
+
+def run_parse(message, template=PROMPT_TEMPLATE, model=LLM_MODEL, pool=None, learn=True):
+    """
+    Parse `message` into {"intent", "fields"} with the LLM and normalize the
+    fields. Returns (parsed, Ollama response); raises ValueError when the
+    reply is not a JSON object. The benchmarks pass their own template,
+    model and pool, and learn=False so they never teach the store.
+    """
+    prompt, known = build_prompt(message, template)
+    logger.info("LLM prompt sent for parsing (%s known terms)", len(known))
+    start = time.perf_counter()
+    resp = (pool or ollama_pool.get_pool()).chat(model, [{"role": "user", "content": prompt}])
+    metrics.observe_llm(model, time.perf_counter() - start, resp)
+    raw = resp["message"]["content"]
+    logger.debug("LLM raw response: %s", raw)
+    parsed = json.loads(raw)
+    if not isinstance(parsed, dict):
+        raise ValueError("LLM reply is not a JSON object")
+
+    # Learn mappings for new vocabulary, then make known terms win over
+    # whatever the LLM produced for them.
+    fields = parsed.get("fields") or {}
+    raw_location = fields.pop("raw_location", None)
+    if learn:
+        normalization.learn_from_fields(fields, raw_location, skip=known)
+    normalization.normalize_fields(fields)
+    return parsed, resp
+
+
+def parse_message(message):
+    """Parse `message` into {"intent", "fields"} with the LLM, then normalize the fields."""
+    return run_parse(message)[0]
+
+
+def _answer_from_store(state, message):
+    """
+    Answer a follow-up question ("Can you tell me your location?") from the
+    normalization store when the reply is a known term, without the LLM.
+    A full message is only known word for word, through the parse cache.
+    """
+    intent = state.get("intent")
+    if not intent or state.get("awaiting_confirmation"):
+        return None
+    fields = state.get("fields", {})
+    missing = [f for f in REQUIRED_FIELDS.get(intent, []) if f not in fields]
+    if not missing:
+        return None
+
+    if missing[0] == "location" and normalization.store.lookup("location", message):
+        answer = {"location": message}
+    elif missing[0] == "product_name" and normalization.store.lookup("product", message):
+        answer = {"product_name": message}
+    else:
+        return None
+    normalization.normalize_fields(answer)
+    logger.info("Answered %s follow-up from the normalization store", missing[0])
+    return {"intent": intent, "fields": answer}
 
 
 # Required fields per intent
@@ -76,13 +182,13 @@ def notify_user(phone, message):
             }
         )
         res.raise_for_status()
-        logger.info(f"Broadcasted WhatsApp message to {phone}")
+        logger.info("Broadcasted WhatsApp message to %s", phone)
     except Exception as e:
-        logger.error(f"Failed to notify {phone}: {str(e)}")
+        logger.error("Failed to notify %s: %s", phone, e)
 
-def handle_message(phone, message):
+def handle_message(phone, message, message_sid=None):
     message = message.strip().lower()
-    logger.info(f"Message from {phone}: {message}")
+    logger.info("Message from %s: %s", phone, message)
     add_to_history(phone, "user", message)
 
     # Step 1: YES/NO confirmation
@@ -94,15 +200,21 @@ def handle_message(phone, message):
 
             try:
                 if intent == "sell":
+                    # Listings are stored under the normalized name and district
+                    # so buyers find them whatever language the seller used.
+                    normalization.normalize_fields(fields)
                     payload = {
                         "phone": phone,
-                        "product_name": fields["product_name"],
+                        "product_name": fields.get("normalized_product") or fields["product_name"],
                         "quantity": fields["quantity"],
                         "price": fields["price"],
                         "location": fields["location"],
                         "category": fields["category"],
                         "description": fields.get("description", "")
                     }
+                    if fields.get("quantity_unit"):
+                        payload["quantity_amount"] = fields["quantity_amount"]
+                        payload["quantity_unit"] = fields["quantity_unit"]
                     url = LISTINGS_API_URL
 
                 elif intent == "register":
@@ -126,11 +238,15 @@ def handle_message(phone, message):
                     url = f"{REVIEW_API_URL}/review/{phone}"
 
                 else:
-                    logger.warning(f"Unsupported intent for confirmation: {intent}")
+                    logger.warning("Unsupported intent for confirmation: %s", intent)
                     return "❌ Sorry, I can’t confirm this action."
 
-                logger.info(f"Posting {intent} for {phone}: {payload}")
-                res = requests.post(url, json=payload)
+                logger.info("Posting %s for %s", intent, phone)
+                logger.debug("Payload for %s: %s", phone, payload)
+                # Keyed on the WhatsApp message, so a redelivered "yes" can
+                # never create the listing or registration twice.
+                headers = {"Idempotency-Key": f"whatsapp:{message_sid}"} if message_sid else {}
+                res = requests.post(url, json=payload, headers=headers)
                 res.raise_for_status()
 
                 clear_user_state(phone)
@@ -139,8 +255,8 @@ def handle_message(phone, message):
                 return success_msg
 
             except Exception as e:
-                logger.exception(f"Error posting {intent} for {phone}")
-                error_msg = f"⚠️ Something went wrong posting your {intent}. Try again later."
+                logger.exception("Error posting %s for %s", intent, phone)
+                error_msg = TransientReply(f"⚠️ Something went wrong posting your {intent}. Try again later.")
                 add_to_history(phone, "bot", error_msg)
                 return error_msg
 
@@ -150,17 +266,52 @@ def handle_message(phone, message):
         add_to_history(phone, "bot", cancel_msg)
         return cancel_msg
 
+    # Follow-up answers that are known terms ("Gweru", "huku") skip the LLM.
+    try:
+        result = _answer_from_store(get_user_state(phone), message)
+    except Exception:
+        logger.exception("Normalization store lookup failed for %s", phone)
+        result = None
+
+    # A message seen before word for word reuses its parse.
+    if result is None:
+        try:
+            result = get_cached_parse(message)
+        except redis.RedisError:
+            logger.warning("Parse cache unavailable for %s", phone)
+
+    # Admission control: answers served without the LLM are never shed,
+    # everything below may hit the LLM and is subject to per-phone and
+    # fleet-wide limits.
+    if result is None and not admission.is_priority(phone, message) and not admission.allow_phone(phone):
+        add_to_history(phone, "bot", admission.BUSY_MSG)
+        return admission.BUSY_MSG
+
     # Step 2: Send message to LLM
     try:
-        res = requests.post(LLM_SERVICE_URL, json={"phone": phone, "message": message})
-        res.raise_for_status()
-        result = res.json()
+        if result is None:
+            with admission.llm_slot() as acquired:
+                if not acquired:
+                    add_to_history(phone, "bot", admission.BUSY_MSG)
+                    return admission.BUSY_MSG
+                if LLM_SERVICE_URL:
+                    # The remote service records its own LLM metrics.
+                    res = requests.post(LLM_SERVICE_URL, json={"phone": phone, "message": message})
+                    res.raise_for_status()
+                    result = res.json()
+                else:
+                    result = parse_message(message)
+            if result.get("intent"):
+                try:
+                    cache_parse(message, result)
+                except redis.RedisError:
+                    logger.warning("Failed to cache parse for %s", phone)
 
         intent = result.get("intent")
         fields = result.get("fields") or {}
 
         if not intent:
-            logger.warning(f"No intent detected for user {phone}")
+            logger.warning("No intent detected for user %s", phone)
             return "🤔 I couldn’t understand that. Try again?"
 
         existing = get_user_state(phone)
@@ -168,17 +319,34 @@ def handle_message(phone, message):
 
         if is_complete(intent, combined_fields):
             if intent == "buy":
-                product = combined_fields["product_name"]
+                product = combined_fields.get("normalized_product") or combined_fields["product_name"]
                 location = combined_fields["location"]
 
                 try:
                     search_url = f"{LISTINGS_API_URL}/search"
-                    res = requests.get(search_url, params={
-                        "product_name": product,
-                        "location": location
-                    })
+                    params = {"product_name": product, "location": location}
+                    params.update({f: combined_fields[f] for f in SEARCH_FILTERS
+                                   if isinstance(combined_fields.get(f), (int, float))})
+                    if "min_quantity" in params or "max_quantity" in params:
+                        # Quantity bounds mean nothing without their unit.
+                        if combined_fields.get("quantity_unit"):
+                            params["quantity_unit"] = combined_fields["quantity_unit"]
+                        else:
+                            params.pop("min_quantity", None)
+                            params.pop("max_quantity", None)
+                    res = requests.get(search_url, params=params)
                     res.raise_for_status()
                     matches = res.json().get("matches", [])
+                    if not matches:
+                        # Nothing under that exact name; match on meaning instead
+                        # ("cooking oil" -> "sunflower oil 2L").
+                        res = requests.get(f"{LISTINGS_API_URL}/semantic_search", params={
+                            "q": product,
+                            "location": location,
+                            "k": 5
+                        })
+                        res.raise_for_status()
+                        matches = res.json().get("matches", [])
 
                     if not matches:
                         no_match_msg = f"❌ No sellers currently found for {product} in {location}. We'll let you know when one is available!"
@@ -206,8 +374,9 @@ def handle_message(phone, message):
                     return buyer_msg
 
                 except Exception as e:
-                    logger.exception(f"Error finding matches for buyer {phone}")
-                    error_msg = "😓 Sorry, something went wrong while searching for sellers. Please try again later."
+                    logger.exception("Error finding matches for buyer %s", phone)
+                    error_msg = TransientReply(
+                        "😓 Sorry, something went wrong while searching for sellers. Please try again later.")
                     add_to_history(phone, "bot", error_msg)
                     return error_msg
 
@@ -243,8 +412,8 @@ def handle_message(phone, message):
             return follow_up
 
     except Exception as e:
-        logger.exception(f"LLM error for {phone}")
-        error_msg = "😓 Sorry, something went wrong. Try again in a moment."
+        logger.exception("LLM error for %s", phone)
+        error_msg = TransientReply("😓 Sorry, something went wrong. Try again in a moment.")
         add_to_history(phone, "bot", error_msg)
         return error_msg
 
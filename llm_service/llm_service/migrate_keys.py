@@ -0,0 +1,126 @@
+"""
+Re-key conversation data to the hash-tagged layout, online.
+
+    python -m llm_service.migrate_keys [--source redis://old:6379/0] [--delete-legacy] [--dry-run]
+
+Scans the source node for user:<phone>, history:<phone> and the
+normalization store keys and copies each one to its new key on whatever
+topology REDIS_MODE points at, keeping its TTL. Copies use DUMP/RESTORE
+without REPLACE, so a key that live traffic already wrote under the new name
+is never overwritten. Safe to re-run; run it while workers still have
+REDIS_LEGACY_FALLBACK=true, then turn the fallback off.
+"""
+import re
+import sys
+import logging
+import argparse
+
+import redis
+
+from .redis_client import REDIS_URL, get_redis, user_key, history_key
+
+logger = logging.getLogger(__name__)
+
+SCAN_BATCH = 500
+# Phones are taken verbatim from the webhook, e.g. "+263771..." from
+# "whatsapp:+263771...", so match anything that is not already hash-tagged.
+LEGACY_PHONE_KEY = re.compile(r"^(user|history):([^{]+)$")
+LEGACY_NORM_KEY = re.compile(r"^norm:(counts:\w+|overrides:\w+|version)$")
+
+
+def new_key(legacy):
+    match = LEGACY_PHONE_KEY.match(legacy)
+    if match:
+        kind, phone = match.groups()
+        return user_key(phone) if kind == "user" else history_key(phone)
+    match = LEGACY_NORM_KEY.match(legacy)
+    if match:
+        return f"norm:{{store}}:{match.group(1)}"
+    return None
+
+
+def _legacy_keys(source):
+    for pattern in ("user:*", "history:*", "norm:*"):
+        for key in source.scan_iter(match=pattern, count=SCAN_BATCH):
+            if new_key(key):
+                yield key
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def migrate(source, delete_legacy=False, dry_run=False):
+    """Copy every legacy key on `source` to its new name. Returns counts."""
+    counts = {"copied": 0, "skipped_existing": 0, "expired": 0}
+    for batch in _batches(_legacy_keys(source), SCAN_BATCH):
+        pipe = source.pipeline(transaction=False)
+        for key in batch:
+            pipe.dump(key)
+            pipe.pttl(key)
+        results = pipe.execute()
+
+        copied = []
+        for i, key in enumerate(batch):
+            payload, pttl = results[2 * i], results[2 * i + 1]
+            if payload is None or pttl == -2:
+                counts["expired"] += 1  # expired or deleted since the scan
+                continue
+            if dry_run:
+                counts["copied"] += 1
+                continue
+            target = new_key(key)
+            try:
+                get_redis(target).restore(target, max(pttl, 0), payload)
+                counts["copied"] += 1
+                copied.append(key)
+            except redis.ResponseError as e:
+                if "BUSYKEY" not in str(e):
+                    raise
+                # Live traffic already wrote the new key; it is newer.
+                counts["skipped_existing"] += 1
+                copied.append(key)
+
+        if delete_legacy and copied:
+            source.delete(*copied)
+        logger.info("Migrated batch of %s keys: %s", len(batch), counts)
+    return counts
+
+
+class _DecodedKeys:
+    """Source client wrapper that yields str keys while DUMP payloads stay bytes."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def scan_iter(self, **kwargs):
+        return (key.decode() for key in self._client.scan_iter(**kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--source", default=REDIS_URL, help="Node holding the legacy keys.")
+    parser.add_argument("--delete-legacy", action="store_true", help="Delete each legacy key once copied.")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    # DUMP payloads are binary, so the source client must not decode responses.
+    source = redis.StrictRedis.from_url(args.source)
+    counts = migrate(_DecodedKeys(source), delete_legacy=args.delete_legacy, dry_run=args.dry_run)
+    print(f"copied={counts['copied']} skipped_existing={counts['skipped_existing']} expired={counts['expired']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,452 @@
+import os
+import hmac
+import json
+import time
+import logging
+import threading
+from functools import wraps
+
+import redis
+import requests
+from flask import request, jsonify
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Normalization Store Configuration
+# --------------------------------------
+# A learned mapping is only served once the LLM has produced it this many
+# times, and for at least this share of all mappings seen for the raw term.
+NORM_MIN_COUNT = int(os.getenv("NORM_MIN_COUNT", "2"))
+NORM_MIN_SHARE = float(os.getenv("NORM_MIN_SHARE", "0.6"))
+# How often a worker checks norm:version for changes made by other workers.
+NORM_RELOAD_SEC = float(os.getenv("NORM_RELOAD_SEC", "30"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# The marketplace owns the quantity units table; it is fetched from there and
+# re-read this often.
+UNITS_API_URL = os.getenv("UNITS_API_URL", "http://marketplace_api:5000/units")
+UNITS_RELOAD_SEC = float(os.getenv("UNITS_RELOAD_SEC", "300"))
+
+KINDS = ("product", "location")
+# One hash tag for the whole store, so its multi-key pipelines stay on one
+# cluster slot (or shard).
+COUNTS_KEY = "norm:{{store}}:counts:{kind}"
+OVERRIDES_KEY = "norm:{{store}}:overrides:{kind}"
+VERSION_KEY = "norm:{store}:version"
+
+# Separates raw term, normalized value and category in a counts field.
+_SEP = "\t"
+
+# --------------------------------------
+# Seed Vocabulary
+# --------------------------------------
+# English, Shona and Ndebele names for what is most often traded, so common
+# messages are covered before the LLM has taught the store anything.
+SEED_PRODUCTS = {
+    "chickens": ("livestock", ["chicken", "broilers", "broiler", "layers", "road runners", "roadrunners",
+                               "huku", "inkukhu", "izinkukhu"]),
+    "cattle": ("livestock", ["cow", "cows", "bull", "bulls", "mombe", "mhou", "inkomo", "izinkomo"]),
+    "goats": ("livestock", ["goat", "mbudzi", "imbuzi", "izimbuzi"]),
+    "sheep": ("livestock", ["hwai", "imvu", "izimvu"]),
+    "pigs": ("livestock", ["pig", "piglets", "nguruve", "ingulube", "izingulube"]),
+    "eggs": ("animal products", ["egg", "mazai", "amaqanda"]),
+    "honey": ("animal products", ["uchi", "uju"]),
+    "fish": ("animal products", ["hove", "inhlanzi", "kapenta", "matemba"]),
+    "maize": ("grains", ["mealies", "corn", "chibage", "chibahwe", "umumbu", "umbila"]),
+    "sorghum": ("grains", ["mapfunde", "amabele"]),
+    "finger millet": ("grains", ["rapoko", "rukweza", "uphoko"]),
+    "rice": ("grains", ["mupunga", "irayisi"]),
+    "groundnuts": ("legumes", ["peanuts", "nzungu", "amazambane"]),
+    "round nuts": ("legumes", ["bambara nuts", "nyimo", "indlubu"]),
+    "sugar beans": ("legumes", ["beans", "bhinzi", "indumba"]),
+    "tomatoes": ("vegetables", ["tomato", "madomasi", "utamatisi"]),
+    "sweet potatoes": ("vegetables", ["mbambaira", "ubhatata"]),
+    "leafy greens": ("vegetables", ["covo", "rape", "muriwo", "imibhida"]),
+    "pumpkins": ("vegetables", ["pumpkin", "manhanga", "amathanga"]),
+    "mushrooms": ("vegetables", ["howa", "amakhowa"]),
+}
+
+SEED_LOCATIONS = {
+    "Harare Urban": ["harare", "hre"],
+    "Bulawayo": ["bulawayo", "byo", "kobulawayo", "kwabulawayo"],
+    "Gweru Urban": ["gweru", "gwelo"],
+    "Mutare Urban": ["mutare", "umtali"],
+    "Masvingo Urban": ["masvingo", "fort victoria"],
+    "Kwekwe": ["kwekwe", "que que"],
+    "Chinhoyi": ["chinhoyi", "sinoia"],
+    "Marondera": ["marondera", "marandellas"],
+    "Chitungwiza": ["chitungwiza", "chitown"],
+    "Kadoma": ["kadoma", "gatooma"],
+    "Bindura": ["bindura"],
+    "Hwange": ["hwange", "wankie"],
+    "Beitbridge": ["beitbridge"],
+    "Gwanda": ["gwanda"],
+}
+
+# Locative prefixes ("kuGweru", "muHarare", "eBulawayo", "kwaMutare") are
+# stripped only when what remains is a known location.
+LOCATIVE_PREFIXES = ("kwa", "ku", "mu", "pa", "ko", "e")
+
+
+def _clean(term):
+    return " ".join((term or "").lower().replace(",", " ").replace(".", " ").split())
+
+
+# --------------------------------------
+# Term Trie
+# --------------------------------------
+_END = object()
+
+
+class TermTrie:
+    """Token-level trie so multi-word terms ("road runners") match inside a message."""
+
+    def __init__(self, terms):
+        self.root = {}
+        for term, value in terms.items():
+            node = self.root
+            for token in term.split():
+                node = node.setdefault(token, {})
+            node[_END] = value
+
+    def find(self, text):
+        """Return [(term, value)] for the longest matches in `text`, left to right."""
+        tokens = _clean(text).split()
+        found = []
+        i = 0
+        while i < len(tokens):
+            node, match, end = self.root, None, i
+            for j in range(i, len(tokens)):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                if _END in node:
+                    match, end = node[_END], j + 1
+            if match is None:
+                i += 1
+                continue
+            found.append((" ".join(tokens[i:end]), match))
+            i = end
+        return found
+
+
+# --------------------------------------
+# Normalization Store
+# --------------------------------------
+class NormalizationStore:
+    """
+    Raw term -> normalized mapping per kind, served from memory.
+
+    Learned mappings and admin overrides live in Redis; each worker keeps a
+    snapshot and rebuilds it when norm:version moves. Lookups never touch
+    Redis, and if Redis is down the last snapshot (or the seeds) is served.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._terms, self._tries = self._build({kind: {} for kind in KINDS}, {kind: {} for kind in KINDS})
+
+    # Snapshot -----------------------------------------------------------
+    @staticmethod
+    def _seed_terms():
+        products = {}
+        for normalized, (category, variants) in SEED_PRODUCTS.items():
+            for raw in [normalized, *variants]:
+                products[_clean(raw)] = {"normalized": normalized, "category": category, "source": "seed"}
+        locations = {}
+        for district, variants in SEED_LOCATIONS.items():
+            for raw in [district, *variants]:
+                locations[_clean(raw)] = {"normalized": district, "source": "seed"}
+        return {"product": products, "location": locations}
+
+    @staticmethod
+    def _learned_terms(counts):
+        """Pick the winning mapping per raw term among those with enough support."""
+        per_raw = {}
+        for field, count in counts.items():
+            raw, normalized, category = field.split(_SEP)
+            per_raw.setdefault(raw, []).append((int(count), normalized, category))
+
+        learned = {}
+        for raw, candidates in per_raw.items():
+            total = sum(c[0] for c in candidates)
+            count, normalized, category = max(candidates)
+            if count >= NORM_MIN_COUNT and count / total >= NORM_MIN_SHARE:
+                learned[raw] = {"normalized": normalized, "category": category or None,
+                                "source": "learned", "confidence": round(count / total, 2), "count": count}
+        return learned
+
+    def _build(self, counts, overrides):
+        terms = self._seed_terms()
+        for kind in KINDS:
+            # Seeds are curated, so the LLM can extend them but not outvote them.
+            for raw, value in self._learned_terms(counts[kind]).items():
+                terms[kind].setdefault(raw, value)
+            for raw, value in overrides[kind].items():
+                terms[kind][raw] = {**json.loads(value), "source": "override"}
+        return terms, {kind: TermTrie(terms[kind]) for kind in KINDS}
+
+    def reload(self, force=False):
+        """Rebuild the snapshot if another worker changed the store."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < NORM_RELOAD_SEC:
+            return
+        if not self._lock.acquire(blocking=False):
+            return  # another thread is already reloading
+        try:
+            self._checked_at = now
+            client = get_redis(VERSION_KEY)
+            version = client.get(VERSION_KEY)
+            if version == self._version and not force:
+                return
+            pipe = client.pipeline(transaction=False)
+            for kind in KINDS:
+                pipe.hgetall(COUNTS_KEY.format(kind=kind))
+                pipe.hgetall(OVERRIDES_KEY.format(kind=kind))
+            results = pipe.execute()
+            counts = {kind: results[2 * i] for i, kind in enumerate(KINDS)}
+            overrides = {kind: results[2 * i + 1] for i, kind in enumerate(KINDS)}
+            self._terms, self._tries = self._build(counts, overrides)
+            self._version = version
+            logger.info("Normalization store reloaded at version %s", version)
+        except redis.RedisError:
+            logger.warning("Normalization store unavailable, serving last snapshot")
+        finally:
+            self._lock.release()
+
+    # Lookups ------------------------------------------------------------
+    def lookup(self, kind, raw):
+        """Return the mapping for a whole term (e.g. a field value), or None."""
+        self.reload()
+        terms = self._terms[kind]
+        term = _clean(raw)
+        if term in terms:
+            return terms[term]
+        if kind == "location":
+            for prefix in LOCATIVE_PREFIXES:
+                if term.startswith(prefix) and term[len(prefix):] in terms:
+                    return terms[term[len(prefix):]]
+        return None
+
+    def scan(self, message):
+        """Return {kind: (raw term, mapping)} for the first known term of each kind in `message`."""
+        self.reload()
+        found = {}
+        for kind in KINDS:
+            matches = self._tries[kind].find(message)
+            if not matches and kind == "location":
+                matches = [(token, hit) for token in _clean(message).split()
+                           if (hit := self.lookup(kind, token))]
+            if matches:
+                found[kind] = matches[0]
+        return found
+
+    # Learning -----------------------------------------------------------
+    def record(self, kind, raw, normalized, category=None):
+        """Count one LLM-produced mapping. Never raises: learning is best effort."""
+        raw, normalized = _clean(raw), (normalized or "").strip()
+        if not raw or not normalized or _SEP in raw + normalized + (category or ""):
+            return
+        known = self._terms[kind].get(raw)
+        if known and known["source"] in ("seed", "override"):
+            return
+        try:
+            pipe = get_redis(VERSION_KEY).pipeline(transaction=False)
+            pipe.hincrby(COUNTS_KEY.format(kind=kind), _SEP.join([raw, normalized, category or ""]), 1)
+            if known is None or known["normalized"] != normalized:
+                # Only bump the version when the served snapshot may change.
+                pipe.incr(VERSION_KEY)
+            pipe.execute()
+        except redis.RedisError:
+            logger.warning("Failed to record %s normalization for '%s'", kind, raw)
+
+    def set_override(self, kind, raw, normalized, category=None):
+        value = {"normalized": normalized}
+        if category:
+            value["category"] = category
+        pipe = get_redis(VERSION_KEY).pipeline(transaction=False)
+        pipe.hset(OVERRIDES_KEY.format(kind=kind), _clean(raw), json.dumps(value))
+        pipe.incr(VERSION_KEY)
+        pipe.execute()
+        self.reload(force=True)
+
+    def delete_override(self, kind, raw):
+        pipe = get_redis(VERSION_KEY).pipeline(transaction=False)
+        pipe.hdel(OVERRIDES_KEY.format(kind=kind), _clean(raw))
+        pipe.incr(VERSION_KEY)
+        removed = pipe.execute()[0]
+        self.reload(force=True)
+        return bool(removed)
+
+    def entries(self, kind):
+        self.reload()
+        return self._terms[kind]
+
+
+store = NormalizationStore()
+
+
+# --------------------------------------
+# Quantity Units
+# --------------------------------------
+class UnitTable:
+    """
+    The marketplace's quantity units (GET /units), so the LLM is asked for
+    the same unit codes the marketplace stores and filters on. If the
+    marketplace is unreachable the last copy is kept; with none, quantities
+    are sent as text only and the marketplace parses them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._aliases = {}
+
+    def reload(self, force=False):
+        now = time.monotonic()
+        if not force and self._checked_at is not None and now - self._checked_at < UNITS_RELOAD_SEC:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = now
+            res = requests.get(UNITS_API_URL, timeout=2)
+            res.raise_for_status()
+            aliases = {}
+            for code, unit in res.json()["units"].items():
+                for name in (code, *unit.get("aliases", [])):
+                    aliases[name.lower()] = code
+            self._aliases = aliases
+        except (requests.RequestException, ValueError, KeyError):
+            logger.warning("Units table unavailable, keeping %s known unit names", len(self._aliases))
+        finally:
+            self._lock.release()
+
+    def codes(self):
+        self.reload()
+        return sorted(set(self._aliases.values()))
+
+    def resolve(self, name):
+        """Return the unit code for a code or alias, or None."""
+        self.reload()
+        return self._aliases.get(str(name or "").strip().lower())
+
+
+units = UnitTable()
+
+
+# --------------------------------------
+# Field Helpers
+# --------------------------------------
+def normalize_fields(fields):
+    """
+    Apply known mappings to extracted fields in place and return the kinds
+    that were resolved from the store.
+    """
+    resolved = set()
+    product = store.lookup("product", fields.get("product_name")) if fields.get("product_name") else None
+    if product:
+        fields["normalized_product"] = product["normalized"]
+        if product.get("category"):
+            fields["category"] = product["category"]
+        resolved.add("product")
+    location = store.lookup("location", fields.get("location")) if fields.get("location") else None
+    if location:
+        fields["location"] = location["normalized"]
+        resolved.add("location")
+    normalize_quantity(fields)
+    return resolved
+
+
+def normalize_quantity(fields):
+    """
+    Map an extracted quantity_unit to its unit code. An unknown unit, or an
+    amount that is not a number, drops the typed quantity and leaves the
+    text `quantity` for the marketplace to parse.
+    """
+    if "quantity_unit" not in fields and "quantity_amount" not in fields:
+        return
+    code = units.resolve(fields.get("quantity_unit"))
+    try:
+        amount = float(fields.get("quantity_amount"))
+    except (TypeError, ValueError):
+        amount = None
+    if code is None or amount is None or amount < 0:
+        fields.pop("quantity_unit", None)
+        fields.pop("quantity_amount", None)
+    else:
+        fields["quantity_unit"], fields["quantity_amount"] = code, amount
+
+
+def learn_from_fields(fields, raw_location=None, skip=()):
+    """
+    Record the product and location mappings the LLM produced for a message.
+    Kinds in `skip` were given to the LLM as facts, so its answer adds nothing.
+    """
+    if "product" not in skip and fields.get("product_name") and fields.get("normalized_product"):
+        store.record("product", fields["product_name"], fields["normalized_product"], fields.get("category"))
+    if "location" not in skip and raw_location and fields.get("location"):
+        store.record("location", raw_location, fields["location"])
+
+
+# --------------------------------------
+# Admin Endpoints
+# --------------------------------------
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "Admin endpoints are disabled"}), 403
+        if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+            return jsonify({"error": "Unauthorized"}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def init_app(app):
+    @app.route("/normalization/<kind>", methods=["GET"])
+    @admin_required
+    def list_normalizations(kind):
+        if kind not in KINDS:
+            return jsonify({"error": f"kind must be one of {list(KINDS)}"}), 404
+        return jsonify({"kind": kind, "terms": store.entries(kind)}), 200
+
+    @app.route("/normalization/<kind>/<raw>", methods=["PUT"])
+    @admin_required
+    def put_override(kind, raw):
+        if kind not in KINDS:
+            return jsonify({"error": f"kind must be one of {list(KINDS)}"}), 404
+        data = request.get_json(silent=True) or {}
+        if not data.get("normalized"):
+            return jsonify({"error": "normalized is required"}), 400
+        try:
+            store.set_override(kind, raw, data["normalized"], data.get("category"))
+        except redis.RedisError:
+            logger.exception("Failed to store normalization override")
+            return jsonify({"error": "Normalization store unavailable"}), 503
+        logger.info("Normalization override set: %s '%s' -> '%s'", kind, raw, data["normalized"])
+        # Built from what was written: the snapshot is not rebuilt when another
+        # thread holds the reload lock or Redis fails right after the write.
+        override = {"normalized": data["normalized"], "source": "override"}
+        if data.get("category"):
+            override["category"] = data["category"]
+        return jsonify({"kind": kind, "raw": raw, **override}), 200
+
+    @app.route("/normalization/<kind>/<raw>", methods=["DELETE"])
+    @admin_required
+    def delete_override(kind, raw):
+        if kind not in KINDS:
+            return jsonify({"error": f"kind must be one of {list(KINDS)}"}), 404
+        try:
+            removed = store.delete_override(kind, raw)
+        except redis.RedisError:
+            logger.exception("Failed to delete normalization override")
+            return jsonify({"error": "Normalization store unavailable"}), 503
+        if not removed:
+            return jsonify({"error": "No override for that term"}), 404
+        logger.info("Normalization override removed: %s '%s'", kind, raw)
+        return jsonify({"status": "deleted"}), 200
@@ -0,0 +1,356 @@
+import os
+import time
+import queue
+import random
+import logging
+import threading
+from collections import deque
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Backend Pool Configuration
+# --------------------------------------
+# Comma-separated Ollama endpoints; CPU and GPU boxes can be mixed, routing
+# sends work to whichever has the fewest requests outstanding.
+OLLAMA_HOSTS = [h.strip() for h in os.getenv(
+    "OLLAMA_HOSTS", os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
+).split(",") if h.strip()]
+OLLAMA_REQUEST_TIMEOUT_SEC = float(os.getenv("OLLAMA_REQUEST_TIMEOUT_SEC", "120"))
+
+# Active health checks against /api/tags. A backend is also marked down when
+# it has not pulled OLLAMA_REQUIRED_MODEL.
+OLLAMA_HEALTH_INTERVAL_SEC = float(os.getenv("OLLAMA_HEALTH_INTERVAL_SEC", "5"))
+OLLAMA_HEALTH_TIMEOUT_SEC = float(os.getenv("OLLAMA_HEALTH_TIMEOUT_SEC", "2"))
+OLLAMA_UNHEALTHY_THRESHOLD = int(os.getenv("OLLAMA_UNHEALTHY_THRESHOLD", "2"))
+OLLAMA_REQUIRED_MODEL = os.getenv("OLLAMA_REQUIRED_MODEL", "mistral")
+
+# Outlier ejection from live traffic: consecutive failures, or an average
+# latency OLLAMA_SLOW_FACTOR times the pool median. Each repeat ejection
+# doubles the time out, up to OLLAMA_EJECT_MAX_SEC.
+OLLAMA_EJECT_FAILURES = int(os.getenv("OLLAMA_EJECT_FAILURES", "3"))
+OLLAMA_SLOW_FACTOR = float(os.getenv("OLLAMA_SLOW_FACTOR", "3"))
+OLLAMA_EJECT_SEC = float(os.getenv("OLLAMA_EJECT_SEC", "30"))
+OLLAMA_EJECT_MAX_SEC = float(os.getenv("OLLAMA_EJECT_MAX_SEC", "300"))
+
+# Hedging: if the first backend has not answered by the pool's recent p95
+# latency (never sooner than OLLAMA_HEDGE_MIN_SEC), send the same request to
+# a second backend and take whichever answers first. At most
+# OLLAMA_HEDGE_MAX_RATIO of requests are hedged, so a slow pool is not
+# doubled in load.
+OLLAMA_HEDGE = os.getenv("OLLAMA_HEDGE", "true").lower() == "true"
+OLLAMA_HEDGE_MIN_SEC = float(os.getenv("OLLAMA_HEDGE_MIN_SEC", "1"))
+OLLAMA_HEDGE_MAX_RATIO = float(os.getenv("OLLAMA_HEDGE_MAX_RATIO", "0.1"))
+
+LATENCY_WINDOW = 200
+EWMA_ALPHA = 0.2
+MIN_SAMPLES = 20
+
+
+# --------------------------------------
+# Backend
+# --------------------------------------
+class Backend:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.healthy = True
+        self.failed_checks = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.ewma_latency = None
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.failures = 0
+        self.hedges_won = 0
+        self._client = None
+        self._health_client = None
+
+    def client(self):
+        # The ollama package (httpx + pydantic) is slow to import; load it on first use.
+        if self._client is None:
+            import ollama
+            self._client = ollama.Client(host=self.url, timeout=OLLAMA_REQUEST_TIMEOUT_SEC)
+        return self._client
+
+    def health_client(self):
+        if self._health_client is None:
+            import ollama
+            self._health_client = ollama.Client(host=self.url, timeout=OLLAMA_HEALTH_TIMEOUT_SEC)
+        return self._health_client
+
+    def available(self, now):
+        return self.healthy and now >= self.ejected_until
+
+    def eject(self, now, reason):
+        self.ejections += 1
+        duration = min(OLLAMA_EJECT_SEC * 2 ** (self.ejections - 1), OLLAMA_EJECT_MAX_SEC)
+        self.ejected_until = now + duration
+        self.consecutive_failures = 0
+        logger.warning("Ejected Ollama backend %s for %.0fs: %s", self.url, duration, reason)
+
+    def record_success(self, seconds):
+        self.latencies.append(seconds)
+        self.ewma_latency = seconds if self.ewma_latency is None else (
+            EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.ewma_latency)
+        self.consecutive_failures = 0
+        if self.ejected_until and time.monotonic() >= self.ejected_until:
+            # Back from ejection and behaving; the next ejection starts short again.
+            self.ejections = 0
+            self.ejected_until = 0.0
+
+    def stats(self, now):
+        ordered = sorted(self.latencies)
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "ejected": now < self.ejected_until,
+            "ejected_for_sec": round(max(self.ejected_until - now, 0), 1),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "hedges_won": self.hedges_won,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "p50_latency_ms": round(_quantile(ordered, 0.5) * 1000, 1) if ordered else None,
+            "p95_latency_ms": round(_quantile(ordered, 0.95) * 1000, 1) if ordered else None,
+        }
+
+
+def _quantile(ordered, q):
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+# --------------------------------------
+# Pool
+# --------------------------------------
+class BackendPool:
+    """
+    Least-outstanding-requests routing over several Ollama endpoints, with
+    active health checks, outlier ejection and hedged requests.
+    """
+
+    def __init__(self, urls, hedge=OLLAMA_HEDGE, health_interval=OLLAMA_HEALTH_INTERVAL_SEC):
+        if not urls:
+            raise ValueError("OLLAMA_HOSTS is empty")
+        self.backends = [Backend(url) for url in urls]
+        self.hedge = hedge
+        self.health_interval = health_interval
+        self.recent = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+        self._checker = None
+        for backend in self.backends:
+            metrics.OLLAMA_BACKEND_UP.set(1, backend.url)
+
+    # Routing ---------------------------------------------------------------
+    def _pick(self, exclude=()):
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude and b.available(now)]
+            if not candidates and not exclude:
+                # Everything is down or ejected: spread the load rather than fail
+                # outright, a backend may have recovered since the last check.
+                candidates = list(self.backends)
+            if not candidates:
+                return None
+            fewest = min(b.outstanding for b in candidates)
+            tied = [b for b in candidates if b.outstanding == fewest]
+            # Among equally loaded backends prefer the historically faster one.
+            backend = min(tied, key=lambda b: (b.ewma_latency or 0, random.random()))
+            backend.outstanding += 1
+            backend.requests += 1
+        metrics.OLLAMA_BACKEND_OUTSTANDING.inc(backend.url)
+        return backend
+
+    def _release(self, backend):
+        with self._lock:
+            backend.outstanding -= 1
+        metrics.OLLAMA_BACKEND_OUTSTANDING.dec(backend.url)
+
+    def hedge_delay(self):
+        if len(self.recent) < MIN_SAMPLES:
+            return max(OLLAMA_HEDGE_MIN_SEC, OLLAMA_REQUEST_TIMEOUT_SEC / 4)
+        return max(OLLAMA_HEDGE_MIN_SEC, _quantile(sorted(self.recent), 0.95))
+
+    def _may_hedge(self):
+        return (self.hedge and len(self.backends) > 1
+                and self.hedges < OLLAMA_HEDGE_MAX_RATIO * self.requests)
+
+    # Calls -----------------------------------------------------------------
+    def _call(self, backend, model, messages, options, results):
+        start = time.perf_counter()
+        try:
+            response = backend.client().chat(model=model, messages=messages, **options)
+        except Exception as e:
+            self._record_failure(backend, e)
+            metrics.OLLAMA_BACKEND_REQUESTS.inc(backend.url, "error")
+            results.put((backend, False, e))
+        else:
+            seconds = time.perf_counter() - start
+            self._record_success(backend, seconds)
+            metrics.OLLAMA_BACKEND_REQUESTS.inc(backend.url, "ok")
+            results.put((backend, True, response))
+        finally:
+            self._release(backend)
+
+    def _launch(self, backend, model, messages, options, results):
+        threading.Thread(
+            target=self._call, args=(backend, model, messages, options, results),
+            name=f"ollama-{backend.url}", daemon=True
+        ).start()
+
+    def chat(self, model, messages, **options):
+        """
+        Run one chat completion on the pool and return the Ollama response.
+        A backend that errors is failed over to the next one; a backend that
+        is merely slow gets a hedged duplicate, and the loser is discarded.
+        """
+        self._ensure_checker()
+        with self._lock:
+            self.requests += 1
+        results = queue.Queue()
+        first = self._pick()
+        launched = [first]
+        self._launch(first, model, messages, options, results)
+
+        pending, hedged, hedge, last_error = 1, False, None, None
+        deadline = time.monotonic() + OLLAMA_REQUEST_TIMEOUT_SEC
+        hedge_at = time.monotonic() + self.hedge_delay()
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            wait = deadline - now if hedged else min(max(hedge_at - now, 0), deadline - now)
+            try:
+                backend, ok, value = results.get(timeout=wait)
+            except queue.Empty:
+                if not hedged and self._may_hedge():
+                    hedged = True
+                    hedge = self._pick(exclude=launched)
+                    if hedge is not None:
+                        with self._lock:
+                            self.hedges += 1
+                        launched.append(hedge)
+                        pending += 1
+                        self._launch(hedge, model, messages, options, results)
+                        logger.info("Hedged LLM request from %s to %s", first.url, hedge.url)
+                else:
+                    hedged = True
+                continue
+
+            pending -= 1
+            if ok:
+                if hedge is not None:
+                    metrics.OLLAMA_HEDGES.inc("won" if backend is hedge else "lost")
+                    if backend is hedge:
+                        with self._lock:
+                            backend.hedges_won += 1
+                return value
+
+            last_error = value
+            logger.warning("Ollama backend %s failed: %s", backend.url, value)
+            # Fail over to a backend that has not seen this request yet.
+            retry = self._pick(exclude=launched)
+            if retry is not None:
+                launched.append(retry)
+                pending += 1
+                self._launch(retry, model, messages, options, results)
+
+        if last_error is not None and not pending:
+            raise last_error
+        raise TimeoutError(f"No Ollama backend answered within {OLLAMA_REQUEST_TIMEOUT_SEC}s")
+
+    # Health & Ejection -----------------------------------------------------
+    def _record_success(self, backend, seconds):
+        with self._lock:
+            backend.record_success(seconds)
+            self.recent.append(seconds)
+            self._check_slow(backend)
+
+    def _record_failure(self, backend, error):
+        with self._lock:
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            if backend.consecutive_failures >= OLLAMA_EJECT_FAILURES:
+                backend.eject(time.monotonic(), f"{backend.consecutive_failures} consecutive failures ({error})")
+
+    def _check_slow(self, backend):
+        peers = [b.ewma_latency for b in self.backends
+                 if b.ewma_latency is not None and len(b.latencies) >= MIN_SAMPLES]
+        if len(peers) < 2 or len(backend.latencies) < MIN_SAMPLES:
+            return
+        median = sorted(peers)[len(peers) // 2]
+        now = time.monotonic()
+        others_up = any(b is not backend and b.available(now) for b in self.backends)
+        if others_up and backend.ewma_latency > OLLAMA_SLOW_FACTOR * median and backend.available(now):
+            backend.eject(now, f"average latency {backend.ewma_latency:.2f}s vs pool median {median:.2f}s")
+
+    def check_health(self):
+        """Probe every backend's /api/tags once."""
+        for backend in self.backends:
+            try:
+                models = backend.health_client().list().get("models") or []
+                names = {(m.get("model") or m.get("name") or "").split(":")[0] for m in models}
+                if OLLAMA_REQUIRED_MODEL and OLLAMA_REQUIRED_MODEL not in names:
+                    raise LookupError(f"model {OLLAMA_REQUIRED_MODEL!r} not pulled")
+            except Exception as e:
+                backend.failed_checks += 1
+                if backend.healthy and backend.failed_checks >= OLLAMA_UNHEALTHY_THRESHOLD:
+                    backend.healthy = False
+                    logger.warning("Ollama backend %s is unhealthy: %s", backend.url, e)
+            else:
+                backend.failed_checks = 0
+                if not backend.healthy:
+                    backend.healthy = True
+                    logger.info("Ollama backend %s is healthy again", backend.url)
+            metrics.OLLAMA_BACKEND_UP.set(int(backend.available(time.monotonic())), backend.url)
+
+    def _health_loop(self):
+        while True:
+            try:
+                self.check_health()
+            except Exception:
+                logger.exception("Ollama health check failed")
+            time.sleep(self.health_interval)
+
+    def _ensure_checker(self):
+        # First use happens in a gunicorn worker, so the checker lives there.
+        if self._checker is None and self.health_interval > 0:
+            self._checker = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+            self._checker.start()
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "requests": self.requests,
+            "hedged": self.hedges,
+            "hedge_delay_ms": round(self.hedge_delay() * 1000, 1),
+            "backends": [b.stats(now) for b in self.backends],
+        }
+
+
+_pool = None
+_pool_pid = None
+
+
+def get_pool():
+    """The per-process pool, recreated after a fork like the Redis client."""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = BackendPool(OLLAMA_HOSTS)
+        _pool_pid = os.getpid()
+    return _pool
+
+
+# --------------------------------------
+# Flask Integration
+# --------------------------------------
+def init_app(app):
+    @app.route("/backends", methods=["GET"])
+    def backends():
+        # Per worker; /metrics has the fleet-wide view.
+        return get_pool().stats(), 200
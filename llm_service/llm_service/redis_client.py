@@ -1,26 +1,438 @@
 import os
+import time
+import bisect
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
 import redis
 import json
+from redis.cluster import RedisCluster
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-r = redis.StrictRedis.from_url(REDIS_URL, decode_responses=True)
+# "single": one node at REDIS_URL. "cluster": Redis Cluster reached through
+# REDIS_URL. "sharded": client-side consistent hashing over REDIS_SHARD_URLS.
+REDIS_MODE = os.getenv("REDIS_MODE", "single")
+REDIS_SHARD_URLS = [u.strip() for u in os.getenv("REDIS_SHARD_URLS", "").split(",") if u.strip()]
+SHARD_VIRTUAL_NODES = int(os.getenv("REDIS_SHARD_VIRTUAL_NODES", "160"))
+# Read pre-hash-tag keys (user:<phone>) when the new key is missing, and move
+# them over. Turn off once `python -m llm_service.migrate_keys` has run.
+REDIS_LEGACY_FALLBACK = os.getenv("REDIS_LEGACY_FALLBACK", "true").lower() == "true"
+# Keep recently used conversation state in each worker, kept coherent by
+# Redis client-side caching (see NearCache). Single mode only.
+REDIS_NEAR_CACHE = os.getenv("REDIS_NEAR_CACHE", "false").lower() == "true"
+REDIS_NEAR_CACHE_SIZE = int(os.getenv("REDIS_NEAR_CACHE_SIZE", "10000"))
+# How often the listener pings both connections. A listener whose PING goes
+# unanswered for twice this long is treated as dead and reconnected.
+REDIS_NEAR_CACHE_HEALTH_SEC = float(os.getenv("REDIS_NEAR_CACHE_HEALTH_SEC", "1"))
+
+STATE_TTL_SEC = 3600
+HISTORY_LENGTH = 30
+# How long the parse of a whole message is reused for the same text.
+PARSE_CACHE_TTL_SEC = int(os.getenv("PARSE_CACHE_TTL_SEC", "86400"))
+
+
+# --------------------------------------
+# Keys
+# --------------------------------------
+# The {phone} hash tag puts every key of one phone in the same cluster slot
+# (and on the same shard), so per-phone pipelines and Lua scripts never cross
+# nodes.
+def user_key(phone):
+    return f"user:{{{phone}}}"
+
+
+def history_key(phone):
+    return f"history:{{{phone}}}"
+
+
+def parse_key(message):
+    # Hash-tagged on the digest so a message's parse lives on a single shard.
+    return f"parse:{{{hashlib.sha256(message.encode()).hexdigest()}}}"
+
+
+def legacy_user_key(phone):
+    return f"user:{phone}"
+
+
+def legacy_history_key(phone):
+    return f"history:{phone}"
+
+
+def hash_tag(key):
+    """The part of `key` Redis Cluster hashes: the first non-empty {...}, else the whole key."""
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+# --------------------------------------
+# Clients
+# --------------------------------------
+class InstrumentedRedis(redis.StrictRedis):
+    """StrictRedis that records per-command latency."""
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            metrics.REDIS_LATENCY.observe(time.perf_counter() - start, args[0])
+
+
+class InstrumentedRedisCluster(RedisCluster):
+    """RedisCluster that records per-command latency."""
+
+    def execute_command(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **kwargs)
+        finally:
+            metrics.REDIS_LATENCY.observe(time.perf_counter() - start, args[0])
+
+
+class ConsistentHashRing:
+    """
+    Maps keys to shard clients by the hash of their hash tag. Each shard owns
+    SHARD_VIRTUAL_NODES points on the ring, so adding a shard only moves
+    about 1/N of the keys.
+    """
+
+    def __init__(self, urls, virtual_nodes=SHARD_VIRTUAL_NODES):
+        if not urls:
+            raise ValueError("REDIS_MODE=sharded needs REDIS_SHARD_URLS")
+        self.clients = [InstrumentedRedis.from_url(url, decode_responses=True) for url in urls]
+        points = []
+        for index, url in enumerate(urls):
+            for v in range(virtual_nodes):
+                points.append((self._hash(f"{url}#{v}"), index))
+        points.sort()
+        self._points = [p for p, _ in points]
+        self._owners = [i for _, i in points]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def client_for(self, key):
+        i = bisect.bisect(self._points, self._hash(hash_tag(key))) % len(self._points)
+        return self.clients[self._owners[i]]
+
+
+_client = None
+_client_pid = None
+
+
+def _connect():
+    if REDIS_MODE == "single":
+        return InstrumentedRedis.from_url(REDIS_URL, decode_responses=True)
+    if REDIS_MODE == "cluster":
+        return InstrumentedRedisCluster.from_url(REDIS_URL, decode_responses=True)
+    if REDIS_MODE == "sharded":
+        return ConsistentHashRing(REDIS_SHARD_URLS)
+    raise ValueError(f"Unknown REDIS_MODE: {REDIS_MODE}")
+
+
+def get_redis(key=None):
+    """
+    Return the client that serves `key`. Created on first use, and again
+    after a fork, so gunicorn workers never share the master's connections.
+    In sharded mode the key picks the shard and is required.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = _connect()
+        _client_pid = os.getpid()
+    if isinstance(_client, ConsistentHashRing):
+        if key is None:
+            raise ValueError("A key is required to pick a shard")
+        return _client.client_for(key)
+    return _client
+
+
+# --------------------------------------
+# Near Cache
+# --------------------------------------
+class NearCache:
+    """
+    Bounded LRU of user: keys in this worker, kept coherent with Redis 6
+    client-side caching in broadcasting mode. The tracking connection asks
+    Redis to report every write to a user: key, by any client, to the
+    listener connection's __redis__:invalidate channel, which evicts it.
+
+    State writes go through the tracking connection with NOLOOP, so a
+    worker's own writes stay cached instead of evicting themselves; they
+    are serialized on that one connection. Entries expire with their Redis
+    TTL. If either connection fails, the cache is flushed and bypassed
+    until the listener has set both up again.
+    """
+
+    PREFIX = "user:"
+    CHANNEL = "__redis__:invalidate"
+
+    def __init__(self, url, max_entries=REDIS_NEAR_CACHE_SIZE, health_sec=REDIS_NEAR_CACHE_HEALTH_SEC):
+        self._pool = redis.ConnectionPool.from_url(url, decode_responses=True)
+        self.max_entries = max_entries
+        self.health_sec = health_sec
+        # key -> (fill token, value, expires_at). A token marks a read in
+        # flight; an invalidation that lands first removes it, so the
+        # possibly stale result is not stored.
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer = None
+        self._last_pong = 0.0
+        self.enabled = False
+        threading.Thread(target=self._listen, name="redis-near-cache", daemon=True).start()
+
+    # Reads and writes
+    def get(self, key):
+        """The value of `key` (None if it does not exist), from this worker when possible."""
+        now = time.monotonic()
+        token = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is None and entry[2] > now:
+                self._entries.move_to_end(key)
+                metrics.NEAR_CACHE_READS.inc("hit")
+                return entry[1]
+            if self.enabled and (entry is None or entry[0] is None):
+                token = object()
+                self._put(key, token, None, 0)
+        metrics.NEAR_CACHE_READS.inc("miss" if token else "bypass")
+        pipe = get_redis(key).pipeline(transaction=False)
+        pipe.get(key)
+        pipe.pttl(key)
+        value, pttl = pipe.execute()
+        if token is not None:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] is token:
+                    self._put(key, None, value, now + (pttl / 1000 if pttl > 0 else STATE_TTL_SEC))
+        return value
+
+    def set(self, key, value, ttl):
+        """SET through the tracking connection. False if the cache is down and the caller must write."""
+        with self._write_lock:
+            if not self._command("SET", key, value, "EX", ttl):
+                return False
+            with self._lock:
+                self._put(key, None, value, time.monotonic() + ttl)
+        return True
+
+    def delete(self, key):
+        """DEL through the tracking connection. False if the cache is down and the caller must delete."""
+        with self._write_lock:
+            if not self._command("DEL", key):
+                return False
+            with self._lock:
+                self._entries.pop(key, None)
+        return True
+
+    def _command(self, *args):
+        if not self.enabled:
+            return False
+        start = time.perf_counter()
+        try:
+            self._writer.send_command(*args)
+            self._writer.read_response()
+            return True
+        except (redis.RedisError, OSError) as e:
+            logger.warning("Near cache tracking connection failed: %s", e)
+            self._disable()
+            return False
+        finally:
+            metrics.REDIS_LATENCY.observe(time.perf_counter() - start, args[0])
+
+    def _put(self, key, token, value, expires_at):
+        self._entries[key] = (token, value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # Invalidation
+    def _listen(self):
+        backoff = 1
+        while True:
+            listener, writer = self._pool.make_connection(), None
+            try:
+                listener.send_command("CLIENT", "ID")
+                listener_id = listener.read_response()
+                listener.send_command("SUBSCRIBE", self.CHANNEL)
+                listener.read_response()
+                writer = self._pool.make_connection()
+                writer.send_command("CLIENT", "TRACKING", "ON", "REDIRECT", listener_id,
+                                    "BCAST", "PREFIX", self.PREFIX, "NOLOOP")
+                writer.read_response()
+                with self._write_lock:
+                    self._writer = writer
+                    self.enabled = True
+                logger.info("Near cache tracking %s* keys", self.PREFIX)
+                backoff = 1
+                pinged_at = self._last_pong = time.monotonic()
+                # A failed write disables the cache from another thread; reconnect right away.
+                while self.enabled:
+                    if listener.can_read(timeout=self.health_sec):
+                        self._on_message(listener.read_response())
+                    now = time.monotonic()
+                    if self._last_pong < pinged_at and now - pinged_at > 2 * self.health_sec:
+                        # Invalidations may be getting lost on the way too.
+                        logger.warning("Near cache listener missed its PONG for %.1fs", now - pinged_at)
+                        break
+                    if now - pinged_at >= self.health_sec and self._last_pong >= pinged_at:
+                        # PING is allowed while subscribed; its reply is read above.
+                        pinged_at = now
+                        listener.send_command("PING")
+                        with self._write_lock:
+                            if not self._command("PING"):
+                                break
+            except (redis.RedisError, OSError) as e:
+                logger.warning("Near cache invalidation listener failed: %s", e)
+            finally:
+                self._disable()
+                listener.disconnect()
+                if writer is not None:
+                    writer.disconnect()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _on_message(self, message):
+        if not isinstance(message, list):
+            return
+        if message[0] == "pong":
+            self._last_pong = time.monotonic()
+            return
+        if message[0] != "message":
+            return
+        keys = message[2]
+        with self._lock:
+            if keys is None:
+                # FLUSHDB / FLUSHALL
+                self._entries.clear()
+                metrics.NEAR_CACHE_INVALIDATIONS.inc("flush")
+                return
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    metrics.NEAR_CACHE_INVALIDATIONS.inc("key")
+
+    def _disable(self):
+        """Stop serving and drop everything: without tracking, entries may already be stale."""
+        with self._write_lock:
+            was_enabled, self.enabled = self.enabled, False
+            if self._writer is not None:
+                self._writer.disconnect()
+                self._writer = None
+        with self._lock:
+            self._entries.clear()
+        if was_enabled:
+            metrics.NEAR_CACHE_INVALIDATIONS.inc("disconnect")
+
+
+_near = None
+_near_pid = None
+
+
+def get_near_cache():
+    """This worker's NearCache, or None when it is off. Recreated after a fork, like get_redis()."""
+    global _near, _near_pid
+    if not REDIS_NEAR_CACHE:
+        return None
+    if _near_pid != os.getpid():
+        _near_pid = os.getpid()
+        _near = None
+        if REDIS_MODE == "single":
+            _near = NearCache(REDIS_URL)
+        else:
+            logger.warning("REDIS_NEAR_CACHE needs REDIS_MODE=single; reading state from Redis")
+    return _near
+
+
+# --------------------------------------
+# Conversation State
+# --------------------------------------
+def _move_legacy_string(r, phone):
+    legacy = get_redis(legacy_user_key(phone))
+    data = legacy.get(legacy_user_key(phone))
+    if data:
+        ttl = legacy.ttl(legacy_user_key(phone))
+        r.set(user_key(phone), data, ex=ttl if ttl and ttl > 0 else STATE_TTL_SEC, nx=True)
+        legacy.delete(legacy_user_key(phone))
+    return data
+
 
 def get_user_state(phone):
-    data = r.get(f"user:{phone}")
+    r = get_redis(user_key(phone))
+    near = get_near_cache()
+    data = near.get(user_key(phone)) if near else r.get(user_key(phone))
+    if data is None and REDIS_LEGACY_FALLBACK:
+        data = _move_legacy_string(r, phone)
     return json.loads(data) if data else {}
 
 def set_user_state(phone, state):
-    r.set(f"user:{phone}", json.dumps(state), ex=3600)
+    data = json.dumps(state)
+    near = get_near_cache()
+    if near is None or not near.set(user_key(phone), data, STATE_TTL_SEC):
+        get_redis(user_key(phone)).set(user_key(phone), data, ex=STATE_TTL_SEC)
 
 def clear_user_state(phone):
-    r.delete(f"user:{phone}")
+    near = get_near_cache()
+    if near is None or not near.delete(user_key(phone)):
+        get_redis(user_key(phone)).delete(user_key(phone))
+    if REDIS_LEGACY_FALLBACK:
+        get_redis(legacy_user_key(phone)).delete(legacy_user_key(phone))
 
 # 📜 Conversation History
+def _move_legacy_history(phone):
+    legacy = get_redis(legacy_history_key(phone))
+    entries = legacy.lrange(legacy_history_key(phone), 0, -1)
+    if entries:
+        r = get_redis(history_key(phone))
+        pipe = r.pipeline(transaction=False)
+        pipe.lpush(history_key(phone), *reversed(entries))
+        pipe.ltrim(history_key(phone), -HISTORY_LENGTH, -1)
+        pipe.execute()
+        legacy.delete(legacy_history_key(phone))
+    return entries
+
+
 def add_to_history(phone, sender, text):
     entry = json.dumps({"from": sender, "text": text})
-    r.rpush(f"history:{phone}", entry)
-    r.ltrim(f"history:{phone}", -30, -1)  # Keep only last 30 messages
+    # All three commands hit the same slot thanks to the hash tag: one round trip.
+    pipe = get_redis(history_key(phone)).pipeline(transaction=False)
+    pipe.exists(history_key(phone))
+    pipe.rpush(history_key(phone), entry)
+    pipe.ltrim(history_key(phone), -HISTORY_LENGTH, -1)  # Keep only last 30 messages
+    existed = pipe.execute()[0]
+    if not existed and REDIS_LEGACY_FALLBACK:
+        # Only a history new under the hash-tagged key can still have a legacy
+        # one; moving it prepends the older entries to this one.
+        _move_legacy_history(phone)
+
+def clear_history(phone):
+    get_redis(history_key(phone)).delete(history_key(phone))
+    if REDIS_LEGACY_FALLBACK:
+        get_redis(legacy_history_key(phone)).delete(legacy_history_key(phone))
 
 def get_history(phone):
-    raw = r.lrange(f"history:{phone}", 0, -1)
+    raw = get_redis(history_key(phone)).lrange(history_key(phone), 0, -1)
+    if not raw and REDIS_LEGACY_FALLBACK:
+        raw = get_redis(legacy_history_key(phone)).lrange(legacy_history_key(phone), 0, -1)
     return [json.loads(h) for h in raw]
+
+
+# --------------------------------------
+# Parse Cache
+# --------------------------------------
+def get_cached_parse(message):
+    data = get_redis(parse_key(message)).get(parse_key(message))
+    return json.loads(data) if data else None
+
+def cache_parse(message, parsed):
+    get_redis(parse_key(message)).set(parse_key(message), json.dumps(parsed), ex=PARSE_CACHE_TTL_SEC)
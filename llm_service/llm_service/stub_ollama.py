@@ -0,0 +1,113 @@
+"""
+Local stand-ins for Ollama, for exercising the backend pool without a model.
+
+    python -m llm_service.stub_ollama --port 11501 --port 11502 --port 11503 --latency 0.3
+    OLLAMA_HOSTS=http://127.0.0.1:11501,http://127.0.0.1:11502,http://127.0.0.1:11503 ...
+
+Each port serves /api/tags and /api/chat. --slow-port and --fail-port make
+individual stubs misbehave so ejection and hedging can be watched on
+/backends.
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MESSAGE_PATTERN = re.compile(r'User message: "(.*)"', re.S)
+
+
+def canned_parse(prompt):
+    """A fixed-shape answer so the message handler has something to work with."""
+    match = MESSAGE_PATTERN.search(prompt)
+    message = match.group(1) if match else prompt
+    return {"intent": "product_info", "fields": {"product_name": message[:40]}}
+
+
+def make_handler(model, latency, jitter, error_rate, responder=canned_parse):
+    class StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path != "/api/tags":
+                return self._send(404, {"error": "not found"})
+            self._send(200, {"models": [{"name": f"{model}:latest", "model": f"{model}:latest"}]})
+
+        def do_POST(self):
+            if self.path != "/api/chat":
+                return self._send(404, {"error": "not found"})
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            seconds = max(0.0, random.gauss(latency, jitter))
+            time.sleep(seconds)
+            if random.random() < error_rate:
+                return self._send(500, {"error": "stub failure"})
+            prompt = (request.get("messages") or [{}])[-1].get("content", "")
+            reply = responder(prompt)
+            content = reply if isinstance(reply, str) else json.dumps(reply)
+            # Split the time roughly the way a real model spends it.
+            nanos = int(seconds * 1e9)
+            self._send(200, {
+                "model": request.get("model", model),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "message": {"role": "assistant", "content": content},
+                "done": True,
+                "done_reason": "stop",
+                "total_duration": nanos,
+                "prompt_eval_count": len(prompt.split()),
+                "prompt_eval_duration": nanos // 5,
+                "eval_count": len(content.split()),
+                "eval_duration": nanos - nanos // 5,
+            })
+
+    return StubHandler
+
+
+def serve(port, model="mistral", latency=0.2, jitter=0.05, error_rate=0.0, host="127.0.0.1",
+          responder=canned_parse):
+    """
+    Start one stub in a background thread and return its server. Port 0
+    picks a free port (see server.server_port). `responder(prompt)` returns
+    the reply as a dict, or as a raw string to simulate malformed output.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(model, latency, jitter, error_rate, responder))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"stub-ollama-{port}", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, action="append", default=[], help="Repeat for several stubs.")
+    parser.add_argument("--model", default="mistral")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean seconds per chat call.")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--slow-port", type=int, action="append", default=[], help="This stub is 10x slower.")
+    parser.add_argument("--fail-port", type=int, action="append", default=[], help="This stub fails half its calls.")
+    args = parser.parse_args(argv)
+
+    for port in args.port or [11434]:
+        slow = 10 if port in args.slow_port else 1
+        serve(port, args.model, args.latency * slow, args.jitter * slow,
+              0.5 if port in args.fail_port else 0.0)
+        print(f"stub ollama on http://127.0.0.1:{port}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+import os
+
+import fakeredis
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def log_file(tmp_path_factory):
+    """Keep the log file create_app() opens out of the source tree."""
+    path = tmp_path_factory.mktemp("llm_service") / "llm_service.log"
+    saved = os.environ.get("LOG_FILE")
+    os.environ["LOG_FILE"] = str(path)
+    yield path
+    if saved is None:
+        os.environ.pop("LOG_FILE", None)
+    else:
+        os.environ["LOG_FILE"] = saved
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """
+    A fakeredis client returned by every get_redis() in the service. It runs
+    Lua through lupa, so the admission scripts execute as on a real server.
+    """
+    from llm_service import redis_client, normalization, idempotency, admission
+    client = fakeredis.FakeRedis(decode_responses=True)
+    for module in (redis_client, normalization, idempotency, admission):
+        monkeypatch.setattr(module, "get_redis", lambda key=None: client)
+    # Registered scripts are bound to the client they were loaded on.
+    monkeypatch.setattr(admission, "_scripts", {})
+    return client
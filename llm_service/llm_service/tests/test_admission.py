@@ -0,0 +1,81 @@
+import pytest
+
+from llm_service import admission, message_handler
+from llm_service.redis_client import set_user_state
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(admission.time, "time", lambda: now[0])
+    return now
+
+
+def test_token_bucket_exhausts_and_refills(fake_redis, clock, monkeypatch):
+    monkeypatch.setattr(admission, "PHONE_BUCKET_CAPACITY", 3)
+    monkeypatch.setattr(admission, "PHONE_BUCKET_REFILL_PER_SEC", 0.5)
+
+    assert [admission.allow_phone("263771") for _ in range(4)] == [True, True, True, False]
+    assert admission.allow_phone("263772")  # buckets are per phone
+
+    clock[0] += 2  # one token back at 0.5/s
+    assert admission.allow_phone("263771")
+    assert not admission.allow_phone("263771")
+
+    clock[0] += 60  # refills only up to capacity
+    assert [admission.allow_phone("263771") for _ in range(4)] == [True, True, True, False]
+    # An idle bucket expires once it would be full again anyway.
+    assert 0 < fake_redis.pttl(admission.bucket_key("263771")) <= 6000
+
+
+def test_llm_slots_are_released_and_shed_when_exhausted(fake_redis, clock, monkeypatch):
+    monkeypatch.setattr(admission, "LLM_MAX_CONCURRENCY", 2)
+    monkeypatch.setattr(admission, "LLM_SLOT_WAIT_SEC", 0)
+
+    with admission.llm_slot() as first, admission.llm_slot() as second:
+        assert first and second
+        with admission.llm_slot() as third:
+            assert not third
+    assert fake_redis.zcard(admission.LLM_SLOTS_KEY) == 0
+
+    with admission.llm_slot() as again:
+        assert again
+
+
+def test_slot_of_a_crashed_worker_is_reclaimed_after_its_lease(fake_redis, clock, monkeypatch):
+    monkeypatch.setattr(admission, "LLM_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(admission, "LLM_SLOT_WAIT_SEC", 0)
+    monkeypatch.setattr(admission, "LLM_SLOT_LEASE_SEC", 120)
+
+    # Entered and never exited, like a worker killed mid-call. Kept referenced
+    # so garbage collection cannot run its release.
+    crashed = admission.llm_slot()
+    assert crashed.__enter__()
+
+    clock[0] += 119
+    with admission.llm_slot() as acquired:
+        assert not acquired
+
+    clock[0] += 2
+    with admission.llm_slot() as acquired:
+        assert acquired
+
+
+def test_only_pending_confirmations_are_priority(fake_redis):
+    assert not admission.is_priority("263771", "yes")
+    set_user_state("263771", {"intent": "sell", "fields": {}, "awaiting_confirmation": True})
+    assert admission.is_priority("263771", "yes")
+    assert admission.is_priority("263771", "no")
+    assert not admission.is_priority("263771", "sell 5 goats")
+
+
+def test_cached_parse_skips_the_llm_and_admission(fake_redis, monkeypatch):
+    parses = []
+    monkeypatch.setattr(message_handler, "parse_message",
+                        lambda message: parses.append(message) or {"intent": "buy", "fields": {"product_name": "goats"}})
+    first = message_handler.handle_message("263771", "I want goats")
+
+    monkeypatch.setattr(admission, "allow_phone", lambda phone: False)
+    assert message_handler.handle_message("263772", "I want goats") == first
+    assert parses == ["i want goats"]
+    assert message_handler.handle_message("263772", "I want sheep") == admission.BUSY_MSG
@@ -0,0 +1,106 @@
+import contextlib
+import threading
+
+import pytest
+import redis
+
+from llm_service import admission, idempotency, message_handler
+from llm_service.idempotency import StillProcessing, hand_off, run_once
+
+
+@pytest.fixture(autouse=True)
+def short_wait(monkeypatch):
+    monkeypatch.setattr(idempotency, "WEBHOOK_WAIT_SEC", 0.3)
+
+
+def _slow_handler(started, release, reply="first reply"):
+    def handler():
+        started.set()
+        release.wait(5)
+        return reply
+    return handler
+
+
+def test_duplicate_is_replayed(fake_redis):
+    calls = []
+    handler = lambda: calls.append(1) or "hello"
+
+    assert run_once("SM1", handler) == "hello"
+    assert run_once("SM1", handler) == "hello"
+    assert run_once(None, handler) == "hello"
+    assert len(calls) == 2
+
+
+def test_retry_waits_for_the_first_delivery(fake_redis):
+    started, release = threading.Event(), threading.Event()
+    replies = []
+    first = threading.Thread(target=lambda: replies.append(run_once("SM2", _slow_handler(started, release))))
+    first.start()
+    started.wait(5)
+
+    threading.Timer(0.1, release.set).start()
+    assert run_once("SM2", lambda: pytest.fail("handler ran twice")) == "first reply"
+    first.join()
+    assert replies == ["first reply"]
+
+
+def test_failed_delivery_releases_its_claim(fake_redis):
+    def failing():
+        raise RuntimeError("marketplace down")
+
+    with pytest.raises(RuntimeError):
+        run_once("SM3", failing)
+    assert run_once("SM3", lambda: "second try") == "second try"
+
+
+def test_redis_down_fails_open(monkeypatch):
+    def broken(key=None):
+        raise redis.ConnectionError("no redis")
+
+    monkeypatch.setattr(idempotency, "get_redis", broken)
+    assert run_once("SM4", lambda: "processed") == "processed"
+
+
+def test_retry_answered_empty_gets_the_reply_late(fake_redis):
+    started, release = threading.Event(), threading.Event()
+    late = []
+    first = threading.Thread(target=lambda: run_once("SM5", _slow_handler(started, release), deliver_late=late.append))
+    first.start()
+    started.wait(5)
+
+    with pytest.raises(StillProcessing):
+        run_once("SM5", lambda: pytest.fail("handler ran twice"))
+    assert hand_off("SM5") is None
+    release.set()
+    first.join()
+    assert late == ["first reply"]
+
+
+def test_hand_off_after_the_reply_is_stored(fake_redis):
+    late = []
+    run_once("SM6", lambda: "done already", deliver_late=late.append)
+
+    # The first delivery finished between the retry's timeout and hand_off:
+    # the retry answers in-band and nothing is sent twice.
+    assert hand_off("SM6") == "done already"
+    assert late == []
+    assert fake_redis.get(idempotency.unanswered_key("SM6")) is None
+
+
+def test_transient_failure_is_not_replayed(fake_redis, monkeypatch):
+    monkeypatch.setattr(admission, "allow_phone", lambda phone: True)
+    monkeypatch.setattr(admission, "llm_slot", lambda: contextlib.nullcontext(True))
+    replies = iter([ConnectionError("ollama down"), {"intent": "buy", "fields": {"product_name": "goats"}}])
+
+    def parse(message):
+        reply = next(replies)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    monkeypatch.setattr(message_handler, "parse_message", parse)
+    handle = lambda: message_handler.handle_message("263771", "I want goats", message_sid="SM9")
+
+    assert "something went wrong" in run_once("SM9", handle)
+    assert run_once("SM9", handle) == "Thanks! Can you tell me your location?"
+    assert run_once("SM9", lambda: pytest.fail("handler ran twice")) == "Thanks! Can you tell me your location?"
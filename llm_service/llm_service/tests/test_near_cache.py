@@ -0,0 +1,193 @@
+import socketserver
+import threading
+import time
+from itertools import count
+
+import pytest
+import redis
+
+from llm_service import redis_client
+from llm_service.redis_client import NearCache
+
+
+class _Client(socketserver.StreamRequestHandler):
+    """One connection to MiniRedis, speaking RESP2."""
+
+    def setup(self):
+        super().setup()
+        self.id = next(self.server.ids)
+        self.send_lock = threading.Lock()
+        self.subscribed = False
+        self.server.clients[self.id] = self
+
+    def finish(self):
+        self.server.clients.pop(self.id, None)
+        super().finish()
+
+    def send(self, reply):
+        with self.send_lock:
+            self.wfile.write(reply)
+            self.wfile.flush()
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                size = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(size + 2)[:-2].decode())
+            reply = self.server.execute(self, args)
+            if reply is not None:
+                self.send(reply)
+
+
+def _bulk(value):
+    return b"$-1\r\n" if value is None else f"${len(value.encode())}\r\n{value}\r\n".encode()
+
+
+def _array(*items):
+    return f"*{len(items)}\r\n".encode() + b"".join(items)
+
+
+class MiniRedis(socketserver.ThreadingTCPServer):
+    """
+    Just enough of Redis for NearCache: strings with TTLs, SUBSCRIBE, and
+    CLIENT TRACKING in broadcasting mode with REDIRECT and NOLOOP.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Client)
+        self.ids = count(1)
+        self.clients = {}
+        self.data = {}
+        self.tracking = {}  # writer id -> (redirect id, prefix, noloop)
+        self.muted = set()  # client ids whose PINGs go unanswered, like a dead link
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "redis://%s:%d/0?protocol=2" % self.server_address
+
+    def execute(self, client, args):
+        name = args[0].upper()
+        if name == "CLIENT" and args[1].upper() == "ID":
+            return f":{client.id}\r\n".encode()
+        if name == "CLIENT" and args[1].upper() == "TRACKING":
+            opts = [a.upper() for a in args]
+            self.tracking[client.id] = (int(args[opts.index("REDIRECT") + 1]), args[opts.index("PREFIX") + 1],
+                                        "NOLOOP" in opts)
+            return b"+OK\r\n"
+        if name == "SUBSCRIBE":
+            client.subscribed = True
+            return _array(_bulk("subscribe"), _bulk(args[1]), b":1\r\n")
+        if name == "PING":
+            if client.id in self.muted:
+                return None
+            return _array(_bulk("pong"), _bulk("")) if client.subscribed else b"+PONG\r\n"
+        with self.lock:
+            if name == "GET":
+                return _bulk(self._live(args[1]))
+            if name == "PTTL":
+                if self._live(args[1]) is None:
+                    return b":-2\r\n"
+                return f":{int((self.data[args[1]][1] - time.monotonic()) * 1000)}\r\n".encode()
+            if name == "SET":
+                ttl = int(args[args.index("EX") + 1]) if "EX" in args else 3600
+                self.data[args[1]] = (args[2], time.monotonic() + ttl)
+                self._invalidate(client, args[1])
+                return b"+OK\r\n"
+            if name == "DEL":
+                existed = self.data.pop(args[1], None) is not None
+                self._invalidate(client, args[1])
+                return f":{int(existed)}\r\n".encode()
+        return b"+OK\r\n"
+
+    def _live(self, key):
+        value, expires_at = self.data.get(key, (None, 0))
+        return value if expires_at > time.monotonic() else None
+
+    def _invalidate(self, source, key):
+        for writer_id, (redirect_id, prefix, noloop) in list(self.tracking.items()):
+            listener = self.clients.get(redirect_id)
+            if listener is None or not key.startswith(prefix) or (noloop and writer_id == source.id):
+                continue
+            listener.send(_array(_bulk("message"), _bulk(NearCache.CHANNEL), _array(_bulk(key))))
+
+    def listener_ids(self):
+        return {redirect_id for redirect_id, _, _ in self.tracking.values() if redirect_id in self.clients}
+
+
+def _eventually(check, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            pytest.fail("condition not met in time")
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = MiniRedis()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = redis.Redis.from_url(server.url, decode_responses=True)
+    monkeypatch.setattr(redis_client, "get_redis", lambda key=None: client)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def caches(server):
+    pair = [NearCache(server.url, health_sec=0.1), NearCache(server.url, health_sec=0.1)]
+    _eventually(lambda: all(cache.enabled for cache in pair))
+    return pair
+
+
+def test_write_in_one_worker_evicts_the_other(caches):
+    a, b = caches
+    key = redis_client.user_key("263770000001")
+
+    assert a.get(key) is None
+    assert b.set(key, "from b", 60)
+    _eventually(lambda: a.get(key) == "from b")
+    assert key in b._entries  # NOLOOP: b's own write stays cached
+
+    assert a.set(key, "from a", 60)
+    _eventually(lambda: b.get(key) == "from a")
+    assert a.delete(key)
+    _eventually(lambda: b.get(key) is None)
+
+
+def test_missing_pong_flushes_and_reconnects(server, caches):
+    a, b = caches
+    key = redis_client.user_key("263770000002")
+    a.set(key, "cached", 60)
+    dead = server.listener_ids()
+
+    # The connections stay open but nothing comes back, so invalidations would be lost too.
+    server.muted.update(dead)
+    _eventually(lambda: not a.enabled and not a._entries, timeout=1)
+    _eventually(lambda: a.enabled and b.enabled and not server.listener_ids() & dead)
+
+
+def test_disabled_cache_reconnects_under_steady_traffic(server, caches):
+    a, b = caches
+    key = redis_client.user_key("263770000003")
+    stop = threading.Event()
+
+    def writes():
+        # Keeps a's listener readable, so it never sits idle.
+        while not stop.wait(0.01):
+            b.set(key, str(time.monotonic()), 60)
+
+    threading.Thread(target=writes, daemon=True).start()
+    try:
+        a._disable()  # what a failed SET/DEL on the tracking connection does
+        _eventually(lambda: a.enabled, timeout=3)
+    finally:
+        stop.set()
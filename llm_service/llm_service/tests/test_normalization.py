@@ -0,0 +1,115 @@
+import pytest
+from flask import Flask
+
+from llm_service import normalization, message_handler
+from llm_service.normalization import NormalizationStore, TermTrie
+
+ADMIN = {"X-Admin-Token": "admin-secret"}
+
+
+@pytest.fixture
+def store(fake_redis, monkeypatch):
+    store = NormalizationStore()
+    monkeypatch.setattr(normalization, "store", store)
+    return store
+
+
+@pytest.fixture
+def unit_codes(monkeypatch):
+    # Known units without fetching GET /units from the marketplace.
+    units = normalization.UnitTable()
+    units._aliases = {"kg": "kg", "tonne": "tonne", "tonnes": "tonne", "each": "each"}
+    units._checked_at = float("inf")
+    monkeypatch.setattr(normalization, "units", units)
+    return units
+
+
+@pytest.fixture
+def admin_client(store, monkeypatch):
+    monkeypatch.setattr(normalization, "ADMIN_TOKEN", ADMIN["X-Admin-Token"])
+    app = Flask(__name__)
+    normalization.init_app(app)
+    return app.test_client()
+
+
+def test_trie_prefers_the_longest_term():
+    trie = TermTrie({"road": "a", "road runners": "b", "runners": "c"})
+
+    assert trie.find("Selling 20 Road Runners, and road.") == [("road runners", "b"), ("road", "a")]
+    assert trie.find("nothing known here") == []
+
+
+def test_learned_mapping_needs_count_and_share(store):
+    store.record("product", "madhadha", "ducks", "livestock")
+    store.reload(force=True)
+    assert store.lookup("product", "madhadha") is None  # seen once, below NORM_MIN_COUNT
+
+    store.record("product", "madhadha", "ducks", "livestock")
+    store.record("product", "madhadha", "geese", "livestock")
+    store.reload(force=True)
+    assert store.lookup("product", "madhadha")["normalized"] == "ducks"  # 2 of 3 clears NORM_MIN_SHARE
+
+    store.record("product", "madhadha", "geese", "livestock")
+    store.reload(force=True)
+    assert store.lookup("product", "madhadha") is None  # 2 of 4 does not
+
+
+def test_seeds_are_not_outvoted(store):
+    for _ in range(5):
+        store.record("product", "huku", "ducks")
+    store.reload(force=True)
+
+    assert store.lookup("product", "huku")["normalized"] == "chickens"
+
+
+def test_locative_prefixes_only_strip_to_known_places(store):
+    assert store.lookup("location", "kuGweru")["normalized"] == "Gweru Urban"
+    assert store.lookup("location", "eBulawayo")["normalized"] == "Bulawayo"
+    assert store.lookup("location", "mutare")["normalized"] == "Mutare Urban"
+    assert store.lookup("location", "kumusha") is None
+    assert store.scan("ndine huku kwaMutare") == {
+        "product": ("huku", store.lookup("product", "huku")),
+        "location": ("kwamutare", store.lookup("location", "mutare")),
+    }
+
+
+def test_build_prompt_hands_known_terms_to_the_llm(store, unit_codes):
+    prompt, known = message_handler.build_prompt("selling broilers in gweru")
+
+    assert set(known) == {"product", "location"}
+    assert "“broilers” normalizes to “chickens” in category “livestock”" in prompt
+    assert "“gweru” is the district “Gweru Urban”" in prompt
+    assert message_handler.LOCATION_STEP not in prompt
+    assert "one of: each, kg, tonne" in prompt
+
+    prompt, known = message_handler.build_prompt("selling madhadha")
+    assert known == {}
+    assert message_handler.LOCATION_STEP in prompt
+    assert all(step in prompt for step in message_handler.PRODUCT_STEPS)
+
+
+def test_answer_from_store(store, unit_codes):
+    state = {"intent": "buy", "fields": {"product_name": "goats"}}
+
+    assert message_handler._answer_from_store(state, "kugweru") == {
+        "intent": "buy", "fields": {"location": "Gweru Urban"}}
+    assert message_handler._answer_from_store(state, "somewhere new") is None
+    assert message_handler._answer_from_store({**state, "awaiting_confirmation": True}, "gweru") is None
+    assert message_handler._answer_from_store({"intent": "buy", "fields": {}}, "mbudzi") == {
+        "intent": "buy", "fields": {"product_name": "mbudzi", "normalized_product": "goats",
+                                    "category": "livestock"}}
+
+
+def test_override_response_does_not_depend_on_reload(admin_client, store):
+    assert admin_client.put("/normalization/product/madhadha", json={"normalized": "ducks"}).status_code == 401
+
+    # Another thread holds the reload lock, so the snapshot is not rebuilt.
+    with store._lock:
+        res = admin_client.put("/normalization/product/madhadha", headers=ADMIN,
+                               json={"normalized": "ducks", "category": "livestock"})
+    assert res.status_code == 200
+    assert res.json == {"kind": "product", "raw": "madhadha", "normalized": "ducks",
+                        "category": "livestock", "source": "override"}
+
+    store.reload(force=True)
+    assert store.lookup("product", "madhadha")["source"] == "override"
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from llm_service import ollama_pool, stub_ollama
+from llm_service.ollama_pool import BackendPool
+
+MESSAGES = [{"role": "user", "content": 'User message: "selling maize"'}]
+
+
+@pytest.fixture
+def stubs():
+    servers = []
+
+    def start(**kwargs):
+        server = stub_ollama.serve(0, jitter=0, **kwargs)
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_failing_backend_is_ejected(stubs):
+    pool = BackendPool([stubs(latency=0.01, error_rate=1.0), stubs(latency=0.01)], hedge=False, health_interval=0)
+    failing, healthy = pool.backends
+
+    for _ in range(6):
+        assert pool.chat("mistral", MESSAGES)["message"]["content"]
+
+    # Each failure is failed over; the third in a row ejects the backend and it gets no more traffic.
+    assert (failing.requests, failing.failures) == (ollama_pool.OLLAMA_EJECT_FAILURES,) * 2
+    assert pool.stats()["backends"][0]["ejected"] is True
+    assert healthy.requests == 6
+
+
+def test_slow_backend_is_hedged(stubs, monkeypatch):
+    monkeypatch.setattr(ollama_pool, "OLLAMA_HEDGE_MAX_RATIO", 1.0)
+    pool = BackendPool([stubs(latency=2.0), stubs(latency=0.01)], hedge=True, health_interval=0)
+    monkeypatch.setattr(pool, "hedge_delay", lambda: 0.1)
+    slow, fast = pool.backends
+    fast.ewma_latency = 10.0  # route the first attempt to the slow stub
+
+    assert pool.chat("mistral", MESSAGES)["message"]["content"]
+
+    assert (pool.requests, pool.hedges) == (1, 1)
+    assert (slow.hedges_won, fast.hedges_won) == (0, 1)
+
+
+def test_concurrent_requests_are_all_counted(stubs, monkeypatch):
+    monkeypatch.setattr(ollama_pool, "MIN_SAMPLES", 3)
+    pool = BackendPool([stubs(latency=0.02), stubs(latency=0.02), stubs(latency=0.3)], hedge=False,
+                       health_interval=0)
+
+    with ThreadPoolExecutor(12) as executor:
+        list(executor.map(lambda _: pool.chat("mistral", MESSAGES), range(60)))
+
+    assert pool.requests == sum(b.requests for b in pool.backends) == 60
+    assert pool.stats()["backends"][2]["ejected"] is True
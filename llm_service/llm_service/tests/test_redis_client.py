@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from llm_service import redis_client
+from llm_service.migrate_keys import new_key
+from llm_service.redis_client import ConsistentHashRing, hash_tag, history_key, legacy_history_key
+
+
+def test_hash_tag():
+    assert hash_tag("user:{263771}") == "263771"
+    assert hash_tag("history:{263771}:extra{x}") == "263771"
+    assert hash_tag("user:263771") == "user:263771"
+    assert hash_tag("user:{}") == "user:{}"  # an empty tag hashes the whole key
+    assert hash_tag("a{}{b}") == "a{}{b}"
+
+
+def test_ring_keeps_a_phone_on_one_shard_and_moves_few_keys():
+    urls = ["redis://shard-a:6379/0", "redis://shard-b:6379/0", "redis://shard-c:6379/0"]
+    ring = ConsistentHashRing(urls)
+    phones = [str(263770000000 + i) for i in range(300)]
+
+    for phone in phones:
+        assert ring.client_for(f"user:{{{phone}}}") is ring.client_for(f"history:{{{phone}}}")
+    assert len({id(ring.client_for(f"user:{{{p}}}")) for p in phones}) == 3
+
+    def owners(r):
+        return [r.clients.index(r.client_for(f"user:{{{p}}}")) for p in phones]
+
+    before, after = owners(ring), owners(ConsistentHashRing(urls + ["redis://shard-d:6379/0"]))
+    moved = [a for b, a in zip(before, after) if b != a]
+    assert set(moved) == {3}  # keys only move to the new shard
+    assert len(moved) < len(phones) / 2
+
+    with pytest.raises(ValueError):
+        ConsistentHashRing([])
+
+
+def test_new_key():
+    assert new_key("user:263771") == "user:{263771}"
+    assert new_key("history:263771") == "history:{263771}"
+    assert new_key("user:+263771234567") == "user:{+263771234567}"
+    assert new_key("history:+263771234567") == "history:{+263771234567}"
+    assert new_key("norm:counts:product") == "norm:{store}:counts:product"
+    assert new_key("norm:version") == "norm:{store}:version"
+    assert new_key("user:{263771}") is None
+    assert new_key("webhook:SM1") is None
+
+
+def test_legacy_history_is_only_read_for_a_new_conversation(fake_redis, monkeypatch):
+    phone = "263771"
+    fake_redis.rpush(legacy_history_key(phone), *(json.dumps({"from": "user", "text": t}) for t in ("a", "b")))
+    reads = []
+    lrange = fake_redis.lrange
+    monkeypatch.setattr(fake_redis, "lrange", lambda key, *args: reads.append(key) or lrange(key, *args))
+
+    redis_client.add_to_history(phone, "user", "c")
+    redis_client.add_to_history(phone, "bot", "d")
+
+    assert reads == [legacy_history_key(phone)]
+    assert [h["text"] for h in redis_client.get_history(phone)] == ["a", "b", "c", "d"]
+    assert fake_redis.get(legacy_history_key(phone)) is None
+    assert len(fake_redis.lrange(history_key(phone), 0, -1)) == 4
@@ -0,0 +1,22 @@
+import os
+import sys
+import subprocess
+
+SERVICE_DIR = os.path.join(os.path.dirname(__file__), "..", "..")
+
+# The ollama client (httpx + pydantic) is only needed once a message reaches
+# the LLM; importing it at startup slows every worker boot.
+LAZY_MODULES = ("ollama", "httpx", "pydantic")
+
+
+def test_create_app_skips_heavy_imports(log_file):
+    code = (
+        "from llm_service.app import create_app\n"
+        "create_app()\n"
+        "import sys\n"
+        "print(','.join(m for m in %r if m in sys.modules))" % (LAZY_MODULES,)
+    )
+    env = dict(os.environ, LOG_FILE=str(log_file))
+    result = subprocess.run([sys.executable, "-c", code], cwd=SERVICE_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    assert [m for m in result.stdout.strip().split(",") if m] == []
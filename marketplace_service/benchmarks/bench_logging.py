@@ -0,0 +1,76 @@
+"""
+Measure the per-call and per-request cost of the logging pipeline.
+
+    poetry run python benchmarks/bench_logging.py
+
+Compares the old setup (synchronous FileHandler) with the queue-based
+pipeline from logging_config for the same logger call, then times a full
+request through the Flask test client.
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+
+N = 20000
+PHONE = "263777000777"
+
+
+def _reset_root():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def bench_sync(path):
+    _reset_root()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        handlers=[logging.FileHandler(path)]
+    )
+    logger = logging.getLogger("bench")
+    start = time.perf_counter()
+    for _ in range(N):
+        logger.info("Attempting to register seller: %s", PHONE)
+    return (time.perf_counter() - start) / N
+
+
+def bench_queue(path):
+    from marketplace_service import logging_config
+    _reset_root()
+    logging_config.configure_logging(path, "bench")
+    logger = logging.getLogger("bench")
+    start = time.perf_counter()
+    for _ in range(N):
+        logger.info("Attempting to register seller: %s", PHONE)
+    return (time.perf_counter() - start) / N
+
+
+def bench_request():
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    from marketplace_service.app import create_app
+    client = create_app().test_client()
+    client.get("/health")
+    start = time.perf_counter()
+    for _ in range(N // 10):
+        client.get("/health")
+    return (time.perf_counter() - start) / (N // 10)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+    # Keep the console handler's output out of the measurement.
+    stderr, sys.stderr = sys.stderr, open(os.devnull, "w")
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_cost = bench_sync(os.path.join(tmp, "sync.log"))
+        queue_cost = bench_queue(os.path.join(tmp, "queue.log"))
+        request_cost = bench_request()
+        from marketplace_service.logging_config import shutdown_logging
+        shutdown_logging()
+    sys.stderr = stderr
+    print(f"sync FileHandler       : {sync_cost * 1e6:8.2f} us/call")
+    print(f"queue handler          : {queue_cost * 1e6:8.2f} us/call")
+    print(f"GET /health end to end : {request_cost * 1e6:8.2f} us/request")
@@ -0,0 +1,78 @@
+"""
+Measure cold-start cost: module import time and create_app() wall time.
+
+    poetry run python benchmarks/bench_startup.py [--max-import-ms N] [--max-startup-ms N]
+
+Each measurement runs in a fresh interpreter so nothing is already imported.
+Exits non-zero when a threshold is exceeded, so it can gate CI.
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+APP_MODULE = "marketplace_service.app"
+TOP_N = 15
+
+STARTUP_SNIPPET = """
+import time
+start = time.perf_counter()
+from {module} import create_app
+imported = time.perf_counter()
+create_app()
+done = time.perf_counter()
+print((imported - start) * 1000, (done - imported) * 1000)
+"""
+
+
+def _run(args):
+    env = dict(os.environ, DATABASE_URL=os.environ.get("DATABASE_URL", "sqlite://"))
+    return subprocess.run(
+        [sys.executable, *args], cwd=SERVICE_DIR, env=env,
+        capture_output=True, text=True, check=True
+    )
+
+
+def import_profile():
+    """Return [(cumulative ms, module)] from -X importtime, slowest first."""
+    result = _run(["-X", "importtime", "-c", f"import {APP_MODULE}"])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)
+
+
+def startup_times():
+    """Return (import ms, create_app ms) measured in a fresh interpreter."""
+    result = _run(["-c", STARTUP_SNIPPET.format(module=APP_MODULE)])
+    import_ms, create_ms = result.stdout.split()[-2:]
+    return float(import_ms), float(create_ms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-startup-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    print(f"Slowest imports under {APP_MODULE} (cumulative):")
+    for ms, name in [row for row in import_profile() if not row[1].startswith("encodings")][:TOP_N]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    import_ms, create_ms = startup_times()
+    print(f"import {APP_MODULE:<24}: {import_ms:8.1f} ms")
+    print(f"create_app()                        : {create_ms:8.1f} ms")
+    print(f"total                               : {import_ms + create_ms:8.1f} ms")
+
+    failed = False
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"FAIL: import took longer than {args.max_import_ms} ms")
+        failed = True
+    if args.max_startup_ms is not None and import_ms + create_ms > args.max_startup_ms:
+        print(f"FAIL: startup took longer than {args.max_startup_ms} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
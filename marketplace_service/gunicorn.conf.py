@@ -0,0 +1,52 @@
+"""
+Production gunicorn settings. The app is imported once in the master
+(preload_app) and forked into gevent workers; anything holding sockets or
+threads is (re)created per worker in post_fork.
+"""
+import os
+
+# Patch before the app is preloaded so locks and queues created at import
+# time are gevent-aware in the workers.
+from gevent import monkey
+monkey.patch_all()
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+worker_class = "gevent"
+workers = int(os.getenv("GUNICORN_WORKERS", "5"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    # Shared state every worker must see. Without SEMANTIC_INDEX_DIR each worker
+    # builds and searches a private semantic index; without REDIS_URL the
+    # seller cache is per worker and invalidations never reach the others.
+    missing = [name for name in ("SEMANTIC_INDEX_DIR", "REDIS_URL") if not os.getenv(name)]
+    if server.cfg.workers > 1 and missing:
+        server.log.error("%s must be set to run %d workers", " and ".join(missing), server.cfg.workers)
+        raise SystemExit(1)
+
+    # Counters left over from a previous run would otherwise be summed in.
+    metrics_dir = os.getenv("METRICS_DIR")
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            os.unlink(os.path.join(metrics_dir, name))
+
+
+def post_fork(server, worker):
+    from marketplace_service import image_store, logging_config, redis_client
+    from marketplace_service.models.mp_models import db
+
+    logging_config.restart_after_fork()
+    redis_client._client = None
+    image_store.start_pool()
+
+    # Connections opened by the master must not be shared with the children;
+    # close=False leaves them for the parent and starts a fresh pool here.
+    app = server.app.wsgi()
+    with app.app_context():
+        for engine in list(db.engines.values()) + list(app.extensions["db_replicas"].values()):
+            engine.dispose(close=False)
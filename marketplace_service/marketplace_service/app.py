@@ -1,30 +1,33 @@
 import os
 import logging
+import click
 from flask import Flask
-from flask_migrate import Migrate
 
 from marketplace_service.routes import mp_routes
 from marketplace_service.flask_config import Config
+from marketplace_service import metrics, seller_cache, market_stats, sweeper, semantic_index
+from marketplace_service import reconciliation, outbox, seller_summary, derived_store, campaigns
+from marketplace_service import db_routing
+from marketplace_service.logging_config import configure_logging
 from marketplace_service.models.mp_models import db
 
-# Configure logging before creating the app
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('marketplace_service.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
-migrate = Migrate()
+# Flask 3 no longer sets app.config["ENV"]; FLASK_ENV is what docker-compose sets.
+PRODUCTION = os.environ.get("FLASK_ENV") == "production"
+
+def _init_migrate(app):
+    # Flask-Migrate imports Alembic (~0.4 s); only the `flask db` CLI needs it.
+    from flask_migrate import Migrate
+    Migrate(app, db)
 
 def create_app():
+    configure_logging(os.environ.get("LOG_FILE", "marketplace_service.log"), "marketplace_service")
     try:
         logger.info("Initializing Flask application...")
         app = Flask(__name__)
         app.config.from_object(Config)
+        metrics.init_app(app)
 
         # Database configuration
         db_uri = os.environ.get(
@@ -32,29 +35,54 @@ def create_app():
             'sqlite:///' + os.path.join(os.path.dirname(__file__), 'bot_service.db')
         )
         app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
-        logger.info(f"Database URI configured: {db_uri.split('//')[0]}//*****")  # Mask sensitive info
+        app.config['IMAGE_STORE_DIR'] = os.environ.get(
+            'IMAGE_STORE_DIR',
+            os.path.join(os.path.dirname(__file__), 'image_store')
+        )
+        app.config['RECONCILIATION_REPORT_DIR'] = os.environ.get(
+            'RECONCILIATION_REPORT_DIR',
+            os.path.join(os.path.dirname(__file__), 'reconciliation_reports')
+        )
+        # Required by the admin routes (payment reconciliation, campaigns);
+        # they are disabled while it is unset.
+        app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')
+        logger.info("Database URI configured: %s//*****", db_uri.split('//')[0])  # Mask sensitive info
+        db_routing.configure_primary(app, db_uri)
 
         # Initialize extensions
         logger.info("Initializing database extensions...")
         db.init_app(app)
-        migrate.init_app(app, db)
+        if click.get_current_context(silent=True) is not None:
+            _init_migrate(app)
+        db_routing.init_app(app)
+        logger.info("Configured %s read replica(s)", len(app.extensions["db_replicas"]))
+        seller_cache.init_app(app)
+        seller_summary.init_app(app)
+        market_stats.init_app(app)
+        sweeper.init_app(app)
+        semantic_index.init_app(app)
+        reconciliation.init_app(app)
+        outbox.init_app(app)
+        derived_store.init_app(app)
+        campaigns.init_app(app)
         logger.info("Database extensions initialized successfully")
 
-        # Database table creation for non-production environments
-        if app.config.get("ENV") != "production":
+        # Database table creation for non-production environments; production
+        # schema changes go through `flask db upgrade`, never app boot.
+        if not PRODUCTION:
             with app.app_context():
                 logger.info("Non-production environment detected, creating database tables...")
                 try:
                     db.create_all()
                     logger.info("Database tables created successfully")
                 except Exception as e:
-                    logger.error(f"Error creating database tables: {str(e)}")
+                    logger.error("Error creating database tables: %s", e)
                     raise
 
         # Health Route
         @app.route('/')
         def index():
-            logger.info("Root endpoint accessed")
+            logger.info("Root endpoint accessed", extra={"sampled": True})
             return {"message": "Welcome to the Marketplace Service API!"}, 200
 
         # Register routes
@@ -66,7 +94,7 @@ def create_app():
         return app
 
     except Exception as e:
-        logger.critical(f"Failed to initialize Flask application: {str(e)}")
+        logger.critical("Failed to initialize Flask application: %s", e)
         raise
 
 # Configure logging for SQLAlchemy if needed
@@ -0,0 +1,426 @@
+import os
+import time
+import logging
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import requests
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, insert, select, update
+
+from marketplace_service.models.mp_models import (
+    db, Seller, BuyerAlert, Campaign, CampaignRecipient, utc_now
+)
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Campaign Configuration
+# --------------------------------------
+# "stub" records messages instead of sending them; "twilio" sends WhatsApp
+# messages through the Twilio REST API.
+CAMPAIGN_PROVIDER = os.getenv("CAMPAIGN_PROVIDER", "stub")
+# The provider's send limit for the account, shared by all of a sender's threads.
+CAMPAIGN_RATE_PER_SEC = float(os.getenv("CAMPAIGN_RATE_PER_SEC", "10"))
+CAMPAIGN_WORKERS = int(os.getenv("CAMPAIGN_WORKERS", "8"))
+CAMPAIGN_BATCH_SIZE = int(os.getenv("CAMPAIGN_BATCH_SIZE", "500"))
+CAMPAIGN_MAX_ATTEMPTS = int(os.getenv("CAMPAIGN_MAX_ATTEMPTS", "3"))
+# A recipient claimed longer ago than this belongs to a sender that died
+# mid-batch; it is settled before sending resumes.
+CAMPAIGN_CLAIM_TIMEOUT_SEC = int(os.getenv("CAMPAIGN_CLAIM_TIMEOUT_SEC", "300"))
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM", "+14155238886")
+
+AUDIENCES = ("sellers", "paid_sellers", "buyers")
+UNFINISHED = ("draft", "enqueuing", "sending")
+
+
+# --------------------------------------
+# Providers
+# --------------------------------------
+class TransientSendError(Exception):
+    """The provider did not accept the message; it is safe to try again."""
+
+
+class PermanentSendError(Exception):
+    """The provider rejected the message, e.g. for an invalid number."""
+
+
+class SendOutcomeUnknown(Exception):
+    """The request may have reached the provider (e.g. a read timeout), so it is not retried."""
+
+
+class StubProvider:
+    """
+    Records messages instead of sending them, keyed by the send key so a
+    crashed sender's claims can be looked up. Phones in `fail` are rejected;
+    phones in `flaky` fail transiently on their first attempt.
+    """
+
+    name = "stub"
+    supports_lookup = True
+
+    def __init__(self, fail=(), flaky=()):
+        self.fail = set(fail)
+        self.flaky = set(flaky)
+        self.sent = {}
+        self._lock = threading.Lock()
+
+    def send(self, phone, body, key):
+        with self._lock:
+            if phone in self.fail:
+                raise PermanentSendError(f"{phone} is not a WhatsApp number")
+            if phone in self.flaky:
+                self.flaky.discard(phone)
+                raise TransientSendError("429 Too Many Requests")
+            message_id = f"stub-{len(self.sent) + 1}"
+            self.sent[key] = (message_id, phone, body)
+        return message_id
+
+    def lookup(self, key):
+        entry = self.sent.get(key)
+        return entry[0] if entry else None
+
+
+class TwilioProvider:
+    """WhatsApp messages through the Twilio Messages API."""
+
+    name = "twilio"
+    # Twilio has no idempotency key to look a message up by.
+    supports_lookup = False
+
+    def __init__(self, account_sid, auth_token, from_number, timeout=10):
+        self.url = f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}/Messages.json"
+        self.auth = (account_sid, auth_token)
+        self.from_number = from_number
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def send(self, phone, body, key):
+        try:
+            res = self._session.post(self.url, auth=self.auth, timeout=self.timeout, data={
+                "From": f"whatsapp:{self.from_number}",
+                "To": f"whatsapp:+{phone.lstrip('+')}",  # E.164 whether or not the phone kept its +
+                "Body": body
+            })
+        except requests.ConnectionError as e:
+            raise TransientSendError(str(e))
+        except requests.RequestException as e:
+            raise SendOutcomeUnknown(str(e))
+        if res.status_code == 429 or res.status_code >= 500:
+            raise TransientSendError(f"{res.status_code} from Twilio")
+        if res.status_code >= 400:
+            raise PermanentSendError(res.json().get("message", res.text)[:255])
+        return res.json()["sid"]
+
+    def lookup(self, key):
+        return None
+
+
+def _build_provider():
+    if CAMPAIGN_PROVIDER == "twilio":
+        if not (TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN):
+            raise RuntimeError("CAMPAIGN_PROVIDER=twilio needs TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN")
+        return TwilioProvider(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_FROM)
+    if CAMPAIGN_PROVIDER != "stub":
+        raise RuntimeError(f"Unknown CAMPAIGN_PROVIDER: {CAMPAIGN_PROVIDER}")
+    return StubProvider()
+
+
+def get_provider(app=None):
+    return (app or current_app).extensions["campaign_provider"]
+
+
+class RateLimiter:
+    """Token bucket shared by the sender threads: at most `rate` sends per second after a burst of `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve a token even if it has not accrued yet, then wait for it
+            # outside the lock so other threads queue up behind.
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+# --------------------------------------
+# Enqueueing
+# --------------------------------------
+def audience_statement(campaign, cursor=None):
+    """Phones in the campaign's audience after `cursor`, in phone order."""
+    filters = campaign.filters or {}
+    if campaign.audience == "buyers":
+        column = BuyerAlert.phone
+        statement = select(column).where(BuyerAlert.is_active.is_(True), BuyerAlert.is_deleted.isnot(True))
+        if filters.get("location"):
+            statement = statement.where(func.lower(BuyerAlert.location) == filters["location"].lower())
+        if filters.get("product_name"):
+            statement = statement.where(func.lower(BuyerAlert.product_name) == filters["product_name"].lower())
+        statement = statement.distinct()
+    else:
+        column = Seller.phone
+        statement = select(column).where(Seller.is_deleted.isnot(True))
+        if campaign.audience == "paid_sellers":
+            statement = statement.where(Seller.is_paid.is_(True))
+        if filters.get("location"):
+            statement = statement.where(func.lower(Seller.location) == filters["location"].lower())
+    if cursor:
+        statement = statement.where(column > cursor)
+    return statement.order_by(column)
+
+
+def _transition(campaign_id, **values):
+    """
+    UPDATE the campaign unless it has been cancelled, in the same statement,
+    so a concurrent cancel can never be overwritten. Returns whether it did.
+    """
+    result = db.session.execute(
+        update(Campaign).where(Campaign.id == campaign_id, Campaign.status != "cancelled").values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def enqueue(campaign_id, chunk_size=CAMPAIGN_BATCH_SIZE):
+    """
+    Walk the audience in phone order, `chunk_size` phones per keyset query,
+    and add them as pending recipients in one transaction with the enqueue
+    cursor, so an interrupted run resumes after the last committed phone.
+    Stops as soon as the campaign is cancelled. Returns the number of
+    recipients added.
+    """
+    campaign = db.session.get(Campaign, campaign_id)
+    if campaign.enqueued_at is not None or not _transition(campaign_id, status="enqueuing"):
+        db.session.rollback()
+        return 0
+    db.session.commit()
+
+    added, cursor = 0, campaign.enqueue_cursor
+    while True:
+        # Short keyset queries rather than one open cursor: nothing holds a
+        # snapshot or a read lock while the chunks commit.
+        phones = db.session.scalars(audience_statement(campaign, cursor).limit(chunk_size)).all()
+        if not phones:
+            break
+        db.session.execute(insert(CampaignRecipient), [
+            {"campaign_id": campaign_id, "phone": phone, "status": "pending", "attempts": 0}
+            for phone in phones
+        ])
+        if not _transition(campaign_id, enqueue_cursor=phones[-1]):
+            db.session.rollback()
+            logger.info("Campaign %s cancelled while enqueueing", campaign_id)
+            return added
+        db.session.commit()
+        added, cursor = added + len(phones), phones[-1]
+        logger.info("Campaign %s: enqueued %s recipients up to %s", campaign_id, added, cursor)
+
+    if _transition(campaign_id, enqueued_at=utc_now(), status="sending"):
+        db.session.commit()
+    else:
+        db.session.rollback()
+    return added
+
+
+# --------------------------------------
+# Sending
+# --------------------------------------
+def send_key(campaign_id, phone):
+    return f"campaign:{campaign_id}:{phone}"
+
+
+def recover_claims(campaign_id, provider, claim_timeout=CAMPAIGN_CLAIM_TIMEOUT_SEC):
+    """
+    Settle recipients left in `sending` by a sender that stopped before
+    recording the outcome. With a provider that can look messages up they
+    become sent or pending again; otherwise they become unknown, never
+    resent automatically. Returns the number settled.
+    """
+    cutoff = utc_now() - timedelta(seconds=claim_timeout)
+    stale = db.session.query(CampaignRecipient).filter(
+        CampaignRecipient.campaign_id == campaign_id,
+        CampaignRecipient.status == "sending",
+        CampaignRecipient.claimed_at <= cutoff
+    ).with_for_update(skip_locked=True).all()
+    for recipient in stale:
+        message_id = provider.lookup(send_key(campaign_id, recipient.phone)) if provider.supports_lookup else None
+        if message_id:
+            recipient.status, recipient.provider_message_id, recipient.sent_at = "sent", message_id, utc_now()
+        elif provider.supports_lookup:
+            recipient.status = "pending"
+        else:
+            recipient.status, recipient.error = "unknown", "Sender stopped mid-send; delivery unknown"
+    db.session.commit()
+    if stale:
+        logger.warning("Campaign %s: settled %s recipients left by a stopped sender", campaign_id, len(stale))
+    return len(stale)
+
+
+def _claim(campaign_id, size):
+    """Mark up to `size` pending recipients as sending, committed before anything is sent."""
+    recipients = db.session.query(CampaignRecipient).filter(
+        CampaignRecipient.campaign_id == campaign_id,
+        CampaignRecipient.status == "pending"
+    ).order_by(CampaignRecipient.id).limit(size).with_for_update(skip_locked=True).all()
+    now = utc_now()
+    claimed = []
+    for recipient in recipients:
+        recipient.status = "sending"
+        recipient.claimed_at = now
+        recipient.attempts += 1
+        claimed.append((recipient.id, recipient.phone))
+    db.session.commit()
+    return claimed
+
+
+def _deliver(provider, limiter, campaign_id, body, recipient):
+    """Send to one recipient in a worker thread. Returns (recipient id, outcome, message id, error)."""
+    recipient_id, phone = recipient
+    limiter.acquire()
+    try:
+        return recipient_id, "sent", provider.send(phone, body, send_key(campaign_id, phone)), None
+    except TransientSendError as e:
+        return recipient_id, "retry", None, str(e)
+    except PermanentSendError as e:
+        return recipient_id, "failed", None, str(e)
+    except Exception as e:
+        logger.exception("Campaign %s: send to %s ended without a result", campaign_id, phone)
+        return recipient_id, "unknown", None, str(e)
+
+
+def _record(outcomes, max_attempts):
+    recipients = {r.id: r for r in db.session.query(CampaignRecipient).filter(
+        CampaignRecipient.id.in_([outcome[0] for outcome in outcomes]))}
+    now = utc_now()
+    for recipient_id, outcome, message_id, error in outcomes:
+        recipient = recipients[recipient_id]
+        if outcome == "retry":
+            outcome = "pending" if recipient.attempts < max_attempts else "failed"
+        recipient.status = outcome
+        recipient.error = error[:255] if error else None
+        if outcome == "sent":
+            recipient.provider_message_id, recipient.sent_at = message_id, now
+    db.session.commit()
+
+
+def recipient_counts(campaign_id):
+    rows = db.session.query(CampaignRecipient.status, func.count()).filter(
+        CampaignRecipient.campaign_id == campaign_id
+    ).group_by(CampaignRecipient.status).all()
+    return dict(rows)
+
+
+def _finish_if_done(campaign_id):
+    open_recipients = select(CampaignRecipient.id).where(
+        CampaignRecipient.campaign_id == campaign_id,
+        CampaignRecipient.status.in_(("pending", "sending"))
+    ).exists()
+    db.session.execute(
+        update(Campaign).where(Campaign.id == campaign_id, Campaign.status == "sending", ~open_recipients)
+        .values(status="completed", completed_at=utc_now()).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return db.session.get(Campaign, campaign_id).status
+
+
+def cancel(campaign_id):
+    """Cancel unless already completed; a running sender stops after its current batch. Returns whether it did."""
+    result = db.session.execute(
+        update(Campaign).where(Campaign.id == campaign_id, Campaign.status.notin_(("completed", "cancelled")))
+        .values(status="cancelled").execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def send(campaign_id, provider=None, workers=CAMPAIGN_WORKERS, rate=CAMPAIGN_RATE_PER_SEC,
+         batch_size=CAMPAIGN_BATCH_SIZE, max_attempts=CAMPAIGN_MAX_ATTEMPTS,
+         claim_timeout=CAMPAIGN_CLAIM_TIMEOUT_SEC, report=logger.info):
+    """
+    Send to pending recipients through a pool of `workers` threads paced to
+    `rate` messages per second. Each batch is claimed (committed as sending)
+    before any of it is sent, so a crash can never cause a silent resend.
+    Returns the campaign status afterwards.
+    """
+    provider = provider or get_provider()
+    limiter = RateLimiter(rate)
+    body = db.session.get(Campaign, campaign_id).message
+    recover_claims(campaign_id, provider, claim_timeout)
+    started, sent = time.monotonic(), 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="campaign-send") as pool:
+        while db.session.get(Campaign, campaign_id).status != "cancelled":
+            claimed = _claim(campaign_id, batch_size)
+            if not claimed:
+                break
+            outcomes = list(pool.map(lambda r: _deliver(provider, limiter, campaign_id, body, r), claimed))
+            _record(outcomes, max_attempts)
+            sent += sum(1 for outcome in outcomes if outcome[1] == "sent")
+            report(f"Campaign {campaign_id}: {sent} sent this run "
+                   f"({sent / max(time.monotonic() - started, 1e-6):.1f} msg/s)")
+            if any(outcome[1] == "retry" for outcome in outcomes):
+                time.sleep(1)  # the provider is pushing back; let its window pass
+    return _finish_if_done(campaign_id)
+
+
+def run(campaign_id, **send_options):
+    """Enqueue (or finish enqueueing) and send. Safe to run again after a crash."""
+    enqueue(campaign_id, send_options.get("batch_size", CAMPAIGN_BATCH_SIZE))
+    return send(campaign_id, **send_options)
+
+
+# --------------------------------------
+# Campaign CLI
+# --------------------------------------
+campaigns_cli = AppGroup("campaigns", help="Send broadcast campaigns.")
+
+
+@campaigns_cli.command("run")
+@click.argument("campaign_id", required=False)
+@click.option("--workers", default=CAMPAIGN_WORKERS, show_default=True, help="Sender threads.")
+@click.option("--rate", default=CAMPAIGN_RATE_PER_SEC, show_default=True, help="Messages per second.")
+@click.option("--batch-size", default=CAMPAIGN_BATCH_SIZE, show_default=True,
+              help="Recipients enqueued per transaction and claimed per batch.")
+@click.option("--claim-timeout", default=CAMPAIGN_CLAIM_TIMEOUT_SEC, show_default=True,
+              help="Seconds after which another sender's claims are treated as abandoned.")
+def run_command(campaign_id, workers, rate, batch_size, claim_timeout):
+    """Enqueue and send CAMPAIGN_ID, or every unfinished campaign."""
+    if campaign_id:
+        if db.session.get(Campaign, campaign_id) is None:
+            raise click.ClickException(f"No campaign {campaign_id}")
+        ids = [campaign_id]
+    else:
+        ids = db.session.scalars(select(Campaign.id).where(Campaign.status.in_(UNFINISHED))
+                                 .order_by(Campaign.created_at)).all()
+    for cid in ids:
+        status = run(cid, workers=workers, rate=rate, batch_size=batch_size,
+                     claim_timeout=claim_timeout, report=click.echo)
+        click.echo(f"Campaign {cid} is {status}: {recipient_counts(cid)}")
+
+
+@campaigns_cli.command("status")
+@click.argument("campaign_id")
+def status_command(campaign_id):
+    """Show a campaign's delivery counts."""
+    campaign = db.session.get(Campaign, campaign_id)
+    if campaign is None:
+        raise click.ClickException(f"No campaign {campaign_id}")
+    click.echo(f"{campaign.name} ({campaign.audience}) is {campaign.status}: {recipient_counts(campaign_id)}")
+
+
+def init_app(app):
+    app.extensions["campaign_provider"] = _build_provider()
+    app.cli.add_command(campaigns_cli)
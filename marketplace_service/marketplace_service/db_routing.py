@@ -0,0 +1,160 @@
+import os
+import time
+import logging
+import itertools
+from functools import wraps
+
+from flask import current_app, g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import QueuePool
+
+from marketplace_service import metrics
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Replica Routing Configuration
+# --------------------------------------
+# Comma-separated replica URLs; each gets its own engine named replica_<n>.
+DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+# Replicas further behind than this are skipped in favour of the primary.
+REPLICA_MAX_LAG_SEC = float(os.getenv("REPLICA_MAX_LAG_SEC", "5"))
+REPLICA_CHECK_INTERVAL_SEC = float(os.getenv("REPLICA_CHECK_INTERVAL_SEC", "5"))
+
+PG_REPLICA_LAG_SQL = text(
+    "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    bind_name = "default"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.DB_POOL_WAIT.observe(time.perf_counter() - start, self.bind_name)
+
+
+def _timed_pool(bind_name):
+    return type(f"TimedQueuePool_{bind_name}", (TimedQueuePool,), {"bind_name": bind_name})
+
+
+def engine_options(url, bind_name, prefix):
+    """
+    Pool settings for one bind, read from <prefix>POOL_SIZE, <prefix>MAX_OVERFLOW,
+    <prefix>POOL_RECYCLE, <prefix>POOL_TIMEOUT and <prefix>POOL_PRE_PING.
+    """
+    options = {"pool_pre_ping": os.getenv(f"{prefix}POOL_PRE_PING", "true").lower() == "true"}
+    if url.startswith("sqlite") and (url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url):
+        # In-memory SQLite uses a single shared connection, not a sized pool.
+        return options
+    options.update(
+        poolclass=_timed_pool(bind_name),
+        pool_size=int(os.getenv(f"{prefix}POOL_SIZE", "5")),
+        max_overflow=int(os.getenv(f"{prefix}MAX_OVERFLOW", "10")),
+        pool_recycle=int(os.getenv(f"{prefix}POOL_RECYCLE", "1800")),
+        pool_timeout=float(os.getenv(f"{prefix}POOL_TIMEOUT", "30")),
+    )
+    return options
+
+
+def configure_primary(app, primary_url):
+    """Set pool options for the primary. Call before db.init_app()."""
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(primary_url, "default", "DB_")
+
+
+def init_app(app, replica_urls=None):
+    """
+    Create one engine per replica. They are kept out of SQLALCHEMY_BINDS on
+    purpose: no model is bound to them, RoutingSession picks them per query.
+    """
+    if replica_urls is None:
+        replica_urls = DATABASE_REPLICA_URLS
+    app.extensions["db_replicas"] = {
+        f"replica_{i}": create_engine(url, **engine_options(url, f"replica_{i}", "DB_REPLICA_"))
+        for i, url in enumerate(replica_urls)
+    }
+
+
+# --------------------------------------
+# Replica Health
+# --------------------------------------
+class ReplicaRouter:
+    """Round-robins reads over replicas that are reachable and within the lag budget."""
+
+    def __init__(self):
+        self._checked = {}  # bind -> (checked_at, healthy)
+        self._cycle = itertools.count()
+
+    def _healthy(self, bind, engine):
+        checked_at, healthy = self._checked.get(bind, (0.0, False))
+        if time.monotonic() - checked_at < REPLICA_CHECK_INTERVAL_SEC:
+            return healthy
+
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name == "postgresql":
+                    lag = float(conn.execute(PG_REPLICA_LAG_SQL).scalar() or 0)
+                else:
+                    conn.execute(text("SELECT 1"))
+                    lag = 0.0
+            healthy = lag <= REPLICA_MAX_LAG_SEC
+            if not healthy:
+                logger.warning("Replica %s is %.1fs behind, routing reads to primary", bind, lag)
+        except Exception as e:
+            logger.warning("Replica %s unavailable: %s", bind, e)
+            healthy = False
+
+        self._checked[bind] = (time.monotonic(), healthy)
+        return healthy
+
+    def pick(self, replicas):
+        if not replicas:
+            return None
+        binds = list(replicas)
+        start = next(self._cycle)
+        for offset in range(len(binds)):
+            bind = binds[(start + offset) % len(binds)]
+            if self._healthy(bind, replicas[bind]):
+                return replicas[bind]
+        return None
+
+
+router = ReplicaRouter()
+
+
+# --------------------------------------
+# Routing Session
+# --------------------------------------
+def read_only(f):
+    """Let the route's queries go to a replica until it writes something."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.db_read_only = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def _reads_from_replica():
+    return has_request_context() and g.get("db_read_only") and not g.get("db_wrote")
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _reads_from_replica():
+            engine = router.pick(current_app.extensions.get("db_replicas"))
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_written(session, flush_context):
+    # Once a request writes, it reads from the primary so it sees its own writes.
+    if has_request_context():
+        g.db_wrote = True
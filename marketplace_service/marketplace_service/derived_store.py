@@ -0,0 +1,498 @@
+import os
+import json
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import click
+import redis
+from flask.cli import AppGroup
+from sqlalchemy import func, select
+
+from marketplace_service.models.mp_models import db, Listing, Seller, SellerReview
+from marketplace_service.redis_client import get_redis
+from marketplace_service.signals import collect_until_commit, listings_removed
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Derived Store Configuration
+# --------------------------------------
+# Exact-match search lookups and seller profiles are copied into Redis under a
+# versioned prefix. Readers follow CURRENT_KEY, so `flask derived rebuild`
+# fills a new version and swaps the pointer with one SET. Without REDIS_URL,
+# or before the first build, every reader uses SQL.
+KEY_ROOT = "marketplace:derived"
+CURRENT_KEY = f"{KEY_ROOT}:current"
+BUILDING_KEY = f"{KEY_ROOT}:building"
+VERSION_COUNTER_KEY = f"{KEY_ROOT}:version"
+DERIVED_BATCH_SIZE = int(os.getenv("DERIVED_BATCH_SIZE", "5000"))
+DERIVED_CHECKPOINT_PATH = os.getenv("DERIVED_CHECKPOINT_PATH", "derived_rebuild.json")
+# Keys of a replaced version expire after this, so a reader that fetched the
+# old pointer just before the swap still finds its data.
+OLD_VERSION_GRACE_SEC = int(os.getenv("DERIVED_OLD_VERSION_GRACE_SEC", "60"))
+SEARCH_LIMIT = 20
+SYNC_CHUNK = 500
+
+LISTING_COLUMNS = (Listing.id, Listing.product_name, Listing.quantity, Listing.quantity_amount,
+                   Listing.quantity_unit, Listing.price, Listing.location, Listing.seller_phone,
+                   Listing.created_at)
+LIVE_LISTING = (Listing.is_active.is_(True), Listing.is_deleted.isnot(True))
+
+
+# --------------------------------------
+# Keys
+# --------------------------------------
+def prefix(version):
+    return f"{KEY_ROOT}:v{version}:"
+
+
+def listing_key(version, listing_id):
+    return f"{prefix(version)}listing:{listing_id}"
+
+
+def seller_key(version, phone):
+    return f"{prefix(version)}seller:{phone}"
+
+
+def search_key(version, product, location=None):
+    """Sorted set of live listing ids for lower(product) [and lower(location)], scored by created_at."""
+    key = f"{prefix(version)}search:{product.lower()}"
+    if location is not None:
+        # \x1f never appears in a product name, so the two parts cannot run together.
+        key += f"\x1f{location.lower()}"
+    return key
+
+
+def dirty_key(version):
+    return f"{prefix(version)}dirty"
+
+
+def _search_keys(version, product_name, location):
+    keys = [search_key(version, product_name)]
+    if location is not None:
+        keys.append(search_key(version, product_name, location))
+    return keys
+
+
+# --------------------------------------
+# Writing Rows
+# --------------------------------------
+def _in_range(column, lo, hi):
+    clauses = []
+    if lo is not None:
+        clauses.append(column >= lo)
+    if hi is not None:
+        clauses.append(column < hi)
+    return clauses
+
+
+def seller_statement(lo=None, hi=None, phones=None):
+    """Live sellers with their review count and rating sum, optionally limited to a phone range or list."""
+    review_filter = _in_range(SellerReview.seller_phone, lo, hi)
+    seller_filter = _in_range(Seller.phone, lo, hi)
+    if phones is not None:
+        review_filter.append(SellerReview.seller_phone.in_(phones))
+        seller_filter.append(Seller.phone.in_(phones))
+    ratings = select(
+        SellerReview.seller_phone,
+        func.count(SellerReview.id).label("rating_count"),
+        func.sum(SellerReview.rating).label("rating_sum"),
+    ).where(*review_filter).group_by(SellerReview.seller_phone).subquery()
+    return select(
+        Seller.phone, Seller.business_name, Seller.location, Seller.is_paid, Seller.is_verified,
+        Seller.subscription_type,
+        func.coalesce(ratings.c.rating_count, 0).label("rating_count"),
+        func.coalesce(ratings.c.rating_sum, 0).label("rating_sum"),
+    ).outerjoin(ratings, ratings.c.seller_phone == Seller.phone).where(
+        Seller.is_deleted.isnot(True), *seller_filter
+    )
+
+
+def _add_listing(pipe, version, row):
+    pipe.set(listing_key(version, row.id), json.dumps({
+        "id": row.id,
+        "product_name": row.product_name,
+        "quantity": row.quantity,
+        "quantity_amount": float(row.quantity_amount) if row.quantity_amount is not None else None,
+        "quantity_unit": row.quantity_unit,
+        "price": float(row.price) if row.price is not None else None,
+        "location": row.location,
+        "seller_phone": row.seller_phone
+    }))
+    score = row.created_at.timestamp() if row.created_at else 0
+    for key in _search_keys(version, row.product_name, row.location):
+        pipe.zadd(key, {row.id: score})
+
+
+def _add_seller(pipe, version, row):
+    count = int(row.rating_count)
+    pipe.set(seller_key(version, row.phone), json.dumps({
+        "phone": row.phone,
+        "business_name": row.business_name,
+        "location": row.location,
+        "is_paid": bool(row.is_paid),
+        "is_verified": bool(row.is_verified),
+        "subscription_type": row.subscription_type,
+        "rating_count": count,
+        "average_rating": round(int(row.rating_sum) / count, 2) if count else 0
+    }))
+
+
+def _chunks(items, size=SYNC_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def sync_listings(client, version, listing_ids):
+    """Make `version` match the database for these listings, dropping ones no longer live."""
+    for ids in _chunks(listing_ids):
+        previous = client.mget([listing_key(version, i) for i in ids])
+        # A separate connection: this also runs from after_commit, where the
+        # session cannot emit SQL.
+        with db.engine.connect() as conn:
+            live = {row.id: row for row in conn.execute(
+                select(*LISTING_COLUMNS).where(Listing.id.in_(ids), *LIVE_LISTING))}
+        pipe = client.pipeline(transaction=False)
+        for listing_id, old in zip(ids, previous):
+            if old:
+                old = json.loads(old)
+                for key in _search_keys(version, old["product_name"], old["location"]):
+                    pipe.zrem(key, listing_id)
+            if listing_id in live:
+                _add_listing(pipe, version, live[listing_id])
+            else:
+                pipe.delete(listing_key(version, listing_id))
+        pipe.execute()
+
+
+def sync_sellers(client, version, phones):
+    """Make `version` match the database for these sellers, dropping deleted ones."""
+    for chunk in _chunks(phones):
+        with db.engine.connect() as conn:
+            live = {row.phone: row for row in conn.execute(seller_statement(phones=chunk))}
+        pipe = client.pipeline(transaction=False)
+        for phone in chunk:
+            if phone in live:
+                _add_seller(pipe, version, live[phone])
+            else:
+                pipe.delete(seller_key(version, phone))
+        pipe.execute()
+
+
+# --------------------------------------
+# Reading
+# --------------------------------------
+def _current_version(client):
+    version = client.get(CURRENT_KEY)
+    return int(version) if version else None
+
+
+def search(product, location=None, limit=SEARCH_LIMIT):
+    """
+    Newest live listings whose product (and location, if given) match
+    case-insensitively, as /listings/search returns them. None means there is
+    no built version to read and the caller should query the database.
+    """
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        version = _current_version(client)
+        if version is None:
+            return None
+        ids = client.zrevrange(search_key(version, product, location or None), 0, limit - 1)
+        if not ids:
+            return []
+        docs = client.mget([listing_key(version, i) for i in ids])
+    except redis.RedisError:
+        logger.warning("Derived store unavailable, searching the database")
+        return None
+    return [json.loads(doc) for doc in docs if doc]
+
+
+def get_seller(phone):
+    """The stored seller profile with rating aggregates, or None if not stored (or no Redis)."""
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        version = _current_version(client)
+        doc = client.get(seller_key(version, phone)) if version is not None else None
+    except redis.RedisError:
+        logger.warning("Derived store unavailable, loading seller %s from the database", phone)
+        return None
+    return json.loads(doc) if doc else None
+
+
+# --------------------------------------
+# Incremental Maintenance
+# --------------------------------------
+def refresh(listing_ids=(), seller_phones=()):
+    """
+    Copy the committed state of these rows into the current version, and mark
+    them for a version being built so the rebuild re-reads them before its
+    swap. Call after the change has committed; bulk UPDATE paths must call it
+    themselves, before invalidating the seller cache that reads from here.
+    """
+    client = get_redis()
+    if client is None or not (listing_ids or seller_phones):
+        return
+    try:
+        current, building = client.mget(CURRENT_KEY, BUILDING_KEY)
+        if current:
+            sync_listings(client, int(current), listing_ids)
+            sync_sellers(client, int(current), seller_phones)
+        if building:
+            client.sadd(dirty_key(int(building)), *[f"listing:{i}" for i in listing_ids],
+                        *[f"seller:{p}" for p in seller_phones])
+    except Exception:
+        # Reads serve slightly stale data; `flask derived rebuild` restores it.
+        logger.exception("Failed to refresh derived data for %s listings and %s sellers",
+                         len(listing_ids), len(seller_phones))
+
+
+def _collect_changes(session, pending):
+    if get_redis() is None:
+        return
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Listing):
+            pending["listings"].add(obj.id)
+        elif isinstance(obj, Seller):
+            pending["sellers"].add(obj.phone)
+        elif isinstance(obj, SellerReview):
+            pending["sellers"].add(obj.seller_phone)
+
+
+def _refresh_committed(pending):
+    refresh(pending["listings"], pending["sellers"])
+
+
+collect_until_commit("derived_pending", _collect_changes, _refresh_committed,
+                     factory=lambda: {"listings": set(), "sellers": set()})
+
+
+@listings_removed.connect
+def _on_listings_removed(sender, listing_ids=(), **kwargs):
+    refresh(listing_ids=list(listing_ids))
+
+
+# --------------------------------------
+# Rebuild
+# --------------------------------------
+SOURCES = {"listings": Listing.id, "sellers": Seller.phone}
+
+
+def plan_partitions(parts):
+    """
+    Split each source table into up to `parts` primary-key ranges holding
+    roughly equal row counts. Each cut point is one index-ordered OFFSET
+    query, cheap next to the copy itself.
+    """
+    plan = []
+    for source, column in SOURCES.items():
+        total = db.session.scalar(select(func.count()).select_from(column.table))
+        cuts = []
+        for i in range(1, parts if total else 1):
+            cut = db.session.scalar(select(column).order_by(column).offset(total * i // parts).limit(1))
+            if cut is not None and (not cuts or cut > cuts[-1]):
+                cuts.append(cut)
+        bounds = [None, *cuts, None]
+        plan.extend({"name": f"{source}:{n}", "source": source, "lo": lo, "hi": hi}
+                    for n, (lo, hi) in enumerate(zip(bounds, bounds[1:])))
+    return plan
+
+
+def build_partition(client, version, source, lo, hi, batch_size=DERIVED_BATCH_SIZE):
+    """
+    Stream one key range through a server-side cursor and write it under
+    `version`, one pipeline per fetched batch. Returns the rows written.
+    """
+    if source == "listings":
+        statement = select(*LISTING_COLUMNS).where(*LIVE_LISTING, *_in_range(Listing.id, lo, hi))
+        write = _add_listing
+    else:
+        statement = seller_statement(lo, hi)
+        write = _add_seller
+    written = 0
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    for rows in result.partitions():
+        pipe = client.pipeline(transaction=False)
+        for row in rows:
+            write(pipe, version, row)
+        pipe.execute()
+        written += len(rows)
+    db.session.rollback()
+    return written
+
+
+_worker_app = None
+
+
+def _init_worker():
+    global _worker_app
+    from marketplace_service.app import create_app
+    _worker_app = create_app()
+
+
+def _run_partition(version, source, lo, hi, batch_size):
+    with _worker_app.app_context():
+        return build_partition(get_redis(), version, source, lo, hi, batch_size)
+
+
+def _run_partitions(client, version, partitions, workers, batch_size):
+    """Yield (name, rows written) as partitions finish."""
+    if workers <= 1:
+        for p in partitions:
+            yield p["name"], build_partition(client, version, p["source"], p["lo"], p["hi"], batch_size)
+        return
+    # Spawned, not forked: each worker opens its own database and Redis
+    # connections instead of inheriting the parent's sockets.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker) as pool:
+        futures = {pool.submit(_run_partition, version, p["source"], p["lo"], p["hi"], batch_size): p["name"]
+                   for p in partitions}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def _catch_up(client, version):
+    """Re-copy rows committed while `version` was building; their partition may have read them earlier."""
+    total = 0
+    while True:
+        members = client.spop(dirty_key(version), SYNC_CHUNK)
+        if not members:
+            return total
+        kinds = {"listing": [], "seller": []}
+        for member in members:
+            kind, _, key = member.partition(":")
+            kinds[kind].append(key)
+        sync_listings(client, version, kinds["listing"])
+        sync_sellers(client, version, kinds["seller"])
+        total += len(members)
+
+
+def _expire_version(client, version, seconds):
+    pipe = client.pipeline(transaction=False)
+    for n, key in enumerate(client.scan_iter(match=f"{prefix(version)}*", count=1000), 1):
+        if seconds:
+            pipe.expire(key, seconds)
+        else:
+            pipe.unlink(key)
+        if n % 1000 == 0:
+            pipe.execute()
+    pipe.execute()
+
+
+def _load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_checkpoint(path, checkpoint):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def rebuild(client, workers=1, parts=None, batch_size=DERIVED_BATCH_SIZE,
+            checkpoint_path=DERIVED_CHECKPOINT_PATH, resume=False, report=logger.info):
+    """
+    Build a new version of the derived data from the database and make it
+    current. Finished partitions are recorded in the checkpoint file after
+    each one, so `resume` continues an interrupted build of the same
+    version. Returns {"version", "rows", "refreshed"}.
+    """
+    checkpoint = _load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint and client.get(BUILDING_KEY) != str(checkpoint["version"]):
+        report(f"Version {checkpoint['version']} is no longer being built, starting over")
+        checkpoint = None
+    if checkpoint is None:
+        abandoned = client.get(BUILDING_KEY)
+        if abandoned:
+            _expire_version(client, int(abandoned), 0)
+        version = client.incr(VERSION_COUNTER_KEY)
+        # From here on, commits mark their rows dirty for this version.
+        client.set(BUILDING_KEY, version)
+        checkpoint = {"version": version, "partitions": plan_partitions(parts or workers * 4), "done": {}}
+        _save_checkpoint(checkpoint_path, checkpoint)
+    else:
+        report(f"Resuming version {checkpoint['version']}: "
+               f"{len(checkpoint['done'])}/{len(checkpoint['partitions'])} partitions done")
+
+    version = checkpoint["version"]
+    todo = [p for p in checkpoint["partitions"] if p["name"] not in checkpoint["done"]]
+    started, rows = time.monotonic(), 0
+    for name, written in _run_partitions(client, version, todo, workers, batch_size):
+        checkpoint["done"][name] = written
+        _save_checkpoint(checkpoint_path, checkpoint)
+        rows += written
+        rate = rows / max(time.monotonic() - started, 1e-6)
+        report(f"[{len(checkpoint['done'])}/{len(checkpoint['partitions'])}] {name}: {written} rows "
+               f"({rows} this run, {rate:.0f} rows/s)")
+
+    refreshed = _catch_up(client, version)
+    previous = client.get(CURRENT_KEY)
+    client.set(CURRENT_KEY, version)
+    client.delete(BUILDING_KEY)
+    # Commits between the first catch-up and the swap were only marked dirty.
+    refreshed += _catch_up(client, version)
+    if previous and int(previous) != version:
+        _expire_version(client, int(previous), OLD_VERSION_GRACE_SEC)
+    os.remove(checkpoint_path)
+    return {"version": version, "rows": sum(checkpoint["done"].values()), "refreshed": refreshed}
+
+
+# --------------------------------------
+# Derived Store CLI
+# --------------------------------------
+derived_cli = AppGroup("derived", help="Rebuild the Redis copies of search lookups and seller profiles.")
+
+
+def _require_redis():
+    client = get_redis()
+    if client is None:
+        raise click.ClickException("REDIS_URL is not set")
+    return client
+
+
+@derived_cli.command("rebuild")
+@click.option("--workers", default=4, show_default=True, help="Processes reading partitions in parallel.")
+@click.option("--partitions", type=int, default=None, help="Key ranges per table. [default: 4 per worker]")
+@click.option("--batch-size", default=DERIVED_BATCH_SIZE, show_default=True,
+              help="Rows per server-side fetch and per Redis pipeline.")
+@click.option("--checkpoint", "checkpoint_path", default=DERIVED_CHECKPOINT_PATH, show_default=True)
+@click.option("--resume", is_flag=True, help="Continue the build recorded in the checkpoint.")
+def rebuild_command(workers, partitions, batch_size, checkpoint_path, resume):
+    """Copy listings, sellers and ratings into a new version and swap it in."""
+    client = _require_redis()
+    started = time.monotonic()
+    result = rebuild(client, workers=workers, parts=partitions, batch_size=batch_size,
+                     checkpoint_path=checkpoint_path, resume=resume, report=click.echo)
+    click.echo(f"Version {result['version']} is live: {result['rows']} rows in "
+               f"{time.monotonic() - started:.1f}s, {result['refreshed']} re-read after concurrent writes")
+
+
+@derived_cli.command("status")
+@click.option("--checkpoint", "checkpoint_path", default=DERIVED_CHECKPOINT_PATH, show_default=True)
+def status(checkpoint_path):
+    """Show the live and in-progress versions."""
+    client = _require_redis()
+    current, building = client.mget(CURRENT_KEY, BUILDING_KEY)
+    click.echo(f"Current version: {current or 'none'}")
+    if building:
+        click.echo(f"Building version {building}: {client.scard(dirty_key(int(building)))} rows changed since it started")
+    checkpoint = _load_checkpoint(checkpoint_path)
+    if checkpoint:
+        click.echo(f"Checkpoint for version {checkpoint['version']}: {len(checkpoint['done'])}/"
+                   f"{len(checkpoint['partitions'])} partitions, {sum(checkpoint['done'].values())} rows")
+
+
+def init_app(app):
+    app.cli.add_command(derived_cli)
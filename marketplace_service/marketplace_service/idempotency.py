@@ -0,0 +1,139 @@
+import os
+import hashlib
+import logging
+from datetime import timedelta
+from functools import wraps
+
+from flask import current_app, jsonify, make_response, request
+from sqlalchemy import and_, delete, or_
+from sqlalchemy.exc import IntegrityError
+
+from marketplace_service.models.mp_models import db, IdempotencyKey, utc_now
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Idempotency Configuration
+# --------------------------------------
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# Stored responses are replayed for this long, then the key may be reused.
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+# A claim still unfinished after this long is treated as abandoned (worker died).
+IDEMPOTENCY_LOCK_TIMEOUT_SEC = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT_SEC", "60"))
+MAX_KEY_LENGTH = 255
+
+
+def _fingerprint():
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    if request.is_json:
+        digest.update(request.get_data(cache=True))
+    else:
+        # Uploads are streamed to disk; never buffer them just to hash them.
+        digest.update(str(request.content_length).encode())
+    return digest.hexdigest()
+
+
+def _expired(key):
+    """Delete `key` if its stored response expired or its claim was abandoned."""
+    now = utc_now()
+    removed = db.session.execute(delete(IdempotencyKey).where(
+        IdempotencyKey.key == key,
+        or_(IdempotencyKey.created_at < now - timedelta(hours=IDEMPOTENCY_TTL_HOURS),
+            and_(IdempotencyKey.status_code.is_(None),
+                 IdempotencyKey.created_at < now - timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT_SEC)))
+    ).execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    return bool(removed)
+
+
+def _claim(key, fingerprint):
+    """
+    Insert the key as in flight. Returns None when this request now owns the
+    key, otherwise the existing row. The claim commits on its own so a
+    concurrent duplicate sees it before the route has done anything.
+    """
+    for _ in range(2):
+        db.session.add(IdempotencyKey(key=key, method=request.method, path=request.path, request_hash=fingerprint))
+        try:
+            db.session.commit()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+        existing = db.session.get(IdempotencyKey, key)
+        if existing is not None:
+            if not _expired(key):
+                return existing
+            db.session.expunge(existing)
+    return db.session.get(IdempotencyKey, key)
+
+
+def _release(key):
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+    db.session.commit()
+
+
+def _complete(key, response):
+    record = db.session.get(IdempotencyKey, key)
+    record.status_code = response.status_code
+    record.response_body = response.get_data(as_text=True)
+    record.completed_at = utc_now()
+    db.session.commit()
+
+
+def _replay(record):
+    response = current_app.response_class(record.response_body, status=record.status_code,
+                                          mimetype="application/json")
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(f):
+    """
+    Honour an Idempotency-Key header on a write route: the first request runs
+    and its response is stored; a retry with the same key and body gets the
+    stored response instead of writing again. Server errors are not stored,
+    so those retries run again. Without the header the route runs as usual.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({"error": f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters"}), 400
+
+        fingerprint = _fingerprint()
+        existing = _claim(key, fingerprint)
+        if existing is not None:
+            if existing.status_code is None:
+                response = jsonify({"error": "A request with this Idempotency-Key is still in progress"})
+                response.headers["Retry-After"] = "1"
+                return response, 409
+            if existing.request_hash != fingerprint:
+                logger.warning("Idempotency key %s reused for a different request", key)
+                return jsonify({"error": f"{IDEMPOTENCY_HEADER} was already used for a different request"}), 422
+            logger.info("Replaying stored response for idempotency key %s", key)
+            return _replay(existing)
+
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            _release(key)
+            raise
+        if response.status_code >= 500:
+            _release(key)
+        else:
+            _complete(key, response)
+        return response
+    return decorated_function
+
+
+def prune_expired(older_than_hours=IDEMPOTENCY_TTL_HOURS):
+    cutoff = utc_now() - timedelta(hours=older_than_hours)
+    deleted = db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    logger.info("Pruned %s expired idempotency keys", deleted)
+    return deleted
@@ -0,0 +1,166 @@
+import os
+import hashlib
+import logging
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from marketplace_service.models.mp_models import db, ListingImage
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Image Store Configuration
+# --------------------------------------
+IMAGE_CHUNK_SIZE = 64 * 1024
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+# Longest edge in pixels for each generated variant. WhatsApp recompresses
+# anything larger than ~1600px, and 320px is enough for a list preview.
+IMAGE_VARIANTS = {"thumb": 320, "medium": 800, "large": 1600}
+VARIANT_QUALITY = 80
+
+# Magic numbers for the formats phones send.
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+)
+
+
+class UnsupportedImage(ValueError):
+    pass
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def sniff_content_type(head):
+    for signature, content_type in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def blob_path(store_dir, content_hash):
+    return os.path.join(store_dir, content_hash[:2], content_hash[2:4], content_hash)
+
+
+def store_stream(stream, store_dir, max_bytes=IMAGE_MAX_BYTES):
+    """
+    Copy `stream` into the content-addressed store chunk by chunk, hashing as
+    it goes. Returns (sha256 hex, size, content type, deduplicated).
+    """
+    tmp_dir = os.path.join(store_dir, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    content_type = None
+
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(IMAGE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if content_type is None:
+                    content_type = sniff_content_type(chunk)
+                    if content_type is None:
+                        raise UnsupportedImage("Unsupported image format")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImageTooLarge(f"Image exceeds {max_bytes} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+
+        if size == 0:
+            raise UnsupportedImage("Empty upload")
+
+        content_hash = digest.hexdigest()
+        final_path = blob_path(store_dir, content_hash)
+        if os.path.exists(final_path):
+            os.unlink(tmp_path)
+            return content_hash, size, content_type, True
+
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(tmp_path, final_path)
+        return content_hash, size, content_type, False
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+# --------------------------------------
+# Variant Generation
+# --------------------------------------
+def make_variants(store_dir, content_hash):
+    """
+    Resize the original into each of IMAGE_VARIANTS and store the results
+    content-addressed. Runs in a worker process; returns {variant: hash}.
+    """
+    from PIL import Image, ImageOps
+
+    variants = {}
+    with Image.open(blob_path(store_dir, content_hash)) as original:
+        original = ImageOps.exif_transpose(original).convert("RGB")
+        for name, edge in IMAGE_VARIANTS.items():
+            if max(original.size) <= edge and variants:
+                # Never upscale; reuse the previous (smaller) variant.
+                variants[name] = variants[list(variants)[-1]]
+                continue
+            resized = original.copy()
+            resized.thumbnail((edge, edge))
+            with tempfile.SpooledTemporaryFile(max_size=2 * 1024 * 1024) as buf:
+                resized.save(buf, format="JPEG", quality=VARIANT_QUALITY, optimize=True)
+                buf.seek(0)
+                variants[name] = store_stream(buf, store_dir)[0]
+    return variants
+
+
+_pool = None
+_pool_pid = None
+
+
+def start_pool():
+    """
+    Create this process's variant pool. gunicorn calls it from post_fork;
+    outside gunicorn the first upload does.
+    """
+    global _pool, _pool_pid
+    # Spawned, not forked: a fork of a gevent-patched worker would inherit
+    # its hub, locks and sockets mid-use.
+    _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    _pool_pid = os.getpid()
+
+
+def _get_pool():
+    if _pool is None or _pool_pid != os.getpid():
+        start_pool()
+    return _pool
+
+
+def schedule_variants(app, image_id, store_dir, content_hash):
+    """Generate variants off the request path and record them on the image."""
+    future = _get_pool().submit(make_variants, store_dir, content_hash)
+
+    def _record(done):
+        try:
+            variants = done.result()
+        except Exception:
+            logger.exception("Variant generation failed for image %s", image_id)
+            return
+        with app.app_context():
+            image = db.session.get(ListingImage, image_id)
+            if image is not None:
+                image.variants = variants
+                db.session.commit()
+            logger.info("Recorded %s variants for image %s", len(variants), image_id)
+
+    future.add_done_callback(_record)
+    return future
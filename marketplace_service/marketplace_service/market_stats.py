@@ -0,0 +1,311 @@
+import math
+import logging
+from datetime import datetime, time, timedelta
+from types import SimpleNamespace
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, insert, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from marketplace_service.models.mp_models import db, Listing, MarketPriceStat, utc_now
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Quantile Sketch
+# --------------------------------------
+# Log-bucketed sketch (DDSketch style): every price maps to the bucket
+# ceil(log_gamma(price)), so any quantile is within SKETCH_ACCURACY relative
+# error. Sketches are plain {bucket: count} dicts, merge by adding counts and
+# support removal, which is what lets deactivations be applied incrementally.
+SKETCH_ACCURACY = 0.01
+_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+_ZERO_BUCKET = "z"
+
+MAX_SUMMARY_DAYS = 90
+
+
+def _bucket(value):
+    if value <= 0:
+        return _ZERO_BUCKET
+    return str(math.ceil(math.log(value) / _LOG_GAMMA))
+
+
+def _bucket_value(key):
+    if key == _ZERO_BUCKET:
+        return 0.0
+    return 2 * _GAMMA ** int(key) / (_GAMMA + 1)
+
+
+def sketch_add(sketch, value, count=1):
+    key = _bucket(value)
+    remaining = sketch.get(key, 0) + count
+    if remaining > 0:
+        sketch[key] = remaining
+    else:
+        sketch.pop(key, None)
+    return sketch
+
+
+def sketch_merge(into, other):
+    for key, count in other.items():
+        into[key] = into.get(key, 0) + count
+    return into
+
+
+def sketch_quantile(sketch, q):
+    total = sum(sketch.values())
+    if not total:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for key in sorted(sketch, key=lambda k: -math.inf if k == _ZERO_BUCKET else int(k)):
+        seen += sketch[key]
+        if seen > rank:
+            return round(_bucket_value(key), 2)
+
+
+# --------------------------------------
+# Rollup Keys
+# --------------------------------------
+def stat_key(product, district, day):
+    return ((product or "").strip().lower(), (district or "").strip().lower(), day)
+
+
+def _listing_key(listing):
+    created = listing.created_at or utc_now()
+    return stat_key(listing.product_name, listing.location, created.date())
+
+
+def _counts(listing):
+    # Column defaults are only applied at INSERT, so None means "default" here.
+    return listing.is_active is not False and not listing.is_deleted and listing.price is not None
+
+
+# Listing attributes that decide whether and where a listing is counted.
+_TRACKED = ("product_name", "location", "price", "created_at", "is_active", "is_deleted")
+
+
+def _previous(listing):
+    """The listing's tracked attributes as loaded, before this flush's changes."""
+    state = inspect(listing)
+    values = {"id": listing.id}
+    for name in _TRACKED:
+        deleted = state.attrs[name].history.deleted
+        values[name] = deleted[0] if deleted else getattr(listing, name)
+    return SimpleNamespace(**values)
+
+
+# --------------------------------------
+# Incremental Maintenance
+# --------------------------------------
+def _apply(session, listing, sign, pending):
+    key = _listing_key(listing)
+    price = float(listing.price)
+
+    stat = pending.get(key)
+    if stat is None:
+        if sign > 0:
+            _insert_if_missing(session, key)
+        stat = session.get(MarketPriceStat, key, with_for_update=True)
+        if stat is None:
+            return
+    pending[key] = stat
+
+    stat.count += sign
+    stat.total = float(stat.total or 0) + sign * price
+    # Reassign so the JSON column is flagged as modified.
+    stat.sketch = sketch_add(dict(stat.sketch or {}), price, sign)
+
+    # Emptied rows are deleted once the whole flush is applied, since an edit
+    # may add the listing back to the same row.
+    if stat.count <= 0:
+        stat.min_price = stat.max_price = None
+        return
+    if sign > 0:
+        stat.min_price = price if stat.min_price is None else min(float(stat.min_price), price)
+        stat.max_price = price if stat.max_price is None else max(float(stat.max_price), price)
+    elif stat.min_price is None or price <= float(stat.min_price) or price >= float(stat.max_price):
+        # The removed listing held an extreme; recompute it from that day's rows.
+        _recompute_extremes(session, stat, exclude_id=listing.id)
+
+
+def _insert_if_missing(session, key):
+    """
+    Make sure the day's row exists so the row lock in _apply has something to
+    lock. Two first listings for a key racing on a plain INSERT would end in
+    a unique violation; ON CONFLICT DO NOTHING waits for the other insert and
+    then leaves its row alone.
+    """
+    values = {"product": key[0], "district": key[1], "day": key[2], "count": 0, "total": 0, "sketch": {}}
+    conn = session.connection()
+    dialect = conn.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        module = postgresql if dialect == "postgresql" else sqlite
+        conn.execute(module.insert(MarketPriceStat).values(**values).on_conflict_do_nothing())
+    elif dialect in ("mysql", "mariadb"):
+        conn.execute(insert(MarketPriceStat).values(**values).prefix_with("IGNORE"))
+    else:
+        try:
+            with conn.begin_nested():
+                conn.execute(insert(MarketPriceStat).values(**values))
+        except IntegrityError:
+            pass
+
+
+def _recompute_extremes(session, stat, exclude_id):
+    day_start = datetime.combine(stat.day, time.min)
+    low, high = session.query(db.func.min(Listing.price), db.func.max(Listing.price)).filter(
+        db.func.lower(db.func.trim(Listing.product_name)) == stat.product,
+        db.func.lower(db.func.trim(Listing.location)) == stat.district,
+        Listing.created_at >= day_start,
+        Listing.created_at < day_start + timedelta(days=1),
+        Listing.is_active.is_(True),
+        Listing.is_deleted.isnot(True),
+        Listing.id != exclude_id
+    ).one()
+    stat.min_price = low
+    stat.max_price = high
+
+
+@event.listens_for(Session, "before_flush")
+def _track_listing_changes(session, flush_context, instances):
+    pending = {}
+    for obj in list(session.new):
+        if isinstance(obj, Listing) and _counts(obj):
+            _apply(session, obj, +1, pending)
+
+    for obj in list(session.dirty):
+        if not isinstance(obj, Listing):
+            continue
+        before = _previous(obj)
+        counted_before, counted_now = _counts(before), _counts(obj)
+        if (counted_before and counted_now and _listing_key(before) == _listing_key(obj)
+                and float(before.price) == float(obj.price)):
+            continue
+        # Deactivations, reactivations and edits of price, product, location
+        # or day: take the old values out, then put the new ones in.
+        if counted_before:
+            _apply(session, before, -1, pending)
+        if counted_now:
+            _apply(session, obj, +1, pending)
+
+    for stat in pending.values():
+        if stat.count <= 0:
+            session.delete(stat)
+
+
+# --------------------------------------
+# Queries
+# --------------------------------------
+def price_summary(product, district, days=30):
+    """Merge the daily rollups of the last `days` days into one summary."""
+    days = max(1, min(days, MAX_SUMMARY_DAYS))
+    product, district, today = stat_key(product, district, utc_now().date())
+    rows = MarketPriceStat.query.filter(
+        MarketPriceStat.product == product,
+        MarketPriceStat.district == district,
+        MarketPriceStat.day > today - timedelta(days=days)
+    ).all()
+
+    count = sum(r.count for r in rows)
+    if not count:
+        return {"product": product, "district": district, "days": days, "count": 0}
+
+    sketch = {}
+    for r in rows:
+        sketch_merge(sketch, r.sketch or {})
+
+    return {
+        "product": product,
+        "district": district,
+        "days": days,
+        "count": count,
+        "min": float(min(r.min_price for r in rows)),
+        "max": float(max(r.max_price for r in rows)),
+        "mean": round(sum(float(r.total) for r in rows) / count, 2),
+        "median": sketch_quantile(sketch, 0.5),
+        "p25": sketch_quantile(sketch, 0.25),
+        "p75": sketch_quantile(sketch, 0.75)
+    }
+
+
+# --------------------------------------
+# Backfill CLI
+# --------------------------------------
+stats_cli = AppGroup("market-stats", help="Maintain market price rollups.")
+
+
+def _lock_rollups(session):
+    """
+    Hold off the flush hook until the rebuild commits. A listing written
+    meanwhile then waits and is applied on top of the rebuilt rows, instead of
+    being counted by both. Readers keep the old rows until the commit.
+    """
+    if session.connection().dialect.name == "postgresql":
+        # EXCLUSIVE blocks writers, including the hook's SELECT ... FOR UPDATE, but not readers.
+        session.execute(text(f"LOCK TABLE {MarketPriceStat.__tablename__} IN EXCLUSIVE MODE"))
+    # SQLite: the DELETE that follows takes the database write lock for the
+    # rest of the transaction.
+
+
+@stats_cli.command("backfill")
+@click.option("--chunk-size", default=1000, show_default=True, help="Listings read per batch.")
+def backfill(chunk_size):
+    """Rebuild all rollups from the listings table, in one transaction."""
+    _lock_rollups(db.session)
+    MarketPriceStat.query.delete()
+
+    last_id, processed = "", 0
+    while True:
+        chunk = db.session.query(
+            Listing.id, Listing.product_name, Listing.location, Listing.created_at, Listing.price
+        ).filter(
+            Listing.id > last_id,
+            Listing.is_active.is_(True),
+            Listing.is_deleted.isnot(True),
+            Listing.price.isnot(None)
+        ).order_by(Listing.id).limit(chunk_size).all()
+        if not chunk:
+            break
+
+        partial = {}
+        for row in chunk:
+            key = stat_key(row.product_name, row.location, row.created_at.date())
+            price = float(row.price)
+            agg = partial.setdefault(key, {"count": 0, "total": 0.0, "min": price, "max": price, "sketch": {}})
+            agg["count"] += 1
+            agg["total"] += price
+            agg["min"] = min(agg["min"], price)
+            agg["max"] = max(agg["max"], price)
+            sketch_add(agg["sketch"], price)
+
+        for key, agg in partial.items():
+            stat = db.session.get(MarketPriceStat, key)
+            if stat is None:
+                db.session.add(MarketPriceStat(
+                    product=key[0], district=key[1], day=key[2], count=agg["count"],
+                    total=agg["total"], min_price=agg["min"], max_price=agg["max"], sketch=agg["sketch"]
+                ))
+            else:
+                stat.count += agg["count"]
+                stat.total = float(stat.total) + agg["total"]
+                stat.min_price = min(float(stat.min_price), agg["min"])
+                stat.max_price = max(float(stat.max_price), agg["max"])
+                stat.sketch = sketch_merge(dict(stat.sketch), agg["sketch"])
+        db.session.flush()
+
+        processed += len(chunk)
+        last_id = chunk[-1].id
+        click.echo(f"Processed {processed} listings")
+
+    db.session.commit()
+    click.echo(f"Backfill complete: {processed} listings")
+
+
+def init_app(app):
+    app.cli.add_command(stats_cli)
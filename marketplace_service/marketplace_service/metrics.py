@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+
+from flask import Response, g, request
+
+# Everything above "Metric Definitions" is kept identical in llm_service and
+# marketplace_service, which are built and deployed as separate packages;
+# change both copies together. Each service defines its own metrics below.
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Metrics Configuration
+# --------------------------------------
+# Gunicorn runs several workers; each one snapshots its metrics into
+# METRICS_DIR/<pid>.json so whichever worker serves /metrics can report the
+# whole fleet. Leave unset when running a single process.
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_INTERVAL_SEC = float(os.getenv("METRICS_FLUSH_INTERVAL_SEC", "5"))
+WORKER_CONNECTIONS = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = []
+
+
+# --------------------------------------
+# Metric Types
+# --------------------------------------
+# Updates are plain dict/list increments without locks: gevent workers run
+# every request on one OS thread, so there is nothing to contend with.
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        return [[list(k), v] for k, v in list(self._values.items())]
+
+    def merge(self, into, rows):
+        for labels, value in rows:
+            key = tuple(labels)
+            into[key] = into.get(key, 0) + value
+
+    def render(self, values):
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        # Row layout: one count per bucket, then +Inf, then the running sum.
+        row = self._values.get(labels)
+        if row is None:
+            row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def snapshot(self):
+        return [[list(k), list(v)] for k, v in list(self._values.items())]
+
+    def merge(self, into, rows):
+        for labels, row in rows:
+            key = tuple(labels)
+            existing = into.get(key)
+            if existing is None:
+                into[key] = list(row)
+            else:
+                for i, v in enumerate(row):
+                    existing[i] += v
+
+    def render(self, values):
+        for labels, row in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), row):
+                cumulative += count
+                yield (f"{self.name}_bucket"
+                       f"{_format_labels(self.labelnames + ('le',), labels + (str(bound),))} {cumulative}")
+            suffix = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{suffix} {row[-1]}"
+            yield f"{self.name}_count{suffix} {cumulative}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+# --------------------------------------
+# Metric Definitions
+# --------------------------------------
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being served", ("route",))
+REQUEST_ERRORS = Counter(
+    "http_request_errors_total", "HTTP responses with status >= 400", ("route", "status"))
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection", ("bind",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30))
+WORKER_INFLIGHT = Gauge(
+    "gunicorn_worker_inflight_requests", "In-flight requests per worker", ("pid",))
+WORKER_CAPACITY = Gauge(
+    "gunicorn_worker_connections", "Connection capacity across live workers")
+
+
+# --------------------------------------
+# Cross-Worker Aggregation
+# --------------------------------------
+_flusher_pid = None
+
+
+def _snapshot():
+    return {m.name: m.snapshot() for m in _registry}
+
+
+def _flush():
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL_SEC)
+        try:
+            _flush()
+        except OSError:
+            logger.exception("Failed to flush metrics snapshot")
+
+
+def _ensure_flusher():
+    # Threads do not survive fork: each worker starts its own flusher on first use.
+    global _flusher_pid
+    if METRICS_DIR and _flusher_pid != os.getpid():
+        _flusher_pid = os.getpid()
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        WORKER_CAPACITY.set(WORKER_CONNECTIONS)
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _worker_snapshots():
+    yield _snapshot(), True
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return
+    own = f"{os.getpid()}.json"
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith(".json") or name == own:
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        yield data, _pid_alive(int(name[:-5]))
+
+
+def render_metrics():
+    merged = {m.name: {} for m in _registry}
+    for data, alive in _worker_snapshots():
+        for metric in _registry:
+            # Gauges describe live state; counters from dead workers still count.
+            if metric.kind == "gauge" and not alive:
+                continue
+            metric.merge(merged[metric.name], data.get(metric.name, []))
+
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render(merged[metric.name]))
+    return "\n".join(lines) + "\n"
+
+
+# --------------------------------------
+# Flask Integration
+# --------------------------------------
+def init_app(app):
+    WORKER_CAPACITY.set(WORKER_CONNECTIONS)
+
+    @app.before_request
+    def _start_timer():
+        _ensure_flusher()
+        g.metrics_start = time.perf_counter()
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        REQUESTS_IN_FLIGHT.inc(route)
+        WORKER_INFLIGHT.inc(os.getpid())
+
+    @app.after_request
+    def _record_response(response):
+        start = g.get("metrics_start")
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else "<unmatched>"
+            REQUEST_LATENCY.observe(time.perf_counter() - start, request.method, route)
+            if response.status_code >= 400:
+                REQUEST_ERRORS.inc(route, response.status_code)
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        if g.pop("metrics_start", None) is not None:
+            route = request.url_rule.rule if request.url_rule else "<unmatched>"
+            REQUESTS_IN_FLIGHT.dec(route)
+            WORKER_INFLIGHT.dec(os.getpid())
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -4,7 +4,9 @@ from sqlalchemy.dialects.postgresql import JSON
 from uuid import uuid4
 import re
 
-db = SQLAlchemy()
+from marketplace_service.db_routing import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 def utc_now():
     return datetime.now(timezone.utc)
@@ -34,17 +36,27 @@ class Seller(db.Model):
         self.is_verified = True
         return self
 
+    def soft_delete(self):
+        self.is_deleted = True
+        self.deleted_at = utc_now()
+        return self
+
 class Listing(db.Model):
     __tablename__ = 'listings'
     __table_args__ = (
         db.Index('idx_listing_product', 'product_name'),
         db.Index('idx_listing_location', 'location'),
+        db.Index('idx_listing_seller', 'seller_phone', 'is_active'),
     )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid4()))
     seller_phone = db.Column(db.String(20), db.ForeignKey('sellers.phone'), nullable=False)
     product_name = db.Column(db.String(100), nullable=False)
     quantity = db.Column(db.String(50))
+    # Parsed from `quantity` at write time, in the base unit of quantity_unit
+    # (kg, l, each, ...) so range filters compare like with like.
+    quantity_amount = db.Column(db.Numeric(14, 3))
+    quantity_unit = db.Column(db.String(20))
     price = db.Column(db.Numeric(10, 2))
     location = db.Column(db.String(100))
     description = db.Column(db.Text)
@@ -65,8 +77,21 @@ class Listing(db.Model):
         self.views += 1
         return self
 
+# Search filters on lower(product_name) [and lower(location)], then by a price
+# or quantity range or ordered by price, quantity or recency.
+db.Index('idx_listing_search_price', db.func.lower(Listing.product_name), db.func.lower(Listing.location),
+         Listing.price)
+db.Index('idx_listing_product_price', db.func.lower(Listing.product_name), Listing.price)
+db.Index('idx_listing_product_quantity', db.func.lower(Listing.product_name), Listing.quantity_unit,
+         Listing.quantity_amount)
+db.Index('idx_listing_product_created', db.func.lower(Listing.product_name), Listing.created_at)
+
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('idx_payment_reference', 'reference'),
+        db.Index('idx_payment_seller', 'seller_phone', 'created_at'),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid4()))
     seller_phone = db.Column(db.String(20), db.ForeignKey('sellers.phone'), nullable=False)
@@ -75,6 +100,7 @@ class Payment(db.Model):
     reference = db.Column(db.String(100))
     status = db.Column(db.String(20), default='pending')
     created_at = db.Column(db.DateTime, default=utc_now)
+    reconciled_at = db.Column(db.DateTime)  # last statement run that saw this payment
     is_deleted = db.Column(db.Boolean, default=False)
     deleted_at = db.Column(db.DateTime)
 
@@ -87,12 +113,29 @@ class Payment(db.Model):
         self.status = 'failed'
         return self
 
+class MarketPriceStat(db.Model):
+    """Daily price rollup per (product, district), maintained by market_stats."""
+    __tablename__ = 'market_price_stats'
+
+    product = db.Column(db.String(100), primary_key=True)
+    district = db.Column(db.String(100), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    min_price = db.Column(db.Numeric(10, 2))
+    max_price = db.Column(db.Numeric(10, 2))
+    sketch = db.Column(db.JSON, nullable=False, default=dict)
+
 class ListingImage(db.Model):
     __tablename__ = 'listing_images'
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid4()))
     listing_id = db.Column(db.String(36), db.ForeignKey('listings.id'), nullable=False)
     image_url = db.Column(db.String(255), nullable=False)
+    content_hash = db.Column(db.String(64), index=True)
+    content_type = db.Column(db.String(50))
+    size_bytes = db.Column(db.Integer)
+    variants = db.Column(db.JSON)  # {"thumb": <sha256>, "medium": ..., "large": ...}
     is_primary = db.Column(db.Boolean, default=False)
     uploaded_at = db.Column(db.DateTime, default=utc_now)
     is_deleted = db.Column(db.Boolean, default=False)
@@ -102,6 +145,7 @@ class BuyerAlert(db.Model):
     __tablename__ = 'buyer_alerts'
     __table_args__ = (
         db.Index('idx_buyer_alert_product', 'product_name'),
+        db.Index('idx_buyer_alert_phone', 'phone'),
     )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid4()))
@@ -128,6 +172,9 @@ class BuyRequest(db.Model):
 
 class SellerReview(db.Model):
     __tablename__ = 'seller_reviews'
+    __table_args__ = (
+        db.Index('idx_review_seller', 'seller_phone'),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid4()))
     seller_phone = db.Column(db.String(20), db.ForeignKey('sellers.phone'), nullable=False)
@@ -136,3 +183,93 @@ class SellerReview(db.Model):
     created_at = db.Column(db.DateTime, default=utc_now)
 
     seller = db.relationship('Seller', backref=db.backref('reviews', lazy=True))
+
+class OutboxEvent(db.Model):
+    """Change event written in the same transaction as the change; published by the outbox relay."""
+    __tablename__ = 'outbox_events'
+    __table_args__ = (
+        db.Index('idx_outbox_unpublished', 'published_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    event_type = db.Column(db.String(50), nullable=False)  # e.g. "listing.updated"
+    aggregate = db.Column(db.String(20), nullable=False)
+    aggregate_id = db.Column(db.String(36), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    created_at = db.Column(db.DateTime, default=utc_now)
+    published_at = db.Column(db.DateTime)
+
+class Unit(db.Model):
+    """Quantity units, shared with the LLM field extraction through GET /units."""
+    __tablename__ = 'units'
+
+    code = db.Column(db.String(20), primary_key=True)  # e.g. "tonne"
+    base_unit = db.Column(db.String(20), nullable=False)  # e.g. "kg"
+    factor = db.Column(db.Numeric(14, 6), nullable=False)  # base units in one of these
+    aliases = db.Column(db.JSON, nullable=False, default=list)
+
+class Campaign(db.Model):
+    """A broadcast to every phone in an audience, enqueued and sent by `flask campaigns`."""
+    __tablename__ = 'campaigns'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid4()))
+    name = db.Column(db.String(100), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    audience = db.Column(db.String(20), nullable=False)  # sellers, paid_sellers or buyers
+    filters = db.Column(db.JSON, nullable=False, default=dict)  # {"location": ..., "product_name": ...}
+    status = db.Column(db.String(20), nullable=False, default='draft')
+    enqueue_cursor = db.Column(db.String(20))  # last phone enqueued; enqueueing resumes after it
+    enqueued_at = db.Column(db.DateTime)  # set once every recipient is enqueued
+    created_at = db.Column(db.DateTime, default=utc_now)
+    completed_at = db.Column(db.DateTime)
+
+class CampaignRecipient(db.Model):
+    __tablename__ = 'campaign_recipients'
+    __table_args__ = (
+        db.UniqueConstraint('campaign_id', 'phone', name='uq_campaign_recipient'),
+        db.Index('idx_campaign_recipient_status', 'campaign_id', 'status', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    campaign_id = db.Column(db.String(36), db.ForeignKey('campaigns.id'), nullable=False)
+    phone = db.Column(db.String(20), nullable=False)
+    # pending -> sending -> sent | failed; `unknown` when a sender died mid-send
+    # and the provider cannot say whether the message went out.
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    claimed_at = db.Column(db.DateTime)
+    sent_at = db.Column(db.DateTime)
+    provider_message_id = db.Column(db.String(64))
+    error = db.Column(db.String(255))
+
+class IdempotencyKey(db.Model):
+    """Response of a write request, replayed when the same Idempotency-Key is sent again."""
+    __tablename__ = 'idempotency_keys'
+
+    key = db.Column(db.String(255), primary_key=True)
+    method = db.Column(db.String(10), nullable=False)
+    path = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)  # NULL while the first request is still running
+    response_body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=utc_now, index=True)
+    completed_at = db.Column(db.DateTime)
+
+
+# --------------------------------------
+# Archive Tables
+# --------------------------------------
+# Soft-deleted rows are moved here by the sweeper so the live tables only hold
+# live inventory. Plain column copies: no foreign keys, no secondary indexes.
+def _archive_table(model):
+    columns = [db.Column(c.name, c.type, primary_key=c.primary_key) for c in model.__table__.columns]
+    return db.Table(
+        f"{model.__tablename__}_archive",
+        *columns,
+        db.Column('archived_at', db.DateTime, default=utc_now)
+    )
+
+ARCHIVE_TABLES = {
+    model: _archive_table(model)
+    for model in (Listing, ListingImage, Payment, BuyerAlert, BuyRequest)
+}
@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import logging
+from datetime import timedelta
+from decimal import Decimal
+from uuid import uuid4
+
+import click
+import redis
+from flask.cli import AppGroup
+from sqlalchemy import delete, event, inspect, select, update
+from sqlalchemy.orm import Session
+
+from marketplace_service.models.mp_models import (
+    db, Listing, Seller, SellerReview, Payment, OutboxEvent, utc_now
+)
+from marketplace_service.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Outbox Configuration
+# --------------------------------------
+OUTBOX_STREAM = os.getenv("OUTBOX_STREAM", "marketplace:events")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+# Approximate cap on stream length; older entries can still be replayed from the table.
+OUTBOX_STREAM_MAXLEN = int(os.getenv("OUTBOX_STREAM_MAXLEN", "1000000"))
+# Published rows are kept this long so `flask outbox replay` can resend them.
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+
+# Columns carried in each event, per tracked model.
+TRACKED = {
+    Listing: ("listing", "id", ("seller_phone", "product_name", "quantity", "quantity_amount", "quantity_unit",
+                                "price", "location", "category", "is_active", "is_deleted")),
+    Seller: ("seller", "phone", ("business_name", "location", "is_paid", "is_verified",
+                                 "subscription_type", "is_deleted")),
+    SellerReview: ("review", "id", ("seller_phone", "rating", "comment")),
+    Payment: ("payment", "id", ("seller_phone", "amount", "method", "reference", "status", "is_deleted")),
+}
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+# --------------------------------------
+# Writing Events
+# --------------------------------------
+def record(session, aggregate, aggregate_id, event_type, payload=None):
+    """
+    Add an event to `session` so it commits (or rolls back) with the change.
+    Bulk UPDATE/DELETE paths bypass the flush hook and must call this.
+    """
+    session.add(OutboxEvent(
+        event_type=f"{aggregate}.{event_type}",
+        aggregate=aggregate,
+        aggregate_id=str(aggregate_id),
+        payload=payload or {}
+    ))
+
+
+def record_many(session, aggregate, aggregate_ids, event_type, payload=None):
+    for aggregate_id in aggregate_ids:
+        record(session, aggregate, aggregate_id, event_type, payload)
+
+
+def _snapshot(obj, columns, key):
+    return {key: getattr(obj, key), **{c: _json_value(getattr(obj, c)) for c in columns}}
+
+
+@event.listens_for(Session, "before_flush")
+def _write_outbox_events(session, flush_context, instances):
+    for obj in list(session.new):
+        spec = TRACKED.get(type(obj))
+        if spec:
+            aggregate, key, columns = spec
+            if getattr(obj, key) is None:
+                # Defaults are applied at INSERT; the event needs the id now.
+                setattr(obj, key, str(uuid4()))
+            record(session, aggregate, getattr(obj, key), "created", _snapshot(obj, columns, key))
+
+    for obj in list(session.dirty):
+        spec = TRACKED.get(type(obj))
+        if not spec:
+            continue
+        aggregate, key, columns = spec
+        state = inspect(obj)
+        changed = [c for c in columns if state.attrs[c].history.has_changes()]
+        if not changed:
+            continue
+        event_type = "deleted" if "is_deleted" in changed and obj.is_deleted else "updated"
+        record(session, aggregate, getattr(obj, key), event_type,
+               {**_snapshot(obj, columns, key), "changed": changed})
+
+    for obj in list(session.deleted):
+        spec = TRACKED.get(type(obj))
+        if spec:
+            aggregate, key, _ = spec
+            record(session, aggregate, getattr(obj, key), "deleted", {key: getattr(obj, key)})
+
+
+# --------------------------------------
+# Relay
+# --------------------------------------
+def _stream_fields(outbox_event):
+    return {
+        "event_id": outbox_event.id,
+        "type": outbox_event.event_type,
+        "aggregate": outbox_event.aggregate,
+        "aggregate_id": outbox_event.aggregate_id,
+        "payload": json.dumps(outbox_event.payload),
+        "created_at": outbox_event.created_at.isoformat() if outbox_event.created_at else ""
+    }
+
+
+def _publish(client, events):
+    pipe = client.pipeline(transaction=False)
+    for outbox_event in events:
+        pipe.xadd(OUTBOX_STREAM, _stream_fields(outbox_event), maxlen=OUTBOX_STREAM_MAXLEN, approximate=True)
+    pipe.execute()
+
+
+def relay_batch(client, batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Publish the oldest unpublished events in one pipeline and mark them
+    published. Delivery is at-least-once: if the commit fails after XADD the
+    batch is sent again, so consumers dedupe on event_id.
+    """
+    events = db.session.execute(
+        select(OutboxEvent).where(OutboxEvent.published_at.is_(None))
+        .order_by(OutboxEvent.id).limit(batch_size).with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not events:
+        db.session.rollback()
+        return 0
+
+    _publish(client, events)
+    db.session.execute(
+        update(OutboxEvent).where(OutboxEvent.id.in_([e.id for e in events])).values(published_at=utc_now())
+    )
+    db.session.commit()
+    return len(events)
+
+
+def prune_published(older_than_days=OUTBOX_RETENTION_DAYS):
+    cutoff = utc_now() - timedelta(days=older_than_days)
+    deleted = db.session.execute(
+        delete(OutboxEvent).where(OutboxEvent.published_at.isnot(None), OutboxEvent.published_at < cutoff)
+    ).rowcount
+    db.session.commit()
+    return deleted
+
+
+# --------------------------------------
+# Consumer Helpers
+# --------------------------------------
+def ensure_group(client, group, start_id="$"):
+    """Create a consumer group; start_id "0" makes it read the whole stream."""
+    try:
+        client.xgroup_create(OUTBOX_STREAM, group, id=start_id, mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def read_group(client, group, consumer, count=100, block_ms=5000):
+    """Return [(entry id, event dict)], retrying this consumer's unacked entries first."""
+    for start in ("0", ">"):
+        response = client.xreadgroup(group, consumer, {OUTBOX_STREAM: start}, count=count, block=block_ms)
+        entries = response[0][1] if response else []
+        if entries:
+            return [(entry_id, _decode(fields)) for entry_id, fields in entries]
+    return []
+
+
+def ack(client, group, entry_ids):
+    if entry_ids:
+        client.xack(OUTBOX_STREAM, group, *entry_ids)
+
+
+def read_from(client, offset="0", count=100):
+    """Replay the stream from an entry id, outside any consumer group."""
+    return [(entry_id, _decode(fields)) for entry_id, fields in
+            client.xrange(OUTBOX_STREAM, min=f"({offset}" if offset != "0" else "-", count=count)]
+
+
+def _decode(fields):
+    return {**fields, "event_id": int(fields["event_id"]), "payload": json.loads(fields["payload"])}
+
+
+# --------------------------------------
+# Outbox CLI
+# --------------------------------------
+outbox_cli = AppGroup("outbox", help="Publish change events to the Redis stream.")
+
+
+def _require_redis():
+    client = get_redis()
+    if client is None:
+        raise click.ClickException("REDIS_URL is not set")
+    return client
+
+
+@outbox_cli.command("relay")
+@click.option("--loop", is_flag=True, help="Keep relaying until interrupted.")
+@click.option("--batch-size", default=OUTBOX_BATCH_SIZE, show_default=True)
+@click.option("--interval", default=0.2, show_default=True, help="Seconds to wait when the outbox is empty.")
+def relay(loop, batch_size, interval):
+    """Publish unpublished events in id order."""
+    client = _require_redis()
+    total, last_prune = 0, time.monotonic()
+    while True:
+        try:
+            sent = relay_batch(client, batch_size)
+        except Exception:
+            db.session.rollback()
+            logger.exception("Outbox relay batch failed")
+            if not loop:
+                raise
+            sent = 0
+        total += sent
+        if sent == batch_size:
+            continue  # more are waiting
+        if not loop:
+            break
+        if time.monotonic() - last_prune > 3600:
+            last_prune = time.monotonic()
+            logger.info("Pruned %s published outbox events", prune_published())
+        time.sleep(interval)
+    click.echo(f"Published {total} events")
+
+
+@outbox_cli.command("replay")
+@click.option("--from-id", type=int, required=True, help="First outbox event id to resend.")
+@click.option("--batch-size", default=OUTBOX_BATCH_SIZE, show_default=True)
+def replay(from_id, batch_size):
+    """Resend already published events, e.g. after the stream was trimmed."""
+    client = _require_redis()
+    last_id, total = from_id - 1, 0
+    while True:
+        events = db.session.execute(
+            select(OutboxEvent).where(OutboxEvent.id > last_id, OutboxEvent.published_at.isnot(None))
+            .order_by(OutboxEvent.id).limit(batch_size)
+        ).scalars().all()
+        if not events:
+            break
+        _publish(client, events)
+        total += len(events)
+        last_id = events[-1].id
+    click.echo(f"Replayed {total} events from id {from_id}")
+
+
+@outbox_cli.command("tail")
+@click.option("--group", default=None, help="Read as this consumer group (created if missing).")
+@click.option("--consumer", default="cli", show_default=True)
+@click.option("--from-offset", default="0", show_default=True, help="Stream entry id to start after, without --group.")
+@click.option("--count", default=20, show_default=True)
+def tail(group, consumer, from_offset, count):
+    """Print events from the stream."""
+    client = _require_redis()
+    if group:
+        ensure_group(client, group, start_id="0")
+        entries = read_group(client, group, consumer, count=count, block_ms=1000)
+        ack(client, group, [entry_id for entry_id, _ in entries])
+    else:
+        entries = read_from(client, from_offset, count=count)
+    for entry_id, outbox_event in entries:
+        click.echo(f"{entry_id} {outbox_event['type']} {outbox_event['aggregate_id']} "
+                   f"{json.dumps(outbox_event['payload'])}")
+
+
+def init_app(app):
+    app.cli.add_command(outbox_cli)
@@ -0,0 +1,297 @@
+import csv
+import os
+import logging
+from collections import namedtuple, Counter
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, exists, or_, select, update
+
+from marketplace_service import outbox, derived_store
+from marketplace_service.models.mp_models import db, Payment, Seller, utc_now
+from marketplace_service.seller_cache import get_seller_cache
+from marketplace_service.seller_summary import get_summary_cache
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Reconciliation Configuration
+# --------------------------------------
+RECONCILE_CHUNK_SIZE = int(os.getenv("RECONCILE_CHUNK_SIZE", "1000"))
+AMOUNT_TOLERANCE = Decimal("0.01")
+
+# Header spellings seen in EcoCash and OneMoney exports, lower-cased.
+STATEMENT_COLUMNS = {
+    "reference": ("reference", "transaction id", "transaction reference", "txn id", "receipt no",
+                  "receipt number", "reference no", "reference number"),
+    "amount": ("amount", "amount (usd)", "amount usd", "credit", "transaction amount"),
+    "status": ("status", "transaction status", "result"),
+    "date": ("date", "transaction date", "date/time", "completion time", "created"),
+}
+SUCCESS_STATUSES = {"success", "successful", "completed", "complete", "confirmed", "paid"}
+FAILED_STATUSES = {"failed", "failure", "reversed", "reversal", "cancelled", "canceled", "declined"}
+DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M",
+                "%d/%m/%Y", "%d-%m-%Y %H:%M", "%d-%m-%Y")
+
+REPORT_HEADER = ["line", "reference", "statement_amount", "statement_status",
+                 "payment_id", "payment_amount", "payment_status", "issue"]
+
+StatementLine = namedtuple("StatementLine", ["line", "reference", "amount", "status", "date"])
+
+
+class StatementError(ValueError):
+    pass
+
+
+# --------------------------------------
+# Statement Parsing
+# --------------------------------------
+def _header_map(header):
+    normalized = [(h or "").strip().lower() for h in header]
+    columns = {}
+    for field, aliases in STATEMENT_COLUMNS.items():
+        for i, name in enumerate(normalized):
+            if name in aliases:
+                columns[field] = i
+                break
+    missing = {"reference", "amount"} - columns.keys()
+    if missing:
+        raise StatementError(f"Statement is missing column(s): {', '.join(sorted(missing))}")
+    return columns
+
+
+def _parse_amount(raw):
+    cleaned = (raw or "").upper().replace("USD", "").replace("ZWG", "").replace("$", "").replace(",", "").strip()
+    return Decimal(cleaned).quantize(Decimal("0.01"))
+
+
+def _parse_date(raw):
+    raw = (raw or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(raw, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def read_statement(lines, report):
+    """
+    Yield StatementLine for each usable row of a statement CSV. `lines` is any
+    iterable of text lines, so the file is never held in memory. Rows that
+    cannot be parsed go straight to the report.
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if not header:
+        raise StatementError("Statement is empty")
+    columns = _header_map(header)
+
+    for line_no, row in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        try:
+            reference = row[columns["reference"]].strip()
+            amount = _parse_amount(row[columns["amount"]])
+        except (IndexError, InvalidOperation):
+            report.add(line_no, reference=row[columns["reference"]] if len(row) > columns["reference"] else "",
+                       issue="unparseable_line")
+            continue
+        if not reference:
+            report.add(line_no, statement_amount=amount, issue="missing_reference")
+            continue
+        status = row[columns["status"]].strip().lower() if "status" in columns and len(row) > columns["status"] else ""
+        date = _parse_date(row[columns["date"]]) if "date" in columns and len(row) > columns["date"] else None
+        yield StatementLine(line_no, reference, amount, status, date)
+
+
+# --------------------------------------
+# Discrepancy Report
+# --------------------------------------
+class DiscrepancyReport:
+    """Writes discrepancies as they are found and keeps only per-issue counts."""
+
+    def __init__(self, out):
+        self.writer = csv.DictWriter(out, fieldnames=REPORT_HEADER)
+        self.writer.writeheader()
+        self.counts = Counter()
+
+    def add(self, line, issue, **fields):
+        self.counts[issue] += 1
+        self.writer.writerow({"line": line, "issue": issue, **fields})
+
+    def add_payment(self, line, issue, entry, payment):
+        self.add(line, issue,
+                 reference=entry.reference if entry else payment.reference,
+                 statement_amount=entry.amount if entry else "",
+                 statement_status=entry.status if entry else "",
+                 payment_id=payment.id if payment else "",
+                 payment_amount=payment.amount if payment else "",
+                 payment_status=payment.status if payment else "")
+
+
+# --------------------------------------
+# Matching
+# --------------------------------------
+def _payments_query(provider):
+    query = select(Payment.id, Payment.reference, Payment.amount, Payment.status, Payment.seller_phone).where(
+        Payment.is_deleted.isnot(True)
+    )
+    if provider:
+        query = query.where(db.func.lower(Payment.method) == provider.lower())
+    return query
+
+
+def _match_chunk(chunk, provider, run_at, report, summary):
+    """Hash-join one chunk of statement lines against payments by reference."""
+    payments = {}
+    for payment in db.session.execute(_payments_query(provider).where(Payment.reference.in_(list(chunk)))):
+        payments.setdefault(payment.reference, []).append(payment)
+
+    to_confirm, to_fail, seen = [], [], []
+    confirmed_phones, failed_phones = set(), set()
+    for reference, entry in chunk.items():
+        matches = payments.get(reference)
+        if not matches:
+            report.add_payment(entry.line, "missing_payment", entry, None)
+            continue
+        if len(matches) > 1:
+            for payment in matches:
+                report.add_payment(entry.line, "duplicate_payment_reference", entry, payment)
+            continue
+
+        payment = matches[0]
+        seen.append(payment.id)
+        if abs(Decimal(payment.amount or 0) - entry.amount) >= AMOUNT_TOLERANCE:
+            report.add_payment(entry.line, "amount_mismatch", entry, payment)
+            continue
+
+        succeeded = entry.status in SUCCESS_STATUSES or not entry.status
+        failed = entry.status in FAILED_STATUSES
+        if succeeded and payment.status == "pending":
+            to_confirm.append(payment.id)
+            confirmed_phones.add(payment.seller_phone)
+        elif failed and payment.status in ("pending", "confirmed"):
+            to_fail.append(payment.id)
+            failed_phones.add(payment.seller_phone)
+        elif succeeded and payment.status == "failed":
+            # Money arrived for a payment we gave up on; needs a human.
+            report.add_payment(entry.line, "status_conflict", entry, payment)
+        elif not succeeded and not failed:
+            report.add_payment(entry.line, "unknown_statement_status", entry, payment)
+        else:
+            summary["matched"] += 1
+
+    # Bulk equivalents of Payment.mark_paid / Payment.mark_failed.
+    if seen:
+        db.session.execute(update(Payment).where(Payment.id.in_(seen)).values(reconciled_at=run_at))
+    if to_confirm:
+        db.session.execute(update(Payment).where(Payment.id.in_(to_confirm)).values(status="confirmed"))
+        db.session.execute(update(Seller).where(Seller.phone.in_(confirmed_phones)).values(
+            is_paid=True, last_payment_date=run_at
+        ))
+    if to_fail:
+        db.session.execute(update(Payment).where(Payment.id.in_(to_fail)).values(status="failed"))
+        # Sellers stay paid only if another confirmed payment backs them.
+        db.session.execute(update(Seller).where(
+            Seller.phone.in_(failed_phones),
+            ~exists().where(and_(Payment.seller_phone == Seller.phone,
+                                 Payment.status == "confirmed",
+                                 Payment.is_deleted.isnot(True)))
+        ).values(is_paid=False))
+    # Bulk UPDATEs skip the flush hook, so the outbox events are written here.
+    outbox.record_many(db.session, "payment", to_confirm, "updated", {"status": "confirmed", "changed": ["status"]})
+    outbox.record_many(db.session, "payment", to_fail, "updated", {"status": "failed", "changed": ["status"]})
+    outbox.record_many(db.session, "seller", confirmed_phones | failed_phones, "updated", {"changed": ["is_paid"]})
+    db.session.commit()
+
+    summary["confirmed"] += len(to_confirm)
+    summary["failed"] += len(to_fail)
+    changed = confirmed_phones | failed_phones
+    if changed:
+        # The seller cache reloads from the derived store, so refresh it first.
+        derived_store.refresh(seller_phones=changed)
+        get_seller_cache().invalidate(*changed)
+        get_summary_cache().invalidate(*changed)
+
+
+def _report_unmatched(provider, start, end, run_at, report, chunk_size):
+    """Payments in the statement period that the statement never mentioned."""
+    query = _payments_query(provider).where(
+        Payment.status.in_(("pending", "confirmed")),
+        Payment.created_at >= start,
+        Payment.created_at <= end,
+        or_(Payment.reconciled_at.is_(None), Payment.reconciled_at < run_at)
+    ).order_by(Payment.id).execution_options(yield_per=chunk_size)
+    for payment in db.session.execute(query):
+        report.add_payment("", "not_in_statement", None, payment)
+
+
+def reconcile(lines, report_out, provider=None, chunk_size=RECONCILE_CHUNK_SIZE):
+    """
+    Reconcile a statement (an iterable of CSV text lines) against payments,
+    writing discrepancies to `report_out`. Apart from one reference per
+    statement line, kept to catch duplicates across chunks, memory use is
+    bounded by `chunk_size`. Returns a summary dict.
+    """
+    run_at = utc_now()
+    report = DiscrepancyReport(report_out)
+    summary = Counter()
+    start = end = None
+
+    chunk, references = {}, set()
+    for entry in read_statement(lines, report):
+        summary["lines"] += 1
+        if entry.date:
+            start = entry.date if start is None else min(start, entry.date)
+            end = entry.date if end is None else max(end, entry.date)
+        if entry.reference in references:
+            report.add_payment(entry.line, "duplicate_statement_line", entry, None)
+            continue
+        references.add(entry.reference)
+        chunk[entry.reference] = entry
+        if len(chunk) >= chunk_size:
+            _match_chunk(chunk, provider, run_at, report, summary)
+            chunk = {}
+    if chunk:
+        _match_chunk(chunk, provider, run_at, report, summary)
+
+    if start is not None:
+        # Statement times are local; leave a day of slack either side.
+        _report_unmatched(provider, start - timedelta(days=1), end + timedelta(days=1), run_at, report, chunk_size)
+
+    result = {key: summary[key] for key in ("lines", "matched", "confirmed", "failed")}
+    result["discrepancies"] = dict(report.counts)
+    logger.info("Reconciled %s statement lines: %s", summary["lines"], result)
+    return result
+
+
+# --------------------------------------
+# Reconciliation CLI
+# --------------------------------------
+reconcile_cli = AppGroup("payments", help="Payment maintenance.")
+
+
+@reconcile_cli.command("reconcile")
+@click.argument("statement", type=click.Path(exists=True, dir_okay=False))
+@click.option("--report", "report_path", default="discrepancies.csv", show_default=True,
+              help="Where to write the discrepancy report.")
+@click.option("--provider", default=None, help="Only match payments with this method, e.g. EcoCash.")
+@click.option("--chunk-size", default=RECONCILE_CHUNK_SIZE, show_default=True, help="Statement lines per batch.")
+def reconcile_command(statement, report_path, provider, chunk_size):
+    """Reconcile a mobile-money statement CSV against recorded payments."""
+    with open(statement, newline="", encoding="utf-8-sig") as lines, \
+            open(report_path, "w", newline="") as report_out:
+        try:
+            summary = reconcile(lines, report_out, provider=provider, chunk_size=chunk_size)
+        except StatementError as e:
+            raise click.ClickException(str(e))
+    click.echo(f"Reconciled {summary['lines']} lines: {summary['confirmed']} confirmed, "
+               f"{summary['failed']} failed, {summary['matched']} already correct")
+    click.echo(f"Discrepancies: {summary['discrepancies'] or 'none'} (report: {report_path})")
+
+
+def init_app(app):
+    app.cli.add_command(reconcile_cli)
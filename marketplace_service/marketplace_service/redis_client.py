@@ -0,0 +1,16 @@
+import os
+import redis
+
+# Redis is optional for the marketplace: without REDIS_URL every cache stays
+# in-process and cross-worker invalidation is skipped.
+REDIS_URL = os.getenv("REDIS_URL")
+
+_client = None
+
+
+def get_redis():
+    """Return the shared Redis client, or None when REDIS_URL is not set."""
+    global _client
+    if REDIS_URL and _client is None:
+        _client = redis.StrictRedis.from_url(REDIS_URL, decode_responses=True)
+    return _client
@@ -1,26 +1,22 @@
+import io
+import os
+import re
+import hmac
 import logging
 from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
 from uuid import uuid4
 from functools import wraps
 from concurrent.futures import ThreadPoolExecutor
-from flask import Blueprint, request, jsonify, abort
-from marketplace_service.models.mp_models import db, SellerReview, Seller, Listing, Payment
-
-# Configure logging with file rotation
-from logging.handlers import RotatingFileHandler
-
-file_handler = RotatingFileHandler(
-    'marketplace_service.log', maxBytes=5*1024*1024, backupCount=3
-)
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-
-logging.basicConfig(
-    level=logging.INFO,
-    handlers=[
-        file_handler,
-        logging.StreamHandler()
-    ]
-)
+from flask import Blueprint, request, jsonify, abort, current_app, send_file
+from marketplace_service.models.mp_models import db, SellerReview, Seller, Listing, Payment, ListingImage, Campaign
+from marketplace_service import image_store, semantic_index, reconciliation, derived_store, units, campaigns
+from marketplace_service.db_routing import read_only
+from marketplace_service.idempotency import idempotent
+from marketplace_service.seller_cache import get_seller_cache
+from marketplace_service.market_stats import price_summary
+from marketplace_service.seller_summary import get_summary_cache
+
 logger = logging.getLogger(__name__)
 
 routes_bp = Blueprint("routes", __name__)
@@ -28,52 +24,67 @@ executor = ThreadPoolExecutor(max_workers=2)
 
 def validate_phone(phone):
     if not phone or not phone.startswith('263') or len(phone) != 12 or not phone.isdigit():
-        logger.error(f"Invalid phone number format: {phone}")
+        logger.error("Invalid phone number format: %s", phone)
         raise ValueError("Invalid phone number format. Must start with 263 and be 12 digits")
 
 def verify_payment(reference, amount):
-    logger.info(f"Verifying payment with reference: {reference} for amount: {amount}")
+    logger.info("Verifying payment with reference: %s for amount: %s", reference, amount)
     return True
 
 def seller_required(f):
+    """Resolve the seller from the cache and pass the SellerProfile as `seller`."""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        phone = kwargs.get('phone') or request.json.get('phone')
+        # Raw uploads have no JSON body and pass the phone in the query string.
+        phone = kwargs.get('phone') or request.args.get('phone') or (request.get_json(silent=True) or {}).get('phone')
         if not phone:
             logger.warning("Seller authentication required but no phone provided")
             abort(401, description="Seller authentication required")
 
-        logger.info(f"Checking seller with phone: {phone}")
-        seller = db.session.get(Seller, phone)
+        logger.info("Checking seller with phone: %s", phone)
+        seller = get_seller_cache().get(phone)
         if not seller:
-            logger.warning(f"Seller not found for phone: {phone}")
+            logger.warning("Seller not found for phone: %s", phone)
             abort(404, description="Seller not found")
+        return f(*args, seller=seller, **kwargs)
+    return decorated_function
+
+def admin_required(f):
+    """Require the X-Admin-Token header to match ADMIN_TOKEN; the route is disabled while it is unset."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = current_app.config.get("ADMIN_TOKEN")
+        if not token:
+            return jsonify({"error": "Admin endpoints are disabled"}), 403
+        if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), token):
+            logger.warning("Rejected admin request to %s", request.path)
+            return jsonify({"error": "Unauthorized"}), 401
         return f(*args, **kwargs)
     return decorated_function
 
 @routes_bp.errorhandler(400)
 def bad_request(error):
-    logger.error(f"Bad request: {str(error)}")
+    logger.error("Bad request: %s", error)
     return jsonify({"error": "Bad request", "message": str(error)}), 400
 
 @routes_bp.errorhandler(401)
 def unauthorized(error):
-    logger.warning(f"Unauthorized access: {str(error)}")
+    logger.warning("Unauthorized access: %s", error)
     return jsonify({"error": "Unauthorized", "message": str(error)}), 401
 
 @routes_bp.errorhandler(404)
 def not_found(error):
-    logger.warning(f"Resource not found: {str(error)}")
+    logger.warning("Resource not found: %s", error)
     return jsonify({"error": "Not found", "message": str(error)}), 404
 
 @routes_bp.errorhandler(500)
 def server_error(error):
-    logger.error(f"Internal server error: {str(error)}")
+    logger.error("Internal server error: %s", error)
     return jsonify({"error": "Internal server error", "message": "Please try again later"}), 500
 
 @routes_bp.route("/health", methods=["GET"])
 def health():
-    logger.info("Health check endpoint accessed")
+    logger.info("Health check endpoint accessed", extra={"sampled": True})
     return jsonify({
         "status": "ok",
         "message": "Marketplace Bot is running",
@@ -81,23 +92,24 @@ def health():
     }), 200
 
 @routes_bp.route("/register", methods=["POST"])
+@idempotent
 def register_seller():
     data = request.get_json()
-    logger.info(f"Attempting to register seller with data: {data}")
+    logger.info("Attempting to register seller: %s", data.get("phone"))
 
     try:
         validate_phone(data.get("phone"))
     except ValueError as e:
-        logger.error(f"Phone validation failed: {str(e)}")
+        logger.error("Phone validation failed: %s", e)
         return jsonify({"error": str(e)}), 400
 
     required_fields = ["phone", "business_name", "location", "payment_method"]
     if not all(field in data for field in required_fields):
-        logger.error(f"Missing required fields in registration. Required: {required_fields}, Received: {data.keys()}")
+        logger.error("Missing required fields in registration. Required: %s, Received: %s", required_fields, data.keys())
         return jsonify({"error": f"Missing required fields: {required_fields}"}), 400
 
     if db.session.get(Seller, data["phone"]):
-        logger.warning(f"Seller already exists with phone: {data['phone']}")
+        logger.warning("Seller already exists with phone: %s", data['phone'])
         return jsonify({"error": "Seller already exists"}), 400
 
     try:
@@ -110,7 +122,8 @@ def register_seller():
         )
         db.session.add(seller)
         db.session.commit()
-        logger.info(f"Successfully registered seller with phone: {data['phone']}")
+        get_seller_cache().invalidate(seller.phone)
+        logger.info("Successfully registered seller with phone: %s", data['phone'])
 
         return jsonify({
             "message": "Seller registered successfully",
@@ -118,30 +131,32 @@ def register_seller():
         }), 201
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error registering seller: {str(e)}")
+        logger.error("Error registering seller: %s", e)
         abort(500)
 
 @routes_bp.route("/listings", methods=["POST"])
+@idempotent
 @seller_required
-def create_listing():
+def create_listing(seller):
     data = request.get_json()
-    logger.info(f"Creating listing for seller: {data['phone']}")
-
-    seller = db.session.get(Seller, data["phone"])
+    logger.info("Creating listing for seller: %s", data['phone'])
 
     if not seller.is_paid:
-        logger.warning(f"Seller {data['phone']} attempted to create listing without payment")
+        logger.warning("Seller %s attempted to create listing without payment", data['phone'])
         return jsonify({
             "error": "Payment required to post listings",
             "payment_url": "/pay"
         }), 403
 
     try:
+        quantity_amount, quantity_unit = units.resolve_quantity(data)
         listing = Listing(
             id=str(uuid4()),
             seller_phone=data["phone"],
             product_name=data["product_name"],
             quantity=data["quantity"],
+            quantity_amount=quantity_amount,
+            quantity_unit=quantity_unit,
             price=data["price"],
             location=data["location"],
             description=data.get("description", ""),
@@ -150,7 +165,7 @@ def create_listing():
         )
         db.session.add(listing)
         db.session.commit()
-        logger.info(f"Successfully created listing {listing.id} for seller {data['phone']}")
+        logger.info("Successfully created listing %s for seller %s", listing.id, data['phone'])
 
         return jsonify({
             "message": "Listing created successfully",
@@ -159,45 +174,189 @@ def create_listing():
         }), 201
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error creating listing: {str(e)}")
+        logger.error("Error creating listing: %s", e)
+        abort(500)
+
+SEARCH_LIMIT = 20
+# Price and quantity orders skip listings without that value, which keeps them
+# a plain scan of the matching composite index.
+SEARCH_SORTS = {
+    "newest": (Listing.created_at.desc(),),
+    "price_asc": (Listing.price.asc(), Listing.created_at.desc()),
+    "price_desc": (Listing.price.desc(), Listing.created_at.desc()),
+    "quantity_asc": (Listing.quantity_amount.asc(), Listing.created_at.desc()),
+    "quantity_desc": (Listing.quantity_amount.desc(), Listing.created_at.desc()),
+}
+
+def _decimal_arg(name):
+    value = request.args.get(name, "").strip()
+    if not value:
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        number = None
+    if number is None or not number.is_finite():
+        raise ValueError(f"{name} must be a number")
+    return number
+
+def _listing_match(r):
+    return {
+        "id": r.id,
+        "product_name": r.product_name,
+        "quantity": r.quantity,
+        "quantity_amount": float(r.quantity_amount) if r.quantity_amount is not None else None,
+        "quantity_unit": r.quantity_unit,
+        "price": float(r.price) if r.price is not None else None,
+        "location": r.location,
+        "seller_phone": r.seller_phone
+    }
+
+@routes_bp.route("/listings/search", methods=["GET"])
+@read_only
+def search_listings():
+    """
+    Exact product (and location) match, newest first. Optional min_price,
+    max_price, min_quantity and max_quantity filters, and sort=price_asc,
+    price_desc, quantity_asc or quantity_desc. Quantity filters and sorts
+    need quantity_unit and only match listings in the same kind of unit.
+    """
+    product = request.args.get("product_name", "").strip()
+    location = request.args.get("location", "").strip()
+    if not product:
+        return jsonify({"error": "product_name is required"}), 400
+    sort = request.args.get("sort", "newest")
+    if sort not in SEARCH_SORTS:
+        return jsonify({"error": f"sort must be one of {sorted(SEARCH_SORTS)}"}), 400
+    try:
+        min_price, max_price = _decimal_arg("min_price"), _decimal_arg("max_price")
+        min_quantity, max_quantity = _decimal_arg("min_quantity"), _decimal_arg("max_quantity")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    unit_name = request.args.get("quantity_unit", "").strip()
+    by_quantity = min_quantity is not None or max_quantity is not None or sort.startswith("quantity")
+    if by_quantity and not unit_name:
+        return jsonify({"error": "quantity_unit is required to filter or sort by quantity"}), 400
+    if unit_name and units.to_base(1, unit_name)[1] is None:
+        return jsonify({"error": f"Unknown quantity_unit: {unit_name}"}), 400
+
+    logger.info("Searching listings for %s in %s", product, location or "any location")
+    try:
+        plain = sort == "newest" and not unit_name and min_price is None and max_price is None
+        if plain:
+            matches = derived_store.search(product, location)
+            if matches is not None:
+                return jsonify({"matches": matches}), 200
+
+        query = db.session.query(
+            Listing.id, Listing.product_name, Listing.quantity, Listing.quantity_amount,
+            Listing.quantity_unit, Listing.price, Listing.location, Listing.seller_phone
+        ).filter(
+            db.func.lower(Listing.product_name) == product.lower(),
+            Listing.is_active.is_(True),
+            Listing.is_deleted.isnot(True)
+        )
+        if location:
+            query = query.filter(db.func.lower(Listing.location) == location.lower())
+        if min_price is not None:
+            query = query.filter(Listing.price >= min_price)
+        if max_price is not None:
+            query = query.filter(Listing.price <= max_price)
+        if sort.startswith("price"):
+            query = query.filter(Listing.price.isnot(None))
+        if unit_name:
+            # Bounds are converted to the base unit the amounts are stored in.
+            factor, base_unit = units.to_base(1, unit_name)
+            query = query.filter(Listing.quantity_unit == base_unit, Listing.quantity_amount.isnot(None))
+            if min_quantity is not None:
+                query = query.filter(Listing.quantity_amount >= min_quantity * factor)
+            if max_quantity is not None:
+                query = query.filter(Listing.quantity_amount <= max_quantity * factor)
+        rows = query.order_by(*SEARCH_SORTS[sort]).limit(SEARCH_LIMIT).all()
+
+        return jsonify({"matches": [_listing_match(r) for r in rows]}), 200
+    except Exception as e:
+        logger.error("Error searching listings: %s", e)
+        abort(500)
+
+@routes_bp.route("/listings/semantic_search", methods=["GET"])
+@read_only
+def semantic_search_listings():
+    query = request.args.get("q", "").strip()
+    location = request.args.get("location", "").strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    try:
+        k = max(1, min(int(request.args.get("k", 10)), semantic_index.MAX_RESULTS))
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+
+    logger.info("Semantic search for '%s' in %s", query, location or "any location")
+    try:
+        hits = semantic_index.search(query, k=k, district=location or None)
+        if not hits:
+            return jsonify({"matches": []}), 200
+
+        # The index can trail the database by a few writes; the DB has the final say.
+        rows = {r.id: r for r in db.session.query(
+            Listing.id, Listing.product_name, Listing.quantity, Listing.price,
+            Listing.location, Listing.seller_phone
+        ).filter(
+            Listing.id.in_([listing_id for listing_id, _ in hits]),
+            Listing.is_active.is_(True),
+            Listing.is_deleted.isnot(True)
+        )}
+
+        return jsonify({"matches": [{
+            "id": r.id,
+            "product_name": r.product_name,
+            "quantity": r.quantity,
+            "price": float(r.price) if r.price is not None else None,
+            "location": r.location,
+            "seller_phone": r.seller_phone,
+            "score": round(score, 4)
+        } for listing_id, score in hits if (r := rows.get(listing_id))]}), 200
+    except Exception as e:
+        logger.error("Error in semantic search: %s", e)
         abort(500)
 
 @routes_bp.route("/pay", methods=["POST"])
+@idempotent
 @seller_required
-def confirm_payment():
+def confirm_payment(seller):
     data = request.get_json()
-    logger.info(f"Payment confirmation request for phone: {data.get('phone')}")
+    logger.info("Payment confirmation request for phone: %s", data.get('phone'))
 
     required_fields = ["phone", "amount", "reference"]
     if not all(data.get(field) for field in required_fields):
-        logger.error(f"Missing payment fields. Required: {required_fields}, Received: {data.keys()}")
+        logger.error("Missing payment fields. Required: %s, Received: %s", required_fields, data.keys())
         return jsonify({"error": "Phone, amount, and reference are required"}), 400
 
     if not verify_payment(data["reference"], data["amount"]):
-        logger.error(f"Payment verification failed for reference: {data['reference']}")
+        logger.error("Payment verification failed for reference: %s", data['reference'])
         return jsonify({"error": "Payment verification failed"}), 400
 
     try:
-        executor.submit(process_payment_async, {
+        executor.submit(process_payment_async, current_app._get_current_object(), {
             'phone': data["phone"],
             'amount': data["amount"],
             'reference': data["reference"],
             'method': data.get("method", "EcoCash")
         })
-        logger.info(f"Started async payment processing for reference: {data['reference']}")
+        logger.info("Started async payment processing for reference: %s", data['reference'])
 
         return jsonify({
             "message": "Payment processing started",
             "reference": data["reference"]
         }), 202
     except Exception as e:
-        logger.error(f"Error submitting payment for processing: {str(e)}")
+        logger.error("Error submitting payment for processing: %s", e)
         abort(500)
 
-def process_payment_async(payment_data):
+def process_payment_async(app, payment_data):
     try:
-        with routes_bp.app_context():
-            logger.info(f"Processing payment async for phone: {payment_data['phone']}")
+        with app.app_context():
+            logger.info("Processing payment async for phone: %s", payment_data['phone'])
 
             seller = db.session.get(Seller, payment_data["phone"])
             seller.is_paid = True
@@ -214,17 +373,80 @@ def process_payment_async(payment_data):
             )
             db.session.add(payment)
             db.session.commit()
-            logger.info(f"Successfully processed payment {payment.id} for seller {payment_data['phone']}")
+            get_seller_cache().invalidate(payment_data["phone"])
+            logger.info("Successfully processed payment %s for seller %s", payment.id, payment_data['phone'])
     except Exception as e:
-        logger.error(f"Error in async payment processing: {str(e)}")
+        logger.error("Error in async payment processing: %s", e)
+
+RUN_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+@routes_bp.route("/payments/reconcile", methods=["POST"])
+@admin_required
+def reconcile_payments():
+    """Statement CSV as a multipart `statement` file or as the raw body."""
+    upload = request.files.get("statement")
+    stream = upload.stream if upload else request.stream
+    provider = request.args.get("provider") or None
+    run_id = uuid4().hex
+    report_dir = current_app.config["RECONCILIATION_REPORT_DIR"]
+    os.makedirs(report_dir, exist_ok=True)
+    report_path = os.path.join(report_dir, f"{run_id}.csv")
+    logger.info("Reconciling %s statement as run %s", provider or "mobile-money", run_id)
+
+    try:
+        lines = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        with open(report_path, "w", newline="") as report_out:
+            summary = reconciliation.reconcile(lines, report_out, provider=provider)
+    except reconciliation.StatementError as e:
+        os.unlink(report_path)
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error reconciling payments: %s", e)
+        abort(500)
+
+    return jsonify({
+        "run_id": run_id,
+        **summary,
+        "report_url": f"/payments/reconcile/{run_id}/report"
+    }), 200
+
+@routes_bp.route("/payments/reconcile/<run_id>/report", methods=["GET"])
+@admin_required
+def get_reconciliation_report(run_id):
+    if not RUN_ID_PATTERN.match(run_id):
+        abort(404, description="Report not found")
+    path = os.path.join(current_app.config["RECONCILIATION_REPORT_DIR"], f"{run_id}.csv")
+    if not os.path.exists(path):
+        abort(404, description="Report not found")
+    return send_file(path, mimetype="text/csv", as_attachment=True, download_name=f"discrepancies-{run_id}.csv")
+
+@routes_bp.route("/sellers/<phone>", methods=["DELETE"])
+@admin_required
+@seller_required
+def delete_seller(phone, seller):
+    logger.info("Soft deleting seller: %s", phone)
+
+    try:
+        db.session.get(Seller, phone).soft_delete()
+        db.session.commit()
+        get_seller_cache().invalidate(phone)
+        logger.info("Successfully soft deleted seller %s", phone)
+
+        return jsonify({"message": "Seller deleted successfully"}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error deleting seller: %s", e)
+        abort(500)
 
 @routes_bp.route("/sellers/<phone>/reviews", methods=["POST"])
+@idempotent
 def add_seller_review(phone):
     data = request.get_json()
-    logger.info(f"Adding review for seller: {phone}")
+    logger.info("Adding review for seller: %s", phone)
 
     if data.get("rating") not in (1, 2, 3, 4, 5):
-        logger.error(f"Invalid rating value: {data.get('rating')}")
+        logger.error("Invalid rating value: %s", data.get('rating'))
         return jsonify({"error": "Rating must be an integer between 1 and 5"}), 400
 
     try:
@@ -237,7 +459,7 @@ def add_seller_review(phone):
         )
         db.session.add(review)
         db.session.commit()
-        logger.info(f"Successfully added review {review.id} for seller {phone}")
+        logger.info("Successfully added review %s for seller %s", review.id, phone)
 
         return jsonify({
             "message": "Review submitted successfully",
@@ -245,18 +467,19 @@ def add_seller_review(phone):
         }), 201
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error adding review: {str(e)}")
+        logger.error("Error adding review: %s", e)
         abort(500)
 
 @routes_bp.route("/sellers/<phone>/reviews", methods=["GET"])
+@read_only
 def get_seller_reviews(phone):
-    logger.info(f"Fetching reviews for seller: {phone}")
+    logger.info("Fetching reviews for seller: %s", phone)
 
     try:
         reviews = db.session.query(SellerReview).filter_by(seller_phone=phone).all()
 
         if not reviews:
-            logger.info(f"No reviews found for seller: {phone}")
+            logger.info("No reviews found for seller: %s", phone)
             return jsonify({
                 "average_rating": 0,
                 "total_reviews": 0,
@@ -265,7 +488,7 @@ def get_seller_reviews(phone):
 
         total_reviews = len(reviews)
         average_rating = round(sum([r.rating for r in reviews]) / total_reviews, 2)
-        logger.info(f"Found {total_reviews} reviews for seller {phone} with average rating {average_rating}")
+        logger.info("Found %s reviews for seller %s with average rating %s", total_reviews, phone, average_rating)
 
         result = [{
             "id": r.id,
@@ -280,5 +503,195 @@ def get_seller_reviews(phone):
             "reviews": result
         }), 200
     except Exception as e:
-        logger.error(f"Error fetching reviews: {str(e)}")
+        logger.error("Error fetching reviews: %s", e)
         abort(500)
+
+@routes_bp.route("/sellers/<phone>/summary", methods=["GET"])
+@read_only
+def get_seller_summary(phone):
+    """Dashboard: listing counts and views, payment status and rating in one query."""
+    logger.info("Fetching dashboard summary for seller: %s", phone)
+    try:
+        summary = get_summary_cache().get(phone)
+    except Exception as e:
+        logger.error("Error building seller summary: %s", e)
+        abort(500)
+    if summary is None:
+        abort(404, description="Seller not found")
+    return jsonify(summary), 200
+
+@routes_bp.route("/units", methods=["GET"])
+@read_only
+def get_units():
+    """Quantity units with their aliases and conversion to the stored base unit."""
+    try:
+        return jsonify({"units": units.units_json()}), 200
+    except Exception as e:
+        logger.error("Error fetching units: %s", e)
+        abort(500)
+
+def _campaign_json(campaign):
+    return {
+        "campaign_id": campaign.id,
+        "name": campaign.name,
+        "audience": campaign.audience,
+        "filters": campaign.filters,
+        "status": campaign.status,
+        "enqueued": campaign.enqueued_at is not None,
+        "recipients": campaigns.recipient_counts(campaign.id)
+    }
+
+@routes_bp.route("/campaigns", methods=["POST"])
+@admin_required
+@idempotent
+def create_campaign():
+    """Create a draft campaign; `flask campaigns run` enqueues and sends it."""
+    data = request.get_json() or {}
+    if not data.get("name") or not data.get("message"):
+        return jsonify({"error": "name and message are required"}), 400
+    if data.get("audience") not in campaigns.AUDIENCES:
+        return jsonify({"error": f"audience must be one of {', '.join(campaigns.AUDIENCES)}"}), 400
+    filters = {key: data[key] for key in ("location", "product_name") if data.get(key)}
+    if "product_name" in filters and data["audience"] != "buyers":
+        return jsonify({"error": "product_name only filters the buyers audience"}), 400
+
+    try:
+        campaign = Campaign(name=data["name"], message=data["message"], audience=data["audience"], filters=filters)
+        db.session.add(campaign)
+        db.session.commit()
+        logger.info("Created campaign %s for %s", campaign.id, campaign.audience)
+        return jsonify(_campaign_json(campaign)), 201
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error creating campaign: %s", e)
+        abort(500)
+
+@routes_bp.route("/campaigns/<campaign_id>", methods=["GET"])
+@admin_required
+def get_campaign(campaign_id):
+    campaign = db.session.get(Campaign, campaign_id)
+    if campaign is None:
+        abort(404, description="Campaign not found")
+    return jsonify(_campaign_json(campaign)), 200
+
+@routes_bp.route("/campaigns/<campaign_id>/cancel", methods=["POST"])
+@admin_required
+def cancel_campaign(campaign_id):
+    """Stop a campaign; a running sender stops after its current batch."""
+    if db.session.get(Campaign, campaign_id) is None:
+        abort(404, description="Campaign not found")
+    try:
+        if campaigns.cancel(campaign_id):
+            logger.info("Cancelled campaign %s", campaign_id)
+        campaign = db.session.get(Campaign, campaign_id)
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error cancelling campaign: %s", e)
+        abort(500)
+    if campaign.status == "completed":
+        return jsonify({"error": "Campaign already completed"}), 409
+    return jsonify(_campaign_json(campaign)), 200
+
+@routes_bp.route("/market/prices", methods=["GET"])
+@read_only
+def get_market_prices():
+    product = request.args.get("product", "").strip()
+    district = request.args.get("district", "").strip()
+    if not product or not district:
+        return jsonify({"error": "product and district are required"}), 400
+
+    try:
+        days = int(request.args.get("days", 30))
+    except ValueError:
+        return jsonify({"error": "days must be an integer"}), 400
+
+    logger.info("Fetching market prices for %s in %s", product, district)
+    try:
+        return jsonify(price_summary(product, district, days)), 200
+    except Exception as e:
+        logger.error("Error fetching market prices: %s", e)
+        abort(500)
+
+IMAGE_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+IMAGE_CACHE_SECONDS = 365 * 24 * 3600
+
+def _image_json(image):
+    return {
+        "id": image.id,
+        "url": image.image_url,
+        "content_hash": image.content_hash,
+        "is_primary": image.is_primary,
+        "variants": {name: f"/images/{h}" for name, h in (image.variants or {}).items()}
+    }
+
+@routes_bp.route("/listings/<listing_id>/images", methods=["POST"])
+@idempotent
+@seller_required
+def upload_listing_image(listing_id, seller):
+    """Raw image body (not multipart), streamed to the content-addressed store. ?phone= is the seller's."""
+    logger.info("Uploading image for listing: %s", listing_id)
+
+    listing = db.session.get(Listing, listing_id)
+    if not listing or listing.is_deleted:
+        abort(404, description="Listing not found")
+    if listing.seller_phone != seller.phone:
+        logger.warning("Seller %s tried to add an image to listing %s", seller.phone, listing_id)
+        return jsonify({"error": "You can only add images to your own listings"}), 403
+
+    store_dir = current_app.config["IMAGE_STORE_DIR"]
+    try:
+        content_hash, size, content_type, deduplicated = image_store.store_stream(request.stream, store_dir)
+    except image_store.ImageTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except image_store.UnsupportedImage as e:
+        return jsonify({"error": str(e)}), 415
+
+    existing = db.session.query(ListingImage).filter_by(
+        listing_id=listing_id, content_hash=content_hash, is_deleted=False
+    ).first()
+    if existing:
+        logger.info("Image %s already attached to listing %s", content_hash, listing_id)
+        return jsonify({**_image_json(existing), "deduplicated": True}), 200
+
+    try:
+        has_primary = db.session.query(ListingImage.id).filter_by(
+            listing_id=listing_id, is_primary=True, is_deleted=False
+        ).first() is not None
+        image = ListingImage(
+            listing_id=listing_id,
+            image_url=f"/images/{content_hash}",
+            content_hash=content_hash,
+            content_type=content_type,
+            size_bytes=size,
+            is_primary=not has_primary
+        )
+        db.session.add(image)
+        db.session.commit()
+        logger.info("Stored image %s (%s bytes) for listing %s", content_hash, size, listing_id)
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error recording image: %s", e)
+        abort(500)
+
+    image_store.schedule_variants(current_app._get_current_object(), image.id, store_dir, content_hash)
+    return jsonify({**_image_json(image), "deduplicated": deduplicated}), 201
+
+@routes_bp.route("/images/<content_hash>", methods=["GET"])
+def get_image(content_hash):
+    if not IMAGE_HASH_PATTERN.match(content_hash):
+        abort(404, description="Image not found")
+
+    path = image_store.blob_path(current_app.config["IMAGE_STORE_DIR"], content_hash)
+    if not os.path.exists(path):
+        abort(404, description="Image not found")
+
+    with open(path, "rb") as f:
+        content_type = image_store.sniff_content_type(f.read(16)) or "application/octet-stream"
+
+    # Content-addressed, so the bytes behind a URL never change.
+    response = send_file(path, mimetype=content_type, conditional=True, etag=content_hash,
+                         max_age=IMAGE_CACHE_SECONDS)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
@@ -0,0 +1,161 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+import redis
+from flask import current_app
+from flask_caching import Cache
+
+from marketplace_service import derived_store
+from marketplace_service.models.mp_models import db, Seller
+from marketplace_service.redis_client import REDIS_URL, get_redis
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Seller Cache Configuration
+# --------------------------------------
+SELLER_CACHE_L1_SIZE = int(os.getenv("SELLER_CACHE_L1_SIZE", "2048"))
+# The L1 TTL bounds staleness if an invalidation message is ever missed.
+SELLER_CACHE_L1_TTL_SEC = float(os.getenv("SELLER_CACHE_L1_TTL_SEC", "30"))
+SELLER_CACHE_L2_TTL_SEC = int(os.getenv("SELLER_CACHE_L2_TTL_SEC", "300"))
+INVALIDATION_CHANNEL = "marketplace:seller_cache:invalidate"
+
+SellerProfile = namedtuple(
+    "SellerProfile",
+    ["phone", "business_name", "location", "is_paid", "is_verified", "subscription_type"]
+)
+
+# Stored for phones with no (live) seller so repeated lookups stay cached too.
+_MISSING = {}
+
+
+class SellerCache:
+    """
+    Read-through cache of seller profiles: a small per-worker LRU in front of
+    a shared Flask-Caching backend (Redis when configured). Invalidations are
+    broadcast over Redis pub/sub so every worker drops its L1 copy.
+    """
+
+    def __init__(self, app):
+        if REDIS_URL:
+            config = {"CACHE_TYPE": "RedisCache", "CACHE_REDIS_URL": REDIS_URL}
+        else:
+            config = {"CACHE_TYPE": "SimpleCache"}
+        config.update(CACHE_KEY_PREFIX="marketplace:", CACHE_DEFAULT_TIMEOUT=SELLER_CACHE_L2_TTL_SEC)
+        self.l2 = Cache()
+        self.l2.init_app(app, config=config)
+
+        self._l1 = OrderedDict()
+        self._lock = threading.Lock()
+        self._subscriber_pid = None
+
+    # L1 -----------------------------------------------------------------
+    def _l1_get(self, phone):
+        with self._lock:
+            entry = self._l1.get(phone)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._l1[phone]
+                return None
+            self._l1.move_to_end(phone)
+            return entry[1]
+
+    def _l1_put(self, phone, value):
+        with self._lock:
+            self._l1[phone] = (time.monotonic() + SELLER_CACHE_L1_TTL_SEC, value)
+            self._l1.move_to_end(phone)
+            while len(self._l1) > SELLER_CACHE_L1_SIZE:
+                self._l1.popitem(last=False)
+
+    def _l1_evict(self, phone=None):
+        with self._lock:
+            if phone is None:
+                self._l1.clear()
+            else:
+                self._l1.pop(phone, None)
+
+    # Public API ---------------------------------------------------------
+    def get(self, phone):
+        """Return the SellerProfile for `phone`, or None if no live seller exists."""
+        self._ensure_subscriber()
+
+        value = self._l1_get(phone)
+        if value is None:
+            value = self._l2("get", f"seller:{phone}")
+            if value is None:
+                value = self._load(phone)
+                self._l2("set", f"seller:{phone}", value)
+            self._l1_put(phone, value)
+
+        return SellerProfile(**value) if value else None
+
+    def invalidate(self, *phones):
+        """Drop cached profiles everywhere. Call after the change has committed."""
+        for phone in phones:
+            self._l1_evict(phone)
+        self._l2("delete_many", *[f"seller:{p}" for p in phones])
+
+        client = get_redis()
+        if client is not None:
+            try:
+                for phone in phones:
+                    client.publish(INVALIDATION_CHANNEL, phone)
+            except redis.RedisError:
+                logger.warning("Failed to broadcast seller cache invalidation")
+
+    def _l2(self, method, *args):
+        # A Redis outage degrades to database reads instead of failing the request.
+        try:
+            return getattr(self.l2, method)(*args)
+        except redis.RedisError as e:
+            logger.warning("Seller cache L2 %s failed: %s", method, e)
+            return None
+
+    def _load(self, phone):
+        stored = derived_store.get_seller(phone)
+        if stored is not None:
+            return {field: stored[field] for field in SellerProfile._fields}
+        seller = db.session.get(Seller, phone)
+        if not seller or seller.is_deleted:
+            return _MISSING
+        return SellerProfile(
+            phone=seller.phone,
+            business_name=seller.business_name,
+            location=seller.location,
+            is_paid=bool(seller.is_paid),
+            is_verified=bool(seller.is_verified),
+            subscription_type=seller.subscription_type
+        )._asdict()
+
+    # Cross-worker invalidation ------------------------------------------
+    def _ensure_subscriber(self):
+        # Keyed on the pid, so a worker forked from the master subscribes for itself.
+        if get_redis() is None or self._subscriber_pid == os.getpid():
+            return
+        self._subscriber_pid = os.getpid()
+        threading.Thread(target=self._listen, name="seller-cache-invalidation", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    self._l1_evict(message["data"])
+            except redis.RedisError:
+                # Messages may have been missed while disconnected.
+                logger.warning("Seller cache invalidation channel lost, clearing L1")
+            self._l1_evict()
+            time.sleep(1)
+
+
+def init_app(app):
+    app.extensions["seller_cache"] = SellerCache(app)
+
+
+def get_seller_cache():
+    return current_app.extensions["seller_cache"]
@@ -0,0 +1,201 @@
+import os
+import logging
+
+from flask import current_app, has_app_context
+from flask_caching import Cache
+from sqlalchemy import and_, case, func, select, true
+
+from marketplace_service.models.mp_models import db, Seller, Listing, Payment, SellerReview
+from marketplace_service.redis_client import REDIS_URL
+from marketplace_service.signals import collect_until_commit, listings_removed
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Seller Summary Configuration
+# --------------------------------------
+SELLER_SUMMARY_TTL_SEC = int(os.getenv("SELLER_SUMMARY_TTL_SEC", "30"))
+# Active listings returned with the summary, most viewed first.
+SELLER_SUMMARY_TOP_LISTINGS = int(os.getenv("SELLER_SUMMARY_TOP_LISTINGS", "10"))
+
+# Stored for phones with no (live) seller so repeated lookups stay cached too.
+_MISSING = {}
+
+
+# --------------------------------------
+# Summary Query
+# --------------------------------------
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def summary_statement(phone, top_n=SELLER_SUMMARY_TOP_LISTINGS):
+    """
+    One SELECT for the whole dashboard. Each CTE aggregates a single table
+    down to one row for the seller, so the joins never multiply rows; the
+    top-listings CTE then adds up to `top_n` rows carrying those aggregates.
+    """
+    live_listing = and_(Listing.seller_phone == phone, Listing.is_deleted.isnot(True))
+    live_payment = and_(Payment.seller_phone == phone, Payment.is_deleted.isnot(True))
+
+    listing_stats = select(
+        func.count(Listing.id).label("total_listings"),
+        _count_if(Listing.is_active.is_(True)).label("active_listings"),
+        func.coalesce(func.sum(Listing.views), 0).label("total_views"),
+        func.coalesce(func.sum(case((Listing.is_active.is_(True), Listing.views), else_=0)), 0).label("active_views"),
+    ).where(live_listing).cte("listing_stats")
+
+    payment_stats = select(
+        func.count(Payment.id).label("total_payments"),
+        func.coalesce(func.sum(case((Payment.status == "confirmed", Payment.amount), else_=0)), 0).label("total_paid"),
+        _count_if(Payment.status == "pending").label("pending_payments"),
+        func.max(Payment.created_at).label("last_payment_at"),
+    ).where(live_payment).cte("payment_stats")
+
+    review_stats = select(
+        func.count(SellerReview.id).label("total_reviews"),
+        func.avg(SellerReview.rating).label("average_rating"),
+        *[_count_if(SellerReview.rating == stars).label(f"stars_{stars}") for stars in range(1, 6)],
+    ).where(SellerReview.seller_phone == phone).cte("review_stats")
+
+    top_listings = select(
+        Listing.id, Listing.product_name, Listing.quantity, Listing.price, Listing.location,
+        Listing.views, Listing.created_at
+    ).where(live_listing, Listing.is_active.is_(True)).order_by(
+        Listing.views.desc(), Listing.created_at.desc()
+    ).limit(top_n).cte("top_listings")
+
+    last_payment_status = select(Payment.status).where(live_payment).order_by(
+        Payment.created_at.desc()
+    ).limit(1).scalar_subquery()
+
+    return select(
+        Seller.phone, Seller.business_name, Seller.location, Seller.is_paid, Seller.is_verified,
+        Seller.subscription_type, Seller.last_payment_date,
+        listing_stats, payment_stats, review_stats,
+        last_payment_status.label("last_payment_status"),
+        top_listings.c.id.label("listing_id"), top_listings.c.product_name, top_listings.c.quantity,
+        top_listings.c.price, top_listings.c.location.label("listing_location"),
+        top_listings.c.views, top_listings.c.created_at.label("listed_at"),
+    ).select_from(Seller).join(listing_stats, true()).join(payment_stats, true()).join(
+        review_stats, true()
+    ).outerjoin(top_listings, true()).where(
+        Seller.phone == phone, Seller.is_deleted.isnot(True)
+    ).order_by(top_listings.c.views.desc(), top_listings.c.created_at.desc())
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def load_summary(phone):
+    """Run the summary query and shape the rows; {} when there is no live seller."""
+    rows = db.session.execute(summary_statement(phone)).mappings().all()
+    if not rows:
+        return _MISSING
+    first = rows[0]
+    return {
+        "phone": first["phone"],
+        "business_name": first["business_name"],
+        "location": first["location"],
+        "is_verified": bool(first["is_verified"]),
+        "listings": {
+            "active": int(first["active_listings"]),
+            "total": int(first["total_listings"]),
+            "total_views": int(first["total_views"]),
+            "active_views": int(first["active_views"]),
+            "top": [{
+                "id": row["listing_id"],
+                "product_name": row["product_name"],
+                "quantity": row["quantity"],
+                "price": float(row["price"]) if row["price"] is not None else None,
+                "location": row["listing_location"],
+                "views": row["views"] or 0,
+                "created_at": _iso(row["listed_at"]),
+            } for row in rows if row["listing_id"] is not None],
+        },
+        "payments": {
+            "is_paid": bool(first["is_paid"]),
+            "subscription_type": first["subscription_type"],
+            "last_payment_date": _iso(first["last_payment_date"]),
+            "last_payment_status": first["last_payment_status"],
+            "last_payment_at": _iso(first["last_payment_at"]),
+            "pending": int(first["pending_payments"]),
+            "total_paid": float(first["total_paid"]),
+            "count": int(first["total_payments"]),
+        },
+        "rating": {
+            "average": round(float(first["average_rating"]), 2) if first["average_rating"] is not None else 0,
+            "total_reviews": int(first["total_reviews"]),
+            "distribution": {str(stars): int(first[f"stars_{stars}"]) for stars in range(1, 6)},
+        },
+    }
+
+
+# --------------------------------------
+# Summary Cache
+# --------------------------------------
+class SellerSummaryCache:
+    """Short-TTL cache of dashboard summaries, dropped whenever the seller's data is written."""
+
+    def __init__(self, app):
+        if REDIS_URL:
+            config = {"CACHE_TYPE": "RedisCache", "CACHE_REDIS_URL": REDIS_URL}
+        else:
+            config = {"CACHE_TYPE": "SimpleCache"}
+        config.update(CACHE_KEY_PREFIX="marketplace:", CACHE_DEFAULT_TIMEOUT=SELLER_SUMMARY_TTL_SEC)
+        self.cache = Cache()
+        self.cache.init_app(app, config=config)
+
+    def get(self, phone):
+        """Return the summary dict for `phone`, or None if no live seller exists."""
+        value = self.cache.get(f"seller_summary:{phone}")
+        if value is None:
+            value = load_summary(phone)
+            self.cache.set(f"seller_summary:{phone}", value)
+        return value or None
+
+    def invalidate(self, *phones):
+        if phones:
+            self.cache.delete_many(*[f"seller_summary:{p}" for p in phones])
+
+
+def init_app(app):
+    app.extensions["seller_summary"] = SellerSummaryCache(app)
+
+
+def get_summary_cache(app=None):
+    return (app or current_app).extensions["seller_summary"]
+
+
+# --------------------------------------
+# Invalidation
+# --------------------------------------
+# Bulk UPDATEs bypass these hooks; callers such as reconciliation invalidate
+# explicitly.
+def _phone_of(obj):
+    if isinstance(obj, Seller):
+        return obj.phone
+    if isinstance(obj, (Listing, Payment, SellerReview)):
+        return obj.seller_phone
+    return None
+
+
+def _collect_changed_sellers(session, pending):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        phone = _phone_of(obj)
+        if phone:
+            pending.add(phone)
+
+
+def _invalidate_committed(pending):
+    if has_app_context() and "seller_summary" in current_app.extensions:
+        get_summary_cache().invalidate(*pending)
+
+
+collect_until_commit("summary_pending", _collect_changed_sellers, _invalidate_committed, factory=set)
+
+
+@listings_removed.connect
+def _on_listings_removed(sender, seller_phones=(), **kwargs):
+    get_summary_cache(sender).invalidate(*seller_phones)
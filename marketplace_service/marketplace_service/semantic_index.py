@@ -0,0 +1,536 @@
+import os
+import re
+import zlib
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import inspect
+
+from marketplace_service.models.mp_models import db, Listing
+from marketplace_service.signals import collect_until_commit, listings_removed
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Semantic Index Configuration
+# --------------------------------------
+# "hashing" needs no model and is what tests use; "ollama" calls /api/embed.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hashing")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "256"))
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
+EMBEDDING_TIMEOUT_SEC = float(os.getenv("EMBEDDING_TIMEOUT_SEC", "10"))
+
+# Where the matrix is persisted. Unset means in-memory only, rebuilt from the
+# database by each process; gunicorn.conf.py refuses to start more than one
+# worker without it.
+SEMANTIC_INDEX_DIR = os.getenv("SEMANTIC_INDEX_DIR")
+# Above this many live listings queries go through the IVF index instead of
+# scoring every row; IVF_NPROBE clusters are scanned per query.
+ANN_THRESHOLD = int(os.getenv("SEMANTIC_ANN_THRESHOLD", "20000"))
+IVF_NPROBE = int(os.getenv("SEMANTIC_IVF_NPROBE", "8"))
+# Journal records beyond which the next reader folds them into the snapshot.
+COMPACT_AFTER = int(os.getenv("SEMANTIC_COMPACT_AFTER", "5000"))
+SEMANTIC_MIN_SCORE = float(os.getenv("SEMANTIC_MIN_SCORE", "0.15"))
+MAX_RESULTS = 50
+
+OP_ADD, OP_REMOVE = 1, 2
+
+
+def record_dtype(dim):
+    """Fixed-size on-disk record, so the journal can be read with np.fromfile."""
+    return np.dtype([("op", "u1"), ("id", "S36"), ("district", "S64"), ("vec", "<f4", (dim,))])
+
+
+def listing_text(listing):
+    return " ".join(filter(None, [listing.product_name, listing.category, listing.description]))
+
+
+def district_key(location):
+    return (location or "").strip().lower()
+
+
+# --------------------------------------
+# Embedding Backends
+# --------------------------------------
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (matrix / norms).astype(np.float32)
+
+
+class HashingEmbedder:
+    """
+    Feature-hashed words and character trigrams. No model and fully
+    deterministic, so it stands in for a real embedding model in tests and
+    offline; "cooking oil" and "sunflower oil 2L" still share features.
+    """
+
+    name = "hashing"
+    remote = False
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+
+    def _features(self, text):
+        for word in _TOKEN.findall(text.lower()):
+            yield "w:" + word, 1.0
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                yield "c:" + padded[i:i + 3], 0.5
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                # crc32, not hash(): vectors must match across processes.
+                h = zlib.crc32(feature.encode())
+                matrix[row, h % self.dim] += weight if h & 0x80000000 else -weight
+        return _normalize_rows(matrix)
+
+
+class OllamaEmbedder:
+    name = "ollama"
+    remote = True
+
+    def __init__(self, model=EMBEDDING_MODEL, dim=EMBEDDING_DIM, host=OLLAMA_HOST):
+        self.model, self.dim, self.host = model, dim, host.rstrip("/")
+
+    def embed(self, texts):
+        import requests
+
+        res = requests.post(f"{self.host}/api/embed", json={"model": self.model, "input": list(texts)},
+                            timeout=EMBEDDING_TIMEOUT_SEC)
+        res.raise_for_status()
+        matrix = np.asarray(res.json()["embeddings"], dtype=np.float32)
+        if matrix.shape != (len(texts), self.dim):
+            raise ValueError(f"{self.model} returned {matrix.shape[1]}-d vectors, EMBEDDING_DIM is {self.dim}")
+        return _normalize_rows(matrix)
+
+
+def make_embedder(backend=EMBEDDING_BACKEND):
+    if backend == "ollama":
+        return OllamaEmbedder()
+    if backend == "hashing":
+        return HashingEmbedder()
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+
+
+# --------------------------------------
+# IVF Index
+# --------------------------------------
+class IVFIndex:
+    """
+    Inverted-file ANN index: rows are bucketed under their nearest k-means
+    centroid and a query only scores the rows of its IVF_NPROBE nearest buckets.
+    """
+
+    def __init__(self, vectors, rows, iterations=10, sample_size=10000, seed=0):
+        rng = np.random.default_rng(seed)
+        nlist = max(1, int(np.sqrt(len(rows))))
+        sample = vectors[rng.choice(len(rows), size=min(sample_size, len(rows)), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize_rows(centroids)
+
+        self.centroids = centroids
+        self.built_size = len(rows)
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        self.lists = [list(rows[assign == c]) for c in range(nlist)]
+
+    def add(self, row, vector):
+        # A re-embedded row may now sit in two lists; candidates() dedupes.
+        self.lists[int(np.argmax(self.centroids @ vector))].append(row)
+
+    def candidates(self, query, nprobe=IVF_NPROBE):
+        nearest = np.argsort(self.centroids @ query)[::-1][:nprobe]
+        return np.unique(np.concatenate([np.asarray(self.lists[c], dtype=np.int64) for c in nearest]))
+
+
+# --------------------------------------
+# Semantic Index
+# --------------------------------------
+class SemanticIndex:
+    """
+    Listing embeddings in one float32 matrix, searched with a matrix-vector
+    product. When `directory` is set the matrix is persisted as a snapshot
+    plus an append-only journal of fixed-size records: writers append under
+    an exclusive flock, and every process replays the journal tail before it
+    searches, so all workers converge without a vector database.
+    """
+
+    def __init__(self, embedder, directory=None):
+        self.embedder = embedder
+        self.dim = embedder.dim
+        self.dtype = record_dtype(self.dim)
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            base = os.path.join(directory, f"listings-{embedder.name}-{self.dim}")
+            self.snapshot_path = base + ".npy"
+            self.journal_path = base + ".journal"
+            self.lock_path = base + ".lock"
+
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        self._ids = []
+        self._rows = {}
+        self._vectors = np.zeros((1024, self.dim), dtype=np.float32)
+        self._district = np.zeros(1024, dtype=np.int32)
+        self._alive = np.zeros(1024, dtype=bool)
+        self._district_codes = {}
+        self._size = 0
+        self._ivf = None
+        self._ivf_building = False
+        self._journal_offset = 0
+        self._snapshot_stamp = None
+
+    def __len__(self):
+        return int(self._alive[:self._size].sum())
+
+    # In-memory matrix ---------------------------------------------------
+    def _grow(self, needed):
+        capacity = len(self._alive)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self._vectors = np.resize(self._vectors, (capacity, self.dim))
+        self._district = np.resize(self._district, capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._alive = alive
+
+    def _apply(self, records):
+        self._grow(self._size + len(records))
+        for record in records:
+            listing_id = record["id"].decode()
+            row = self._rows.get(listing_id)
+            if record["op"] == OP_REMOVE:
+                if row is not None:
+                    self._alive[row] = False
+                continue
+            if row is None:
+                row = self._rows[listing_id] = self._size
+                self._ids.append(listing_id)
+                self._size += 1
+            district = record["district"].decode(errors="ignore")
+            self._vectors[row] = record["vec"]
+            self._district[row] = self._district_codes.setdefault(district, len(self._district_codes))
+            self._alive[row] = True
+            if self._ivf is not None:
+                self._ivf.add(row, self._vectors[row])
+
+    def _records(self, op, items, vectors=None):
+        records = np.zeros(len(items), dtype=self.dtype)
+        records["op"] = op
+        records["id"] = [listing_id.encode() for listing_id, _ in items]
+        records["district"] = [district_key(district).encode()[:64] for _, district in items]
+        if vectors is not None:
+            records["vec"] = vectors
+        return records
+
+    def _live_records(self):
+        rows = np.flatnonzero(self._alive[:self._size])
+        records = np.zeros(len(rows), dtype=self.dtype)
+        records["op"] = OP_ADD
+        records["id"] = [self._ids[r].encode() for r in rows]
+        codes = {code: name.encode() for name, code in self._district_codes.items()}
+        records["district"] = [codes[c] for c in self._district[rows]]
+        records["vec"] = self._vectors[rows]
+        return records
+
+    # Persistence --------------------------------------------------------
+    @contextmanager
+    def _flock(self, mode):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _stamp(self):
+        try:
+            st = os.stat(self.snapshot_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _write_snapshot(self, records, truncate_journal):
+        # Caller holds LOCK_EX. Readers see either the old or the new file.
+        tmp = self.snapshot_path + f".{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, records)
+        os.replace(tmp, self.snapshot_path)
+        if truncate_journal:
+            open(self.journal_path, "wb").close()
+
+    def _sync(self):
+        """Load the snapshot if it changed, then replay new journal records."""
+        with self._flock(fcntl.LOCK_SH):
+            stamp = self._stamp()
+            if stamp is None:
+                return False
+            if stamp != self._snapshot_stamp:
+                self._reset()
+                self._apply(np.load(self.snapshot_path))
+                self._snapshot_stamp = stamp
+            size = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+            count = (size - self._journal_offset) // self.dtype.itemsize
+            if count > 0:
+                self._apply(np.fromfile(self.journal_path, dtype=self.dtype, count=count,
+                                        offset=self._journal_offset))
+                self._journal_offset += count * self.dtype.itemsize
+        if self._journal_offset // self.dtype.itemsize > COMPACT_AFTER:
+            self.compact()
+        return True
+
+    def _write(self, records):
+        with self._lock:
+            if not self.directory:
+                self._apply(records)
+                return
+            with self._flock(fcntl.LOCK_EX), open(self.journal_path, "ab") as journal:
+                records.tofile(journal)
+
+    def compact(self):
+        """Fold the journal into a fresh snapshot."""
+        if not self.directory:
+            return
+        with self._lock, self._flock(fcntl.LOCK_EX):
+            if self._stamp() != self._snapshot_stamp:
+                return  # someone else compacted first
+            size = os.path.getsize(self.journal_path)
+            count = (size - self._journal_offset) // self.dtype.itemsize
+            if count > 0:
+                self._apply(np.fromfile(self.journal_path, dtype=self.dtype, count=count,
+                                        offset=self._journal_offset))
+            self._write_snapshot(self._live_records(), truncate_journal=True)
+            self._snapshot_stamp, self._journal_offset = self._stamp(), 0
+        logger.info("Compacted semantic index to %s listings", len(self))
+
+    # Building -----------------------------------------------------------
+    def rebuild(self, batch_size=500):
+        """Re-embed every live listing from the database."""
+        with self._lock:
+            self._reset()
+            last_id, total = "", 0
+            while True:
+                batch = db.session.query(
+                    Listing.id, Listing.product_name, Listing.category, Listing.description, Listing.location
+                ).filter(
+                    Listing.id > last_id,
+                    Listing.is_active.is_(True),
+                    Listing.is_deleted.isnot(True)
+                ).order_by(Listing.id).limit(batch_size).all()
+                if not batch:
+                    break
+                vectors = self.embedder.embed([listing_text(r) for r in batch])
+                self._apply(self._records(OP_ADD, [(r.id, r.location) for r in batch], vectors))
+                total += len(batch)
+                last_id = batch[-1].id
+
+            if self.directory:
+                # The journal is kept: it may hold writes committed while the
+                # rebuild ran, and replaying it over the snapshot is idempotent.
+                with self._flock(fcntl.LOCK_EX):
+                    self._write_snapshot(self._live_records(), truncate_journal=False)
+                self._sync()
+            self._loaded = True
+        logger.info("Rebuilt semantic index with %s listings", total)
+        return total
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self.directory:
+                if not self._sync():
+                    self.rebuild()
+            elif not self._loaded:
+                self.rebuild()
+            self._loaded = True
+
+    def _maybe_build_ivf(self):
+        alive = len(self)
+        if alive <= ANN_THRESHOLD or self._ivf_building:
+            return
+        if self._ivf is not None and self._size < 2 * self._ivf.built_size:
+            return
+        # Built off the request path; queries stay exact until it is ready.
+        self._ivf_building = True
+        rows = np.flatnonzero(self._alive[:self._size])
+        vectors = self._vectors[rows].copy()
+
+        def build():
+            try:
+                ivf = IVFIndex(vectors, rows)
+                with self._lock:
+                    for row in range(rows[-1] + 1, self._size):
+                        ivf.add(row, self._vectors[row])
+                    self._ivf = ivf
+                logger.info("Built IVF index over %s listings (%s lists)", len(rows), len(ivf.lists))
+            except Exception:
+                logger.exception("IVF index build failed")
+            finally:
+                self._ivf_building = False
+
+        threading.Thread(target=build, name="semantic-ivf-build", daemon=True).start()
+
+    # Public API ---------------------------------------------------------
+    def add(self, items):
+        """Embed and index [(listing_id, text, district)]."""
+        if not items:
+            return
+        vectors = self.embedder.embed([text for _, text, _ in items])
+        self._write(self._records(OP_ADD, [(i, d) for i, _, d in items], vectors))
+
+    def remove(self, listing_ids):
+        if listing_ids:
+            self._write(self._records(OP_REMOVE, [(i, "") for i in listing_ids]))
+
+    def search(self, query, k=10, district=None, min_score=SEMANTIC_MIN_SCORE):
+        """Return [(listing_id, score)] for the k listings closest to `query`."""
+        self._ensure_loaded()
+        vector = self.embedder.embed([query])[0]
+        with self._lock:
+            self._maybe_build_ivf()
+            if self._ivf is not None:
+                rows = self._ivf.candidates(vector)
+                rows = rows[rows < self._size]
+            else:
+                rows = np.arange(self._size)
+
+            mask = self._alive[rows]
+            if district:
+                code = self._district_codes.get(district_key(district))
+                if code is None:
+                    return []
+                mask &= self._district[rows] == code
+            rows = rows[mask]
+            if not len(rows):
+                return []
+
+            scores = self._vectors[rows] @ vector
+            top = np.argpartition(-scores, min(k, len(rows)) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._ids[rows[i]], float(scores[i])) for i in top if scores[i] >= min_score]
+
+
+# --------------------------------------
+# Index Maintenance
+# --------------------------------------
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-index")
+
+
+def get_index(app=None):
+    app = app or current_app._get_current_object()
+    index = app.extensions.get("semantic_index")
+    if index is None:
+        index = app.extensions["semantic_index"] = SemanticIndex(
+            make_embedder(), app.config.get("SEMANTIC_INDEX_DIR")
+        )
+    return index
+
+
+def search(query, k=10, district=None):
+    return get_index().search(query, k=k, district=district)
+
+
+def _live(listing):
+    return listing.is_active is not False and not listing.is_deleted
+
+
+_INDEXED_ATTRS = ("product_name", "category", "description", "location", "is_active", "is_deleted")
+
+
+def _collect_listing_changes(session, pending):
+    # Ids are assigned by now; the entry is None for listings to drop.
+    for obj in session.new:
+        if isinstance(obj, Listing):
+            pending[obj.id] = (listing_text(obj), obj.location) if _live(obj) else None
+    for obj in session.dirty:
+        if isinstance(obj, Listing):
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in _INDEXED_ATTRS):
+                pending[obj.id] = (listing_text(obj), obj.location) if _live(obj) else None
+    for obj in session.deleted:
+        if isinstance(obj, Listing):
+            pending[obj.id] = None
+
+
+def _index_committed(pending):
+    app = current_app._get_current_object()
+    index = get_index(app)
+    adds = [(listing_id, *entry) for listing_id, entry in pending.items() if entry]
+    removes = [listing_id for listing_id, entry in pending.items() if not entry]
+
+    def apply():
+        try:
+            index.remove(removes)
+            index.add(adds)
+        except Exception:
+            # Search degrades to slightly stale results; `flask semantic-index
+            # rebuild` restores it.
+            logger.exception("Failed to update semantic index for %s listings", len(pending))
+
+    if index.embedder.remote:
+        _executor.submit(apply)
+    else:
+        apply()
+
+
+collect_until_commit("semantic_pending", _collect_listing_changes, _index_committed)
+
+
+@listings_removed.connect
+def _on_listings_removed(sender, listing_ids=(), **kwargs):
+    try:
+        get_index(sender).remove(listing_ids)
+    except Exception:
+        logger.exception("Failed to drop removed listings from the semantic index")
+
+
+# --------------------------------------
+# Semantic Index CLI
+# --------------------------------------
+semantic_cli = AppGroup("semantic-index", help="Maintain the listing embedding index.")
+
+
+@semantic_cli.command("rebuild")
+@click.option("--batch-size", default=500, show_default=True, help="Listings embedded per batch.")
+def rebuild(batch_size):
+    """Re-embed all live listings and write a fresh snapshot."""
+    total = get_index().rebuild(batch_size=batch_size)
+    click.echo(f"Indexed {total} listings")
+
+
+@semantic_cli.command("compact")
+def compact():
+    """Fold the journal into the snapshot."""
+    index = get_index()
+    index._ensure_loaded()
+    index.compact()
+    click.echo(f"Snapshot holds {len(index)} listings")
+
+
+def init_app(app):
+    app.config.setdefault("SEMANTIC_INDEX_DIR", SEMANTIC_INDEX_DIR)
+    app.cli.add_command(semantic_cli)
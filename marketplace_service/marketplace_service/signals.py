@@ -0,0 +1,38 @@
+from blinker import Namespace
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Sent after listings stop being live (expired, deactivated or archived) so
+# caches and indexes derived from them can drop their entries. The bulk
+# archive path sends it because it bypasses the flush hooks, so every
+# collect_until_commit consumer of listings also connects to it.
+#   sender: the current app
+#   listing_ids: list of listing ids
+#   seller_phones: set of affected seller phones
+_signals = Namespace()
+listings_removed = _signals.signal("listings-removed")
+
+
+def collect_until_commit(key, collect, dispatch, factory=dict):
+    """
+    Record what each flush changed and act on it once the transaction commits.
+
+    collect(session, pending) runs after every flush, while new/dirty/deleted
+    still list the flushed objects, and adds to `pending`, a factory() kept in
+    session.info[key] for the transaction. dispatch(pending) runs after the
+    commit if anything was collected. A rollback discards it.
+    """
+    def _collect(session, flush_context):
+        collect(session, session.info.setdefault(key, factory()))
+
+    def _dispatch(session):
+        pending = session.info.pop(key, None)
+        if pending:
+            dispatch(pending)
+
+    def _discard(session, previous_transaction):
+        session.info.pop(key, None)
+
+    event.listen(Session, "after_flush", _collect)
+    event.listen(Session, "after_commit", _dispatch)
+    event.listen(Session, "after_soft_rollback", _discard)
@@ -0,0 +1,187 @@
+import os
+import time
+import logging
+from datetime import timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, insert, literal, select
+
+from marketplace_service.models.mp_models import (
+    db, Listing, ListingImage, Payment, BuyerAlert, BuyRequest, ARCHIVE_TABLES, utc_now
+)
+from marketplace_service.signals import listings_removed
+from marketplace_service import idempotency, outbox
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Sweeper Configuration
+# --------------------------------------
+LISTING_MAX_AGE_DAYS = int(os.getenv("LISTING_MAX_AGE_DAYS", "30"))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "500"))
+# Upper bound on batches per table per run, so one run never holds the DB for long.
+SWEEP_MAX_BATCHES = int(os.getenv("SWEEP_MAX_BATCHES", "20"))
+
+# Soft-deletable tables archived as-is. Listings are handled separately
+# because their images must move with them.
+ARCHIVED_MODELS = (Payment, BuyerAlert, BuyRequest)
+
+
+def expire_listings(max_age_days=LISTING_MAX_AGE_DAYS, batch_size=SWEEP_BATCH_SIZE):
+    """
+    Deactivate active listings older than `max_age_days`, one batch per
+    transaction. Rows locked by live traffic are skipped and picked up by a
+    later run. Returns the number of listings deactivated.
+    """
+    cutoff = utc_now() - timedelta(days=max_age_days)
+    total = 0
+
+    for _ in range(SWEEP_MAX_BATCHES):
+        batch = db.session.query(Listing).filter(
+            Listing.is_active.is_(True),
+            Listing.is_deleted.isnot(True),
+            Listing.created_at < cutoff
+        ).order_by(Listing.created_at).limit(batch_size).with_for_update(skip_locked=True).all()
+        if not batch:
+            break
+
+        # ORM updates (not a bulk UPDATE) so flush hooks such as the market
+        # price rollups see each deactivation.
+        removed = _removal_payload(batch)
+        for listing in batch:
+            listing.deactivate()
+        db.session.commit()
+
+        listings_removed.send(current_app._get_current_object(), **removed)
+        total += len(batch)
+        if len(batch) < batch_size:
+            break
+
+    logger.info("Expired %s listings older than %s days", total, max_age_days)
+    return total
+
+
+def archive_deleted(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=SWEEP_BATCH_SIZE):
+    """
+    Move rows soft-deleted more than `older_than_days` ago into the matching
+    *_archive tables. Returns {table name: rows archived}.
+    """
+    cutoff = utc_now() - timedelta(days=older_than_days)
+    moved = {Listing.__tablename__: _archive_listings(cutoff, batch_size)}
+    for model in ARCHIVED_MODELS:
+        moved[model.__tablename__] = _archive_model(model, cutoff, batch_size)
+
+    logger.info("Archived soft-deleted rows: %s", moved)
+    return moved
+
+
+def _claim_deleted(model, cutoff, batch_size):
+    return db.session.execute(
+        select(model.id).where(
+            model.is_deleted.is_(True),
+            model.deleted_at < cutoff
+        ).limit(batch_size).with_for_update(skip_locked=True)
+    ).scalars().all()
+
+
+def _move_rows(model, ids):
+    table = model.__table__
+    archive = ARCHIVE_TABLES[model]
+    columns = [c.name for c in table.columns]
+    db.session.execute(
+        insert(archive).from_select(
+            columns + ["archived_at"],
+            select(*table.columns, literal(utc_now())).where(table.c.id.in_(ids))
+        )
+    )
+    db.session.execute(delete(table).where(table.c.id.in_(ids)))
+    spec = outbox.TRACKED.get(model)
+    if spec:
+        # The bulk DELETE skips the flush hook; tell stream consumers the rows are gone.
+        outbox.record_many(db.session, spec[0], ids, "deleted", {"archived": True})
+
+
+def _archive_model(model, cutoff, batch_size):
+    total = 0
+    for _ in range(SWEEP_MAX_BATCHES):
+        ids = _claim_deleted(model, cutoff, batch_size)
+        if not ids:
+            break
+        _move_rows(model, ids)
+        db.session.commit()
+        total += len(ids)
+        if len(ids) < batch_size:
+            break
+    return total
+
+
+def _archive_listings(cutoff, batch_size):
+    total = 0
+    for _ in range(SWEEP_MAX_BATCHES):
+        batch = db.session.query(Listing).filter(
+            Listing.is_deleted.is_(True),
+            Listing.deleted_at < cutoff
+        ).limit(batch_size).with_for_update(skip_locked=True).all()
+        if not batch:
+            break
+
+        removed = _removal_payload(batch)
+        ids = removed["listing_ids"]
+        image_ids = db.session.execute(
+            select(ListingImage.id).where(ListingImage.listing_id.in_(ids))
+        ).scalars().all()
+        if image_ids:
+            _move_rows(ListingImage, image_ids)
+        _move_rows(Listing, ids)
+        db.session.commit()
+
+        listings_removed.send(current_app._get_current_object(), **removed)
+        total += len(ids)
+        if len(ids) < batch_size:
+            break
+    return total
+
+
+def _removal_payload(listings):
+    # Captured before commit: archived rows can no longer be refreshed afterwards.
+    return {
+        "listing_ids": [listing.id for listing in listings],
+        "seller_phones": {listing.seller_phone for listing in listings}
+    }
+
+
+def sweep():
+    expire_listings()
+    archive_deleted()
+    idempotency.prune_expired()
+
+
+# --------------------------------------
+# Sweeper CLI
+# --------------------------------------
+sweeper_cli = AppGroup("sweeper", help="Expire listings, archive soft-deleted rows and prune idempotency keys.")
+
+
+@sweeper_cli.command("run")
+@click.option("--loop", is_flag=True, help="Keep running every --interval seconds.")
+@click.option("--interval", default=300, show_default=True, help="Seconds between runs with --loop.")
+def run(loop, interval):
+    """Run one sweep, or sweep continuously with --loop."""
+    while True:
+        try:
+            sweep()
+        except Exception:
+            db.session.rollback()
+            logger.exception("Sweep failed")
+            if not loop:
+                raise
+        if not loop:
+            break
+        time.sleep(interval)
+
+
+def init_app(app):
+    app.cli.add_command(sweeper_cli)
@@ -1,14 +1,28 @@
+import os
 import pytest
 from datetime import datetime, timezone
 from marketplace_service.app import create_app
 from marketplace_service.models.mp_models import db as _db, Seller
 
+@pytest.fixture(scope="session", autouse=True)
+def service_files(tmp_path_factory):
+    """Keep the log file and database create_app() opens out of the source tree."""
+    tmp = tmp_path_factory.mktemp("marketplace_service")
+    saved = {name: os.environ.get(name) for name in ("LOG_FILE", "DATABASE_URL")}
+    os.environ["LOG_FILE"] = str(tmp / "marketplace_service.log")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp / 'bot_service.db'}"
+    yield tmp
+    for name, value in saved.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
 @pytest.fixture
 def app():
     app = create_app()
     app.config.update({
         "TESTING": True,
-        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
         "SQLALCHEMY_TRACK_MODIFICATIONS": False
     })
 
@@ -0,0 +1,151 @@
+import time
+
+import pytest
+
+from marketplace_service import campaigns
+from marketplace_service.campaigns import StubProvider, RateLimiter, TwilioProvider
+from marketplace_service.models.mp_models import db, BuyerAlert, Campaign, CampaignRecipient
+
+ADMIN = {"X-Admin-Token": "admin-secret"}
+
+
+@pytest.fixture(autouse=True)
+def admin_token(app):
+    app.config["ADMIN_TOKEN"] = ADMIN["X-Admin-Token"]
+
+
+def _create_campaign(client, audience, **extra):
+    res = client.post("/campaigns", json={"name": "Harvest", "message": "Maize prices are up", "audience": audience,
+                                          **extra}, headers=ADMIN)
+    assert res.status_code == 201
+    return res.json["campaign_id"]
+
+
+def _statuses(campaign_id):
+    return {r.phone: r.status for r in CampaignRecipient.query.filter_by(campaign_id=campaign_id)}
+
+
+def test_buyers_campaign_enqueues_each_phone_once(client):
+    for phone, product in [("263771000001", "maize"), ("263771000001", "maize"), ("263771000002", "Maize"),
+                           ("263771000003", "goats")]:
+        db.session.add(BuyerAlert(phone=phone, product_name=product, location="Gweru"))
+    db.session.add(BuyerAlert(phone="263771000004", product_name="maize", is_active=False))
+    db.session.commit()
+    campaign_id = _create_campaign(client, "buyers", product_name="maize")
+    provider = StubProvider()
+
+    # One phone per chunk: every chunk commits with the cursor, so a second
+    # run after an interruption adds nothing twice.
+    assert campaigns.enqueue(campaign_id, chunk_size=1) == 2
+    db.session.get(Campaign, campaign_id).enqueued_at = None
+    db.session.commit()
+    assert campaigns.enqueue(campaign_id) == 0
+
+    assert campaigns.send(campaign_id, provider=provider, workers=2, rate=1000) == "completed"
+    assert sorted(phone for _, phone, _ in provider.sent.values()) == ["263771000001", "263771000002"]
+    res = client.get(f"/campaigns/{campaign_id}", headers=ADMIN)
+    assert res.json["status"] == "completed"
+    assert res.json["recipients"] == {"sent": 2}
+
+
+def test_sellers_campaign_records_failures_and_retries(client, paid_seller, test_seller):
+    campaign_id = _create_campaign(client, "sellers")
+    provider = StubProvider(fail=[paid_seller["phone"]], flaky=[test_seller["phone"]])
+
+    assert campaigns.run(campaign_id, provider=provider, workers=4, rate=1000) == "completed"
+
+    assert _statuses(campaign_id) == {paid_seller["phone"]: "failed", test_seller["phone"]: "sent"}
+    recipient = CampaignRecipient.query.filter_by(phone=test_seller["phone"]).one()
+    assert recipient.attempts == 2 and recipient.provider_message_id == "stub-1"
+
+    paid_only = _create_campaign(client, "paid_sellers")
+    campaigns.run(paid_only, provider=StubProvider(), rate=1000)
+    assert _statuses(paid_only) == {paid_seller["phone"]: "sent"}
+
+
+def test_crashed_sender_resumes_without_resending(client, paid_seller, test_seller):
+    campaign_id = _create_campaign(client, "sellers")
+    provider = StubProvider()
+    campaigns.enqueue(campaign_id)
+
+    # A sender claims both recipients, sends to one, then dies before recording anything.
+    claimed = campaigns._claim(campaign_id, 10)
+    phone = claimed[0][1]
+    provider.send(phone, "Maize prices are up", campaigns.send_key(campaign_id, phone))
+
+    assert campaigns.send(campaign_id, provider=provider, rate=1000, claim_timeout=0) == "completed"
+    assert sorted(phone for _, phone, _ in provider.sent.values()) == sorted([paid_seller["phone"],
+                                                                             test_seller["phone"]])
+    assert set(_statuses(campaign_id).values()) == {"sent"}
+
+    # Without a way to look messages up, an abandoned claim is never resent.
+    other = _create_campaign(client, "paid_sellers")
+    campaigns.enqueue(other)
+    campaigns._claim(other, 10)
+    blind = StubProvider()
+    blind.supports_lookup = False
+    campaigns.send(other, provider=blind, rate=1000, claim_timeout=0)
+    assert blind.sent == {}
+    assert _statuses(other) == {paid_seller["phone"]: "unknown"}
+
+
+def test_cancel_and_validation(client):
+    payload = {"name": "x", "message": "y", "audience": "sellers"}
+    assert client.post("/campaigns", json=payload).status_code == 401
+    assert client.post("/campaigns", json={**payload, "audience": "everyone"}, headers=ADMIN).status_code == 400
+    assert client.post("/campaigns", json={**payload, "product_name": "maize"}, headers=ADMIN).status_code == 400
+
+    campaign_id = _create_campaign(client, "sellers")
+    assert client.get(f"/campaigns/{campaign_id}").status_code == 401
+    assert client.post(f"/campaigns/{campaign_id}/cancel").status_code == 401
+    assert client.post(f"/campaigns/{campaign_id}/cancel", headers=ADMIN).json["status"] == "cancelled"
+    provider = StubProvider()
+    campaigns.run(campaign_id, provider=provider, rate=1000)
+    assert provider.sent == {}
+    assert db.session.get(Campaign, campaign_id).status == "cancelled"
+
+
+def test_cancel_during_enqueue_is_not_overwritten(client, paid_seller, monkeypatch):
+    campaign_id = _create_campaign(client, "sellers")
+    statement = campaigns.audience_statement
+
+    def cancel_midway(campaign, cursor=None):
+        if cursor is not None:
+            # Another process cancels after the first chunk has committed.
+            campaigns.cancel(campaign_id)
+        return statement(campaign, cursor)
+
+    monkeypatch.setattr(campaigns, "audience_statement", cancel_midway)
+    assert campaigns.enqueue(campaign_id, chunk_size=1) == 1
+    campaign = db.session.get(Campaign, campaign_id)
+    assert (campaign.status, campaign.enqueued_at) == ("cancelled", None)
+    assert CampaignRecipient.query.filter_by(campaign_id=campaign_id).count() == 1
+
+
+def test_rate_limiter_paces_sends():
+    limiter = RateLimiter(rate=100, burst=1)
+    started = time.monotonic()
+    for _ in range(11):
+        limiter.acquire()
+    assert time.monotonic() - started >= 0.09
+
+
+@pytest.mark.parametrize("phone", ["263777000777", "+263777000777"])
+def test_twilio_provider_sends_e164_numbers(phone, monkeypatch):
+    provider = TwilioProvider("AC123", "token", "+14155238886")
+    requests_sent = []
+
+    class Response:
+        status_code = 201
+
+        def json(self):
+            return {"sid": "SM1"}
+
+    monkeypatch.setattr(provider._session, "post", lambda url, **kwargs: requests_sent.append(kwargs) or Response())
+
+    assert provider.send(phone, "Fresh tomatoes in Harare", "campaign-1:1") == "SM1"
+    assert requests_sent[0]["data"] == {
+        "From": "whatsapp:+14155238886",
+        "To": "whatsapp:+263777000777",
+        "Body": "Fresh tomatoes in Harare"
+    }
@@ -0,0 +1,193 @@
+import fnmatch
+import json
+
+import pytest
+from sqlalchemy import event
+
+from marketplace_service import derived_store
+from marketplace_service.models.mp_models import db, Listing
+
+
+class FakeRedis:
+    """In-memory stand-in for the handful of commands the derived store uses."""
+
+    def __init__(self):
+        self.data = {}
+        self.expiring = set()
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        pass
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, *keys):
+        keys = keys[0] if len(keys) == 1 and isinstance(keys[0], list) else keys
+        return [self.data.get(k) for k in keys]
+
+    def set(self, key, value):
+        self.data[key] = str(value)
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    unlink = delete
+
+    def expire(self, key, seconds):
+        self.expiring.add(key)
+
+    def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    def zrem(self, key, member):
+        self.data.get(key, {}).pop(member, None)
+
+    def zrevrange(self, key, start, end):
+        ranked = sorted(self.data.get(key, {}).items(), key=lambda item: item[1], reverse=True)
+        return [member for member, _ in ranked[start:end + 1]]
+
+    def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(members)
+
+    def spop(self, key, count):
+        members = self.data.get(key, set())
+        return [members.pop() for _ in range(min(count, len(members)))]
+
+    def scard(self, key):
+        return len(self.data.get(key, ()))
+
+    def scan_iter(self, match, count=None):
+        return [k for k in list(self.data) if fnmatch.fnmatchcase(k, match)]
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(derived_store, "get_redis", lambda: client)
+    return client
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    return str(tmp_path / "checkpoint.json")
+
+
+def _create_listing(client, phone, product, location="Masvingo"):
+    res = client.post("/listings", json={
+        "phone": phone,
+        "product_name": product,
+        "quantity": "10",
+        "price": 5.00,
+        "location": location,
+        "category": "grains"
+    })
+    return res.json["listing_id"]
+
+
+def _search(client, **params):
+    return [m["id"] for m in client.get("/listings/search", query_string=params).json["matches"]]
+
+
+def test_rebuild_serves_search_and_sellers_from_redis(app, client, paid_seller, redis_client, checkpoint):
+    phone = paid_seller["phone"]
+    ids = [_create_listing(client, phone, "Maize") for _ in range(3)]
+    _create_listing(client, phone, "Maize", location="Gweru")
+    client.post(f"/sellers/{phone}/reviews", json={"rating": 4})
+    client.post(f"/sellers/{phone}/reviews", json={"rating": 5})
+    from_sql = _search(client, product_name="maize", location="masvingo")
+
+    result = derived_store.rebuild(redis_client, parts=3, checkpoint_path=checkpoint, batch_size=2)
+
+    assert result["rows"] == 4 + 2  # listings + sellers
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        from_redis = _search(client, product_name="maize", location="masvingo")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+    assert statements == []
+    assert from_redis == from_sql and sorted(from_redis) == sorted(ids)
+    assert len(_search(client, product_name="MAIZE")) == 4
+    seller = derived_store.get_seller(phone)
+    assert seller["is_paid"] is True
+    assert (seller["rating_count"], seller["average_rating"]) == (2, 4.5)
+
+
+def test_commits_keep_the_current_version_fresh(app, client, paid_seller, redis_client, checkpoint):
+    phone = paid_seller["phone"]
+    derived_store.rebuild(redis_client, checkpoint_path=checkpoint)
+
+    listing_id = _create_listing(client, phone, "Sorghum")
+    assert _search(client, product_name="sorghum") == [listing_id]
+
+    listing = db.session.get(Listing, listing_id)
+    listing.location = "Gweru"
+    db.session.commit()
+    assert _search(client, product_name="sorghum", location="masvingo") == []
+    assert _search(client, product_name="sorghum", location="gweru") == [listing_id]
+
+    listing.deactivate()
+    db.session.commit()
+    assert _search(client, product_name="sorghum") == []
+
+    client.post(f"/sellers/{phone}/reviews", json={"rating": 3})
+    assert derived_store.get_seller(phone)["rating_count"] == 1
+
+
+def test_interrupted_rebuild_resumes_and_swaps(app, client, paid_seller, redis_client, checkpoint, monkeypatch):
+    phone = paid_seller["phone"]
+    for product in ("Maize", "Beans", "Rice", "Wheat"):
+        _create_listing(client, phone, product)
+    first = derived_store.rebuild(redis_client, checkpoint_path=checkpoint)["version"]
+
+    build = derived_store.build_partition
+    calls, crash = [], {"after": 1}
+
+    def failing_build(*args, **kwargs):
+        calls.append(args[2:5])
+        if crash and len(calls) > crash["after"]:
+            crash.clear()
+            raise RuntimeError("worker died")
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(derived_store, "build_partition", failing_build)
+    with pytest.raises(RuntimeError):
+        derived_store.rebuild(redis_client, parts=2, checkpoint_path=checkpoint)
+    with open(checkpoint) as f:
+        saved = json.load(f)
+    assert len(saved["done"]) == 1
+    # Written while the build is paused: lands in the live version and is
+    # re-read into the new one before the swap.
+    late = _create_listing(client, phone, "Millet")
+    assert redis_client.get(derived_store.CURRENT_KEY) == str(first)
+
+    calls.clear()
+    result = derived_store.rebuild(redis_client, parts=2, checkpoint_path=checkpoint, resume=True)
+
+    assert result["version"] == saved["version"] != first
+    assert len(calls) == len(saved["partitions"]) - 1
+    assert result["refreshed"] >= 1
+    assert redis_client.get(derived_store.CURRENT_KEY) == str(result["version"])
+    assert _search(client, product_name="millet") == [late]
+    assert all(k in redis_client.expiring for k in redis_client.scan_iter(f"{derived_store.prefix(first)}*"))
+
+
+def test_rebuild_cli_reports_progress(app, paid_seller, redis_client, checkpoint):
+    result = app.test_cli_runner().invoke(args=[
+        "derived", "rebuild", "--workers", "1", "--partitions", "2", "--checkpoint", checkpoint
+    ])
+
+    assert result.exit_code == 0, result.output
+    assert "rows/s" in result.output
+    assert "Version 1 is live" in result.output
+    status = app.test_cli_runner().invoke(args=["derived", "status", "--checkpoint", checkpoint])
+    assert "Current version: 1" in status.output
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+
+from marketplace_service.models.mp_models import db, Listing, IdempotencyKey
+
+LISTING = {
+    "product_name": "Maize",
+    "quantity": "20kg",
+    "price": 8.00,
+    "location": "Masvingo",
+    "category": "grains"
+}
+
+
+def test_retry_with_same_key_replays_response(client, paid_seller):
+    payload = {"phone": paid_seller["phone"], **LISTING}
+    headers = {"Idempotency-Key": "whatsapp:SM123"}
+
+    first = client.post("/listings", json=payload, headers=headers)
+    retry = client.post("/listings", json=payload, headers=headers)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.json["listing_id"] == first.json["listing_id"]
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert db.session.query(Listing).count() == 1
+
+
+def test_key_reused_for_different_request_is_rejected(client, paid_seller):
+    headers = {"Idempotency-Key": "whatsapp:SM124"}
+    client.post("/listings", json={"phone": paid_seller["phone"], **LISTING}, headers=headers)
+
+    res = client.post("/listings", json={"phone": paid_seller["phone"], **LISTING, "price": 9.00},
+                      headers=headers)
+
+    assert res.status_code == 422
+    assert db.session.query(Listing).count() == 1
+
+
+def test_duplicate_while_first_is_running_gets_conflict(client, test_seller):
+    db.session.add(IdempotencyKey(key="whatsapp:SM125", method="POST", path="/sellers/263777000777/reviews",
+                                  request_hash="in-flight"))
+    db.session.commit()
+
+    res = client.post(f"/sellers/{test_seller['phone']}/reviews", json={"rating": 5},
+                      headers={"Idempotency-Key": "whatsapp:SM125"})
+
+    assert res.status_code == 409
+
+
+def test_abandoned_claim_is_taken_over(client, paid_seller):
+    db.session.add(IdempotencyKey(key="whatsapp:SM126", method="POST", path="/listings", request_hash="stale",
+                                  created_at=datetime.now(timezone.utc) - timedelta(minutes=5)))
+    db.session.commit()
+
+    res = client.post("/listings", json={"phone": paid_seller["phone"], **LISTING},
+                      headers={"Idempotency-Key": "whatsapp:SM126"})
+
+    assert res.status_code == 201
+    assert db.session.get(IdempotencyKey, "whatsapp:SM126").status_code == 201
+
+
+def test_requests_without_key_are_not_deduplicated(client, paid_seller):
+    payload = {"phone": paid_seller["phone"], **LISTING}
+    client.post("/listings", json=payload)
+    client.post("/listings", json=payload)
+
+    assert db.session.query(Listing).count() == 2
+    assert db.session.query(IdempotencyKey).count() == 0
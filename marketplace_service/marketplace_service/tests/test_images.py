@@ -0,0 +1,85 @@
+import io
+import pytest
+from PIL import Image
+
+from marketplace_service import image_store
+
+
+@pytest.fixture
+def image_dir(app, tmp_path):
+    app.config["IMAGE_STORE_DIR"] = str(tmp_path)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def listing_id(client, paid_seller):
+    res = client.post("/listings", json={
+        "phone": paid_seller["phone"],
+        "product_name": "Goats",
+        "quantity": "2",
+        "price": 30.00,
+        "location": "Masvingo",
+        "category": "livestock"
+    })
+    return res.json["listing_id"]
+
+
+def _upload_url(listing_id, phone):
+    return f"/listings/{listing_id}/images?phone={phone}"
+
+
+def _png(size=(1200, 900)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_upload_and_dedupe(client, image_dir, listing_id, paid_seller):
+    body = _png()
+    res = client.post(_upload_url(listing_id, paid_seller["phone"]), data=body, content_type="image/png")
+    assert res.status_code == 201
+    assert res.json["is_primary"] is True
+    assert res.json["deduplicated"] is False
+
+    again = client.post(_upload_url(listing_id, paid_seller["phone"]), data=body, content_type="image/png")
+    assert again.status_code == 200
+    assert again.json["deduplicated"] is True
+    assert again.json["id"] == res.json["id"]
+
+
+def test_upload_rejects_non_images(client, image_dir, listing_id, paid_seller):
+    res = client.post(_upload_url(listing_id, paid_seller["phone"]), data=b"not an image", content_type="image/png")
+    assert res.status_code == 415
+
+
+def test_download_supports_ranges_and_caching(client, image_dir, listing_id, paid_seller):
+    body = _png()
+    url = client.post(_upload_url(listing_id, paid_seller["phone"]), data=body, content_type="image/png").json["url"]
+
+    res = client.get(url)
+    assert res.status_code == 200
+    assert res.data == body
+    assert res.mimetype == "image/png"
+    assert "immutable" in res.headers["Cache-Control"]
+
+    partial = client.get(url, headers={"Range": "bytes=0-99"})
+    assert partial.status_code == 206
+    assert partial.data == body[:100]
+
+
+def test_make_variants(tmp_path):
+    content_hash = image_store.store_stream(io.BytesIO(_png()), str(tmp_path))[0]
+
+    variants = image_store.make_variants(str(tmp_path), content_hash)
+    assert set(variants) == set(image_store.IMAGE_VARIANTS)
+    with Image.open(image_store.blob_path(str(tmp_path), variants["thumb"])) as thumb:
+        assert max(thumb.size) == 320
+    # The original is smaller than the "large" edge, so it is not upscaled
+    assert variants["large"] == variants["medium"]
+
+
+def test_upload_requires_the_listing_owner(client, image_dir, listing_id, test_seller):
+    body = _png()
+    assert client.post(f"/listings/{listing_id}/images", data=body, content_type="image/png").status_code == 401
+    res = client.post(_upload_url(listing_id, test_seller["phone"]), data=body, content_type="image/png")
+    assert res.status_code == 403
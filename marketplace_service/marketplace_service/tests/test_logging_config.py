@@ -0,0 +1,25 @@
+import logging
+
+from marketplace_service import logging_config
+
+
+def _queue_handlers():
+    return [h for h in logging.getLogger().handlers if isinstance(h, logging_config.LazyQueueHandler)]
+
+
+def test_reconfigure_after_shutdown_keeps_one_handler(app, tmp_path):
+    assert len(_queue_handlers()) == 1
+
+    logging_config.shutdown_logging()
+    assert _queue_handlers() == []
+    logging_config.configure_logging(str(tmp_path / "service.log"), "test")
+    logging_config.configure_logging(str(tmp_path / "service.log"), "test")
+
+    assert len(_queue_handlers()) == 1
+
+
+def test_redact_masks_only_logged_phone_formats():
+    assert logging_config.redact("Message from whatsapp:+263771234567") == "Message from whatsapp:***567"
+    assert logging_config.redact("Checking seller with phone: 263777000777") == "Checking seller with phone: ***777"
+    assert logging_config.redact("state user:{+14155238886}") == "state user:{***886}"
+    assert logging_config.redact("Paid 1500000000 for ref 99912345678") == "Paid 1500000000 for ref 99912345678"
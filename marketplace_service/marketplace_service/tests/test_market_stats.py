@@ -0,0 +1,101 @@
+from marketplace_service import market_stats
+from marketplace_service.market_stats import sketch_add
+from marketplace_service.models.mp_models import db, Listing, MarketPriceStat, utc_now
+
+
+def _post_listing(client, phone, price, product="Goats", location="Gokwe"):
+    res = client.post("/listings", json={
+        "phone": phone,
+        "product_name": product,
+        "quantity": "1",
+        "price": price,
+        "location": location,
+        "category": "livestock"
+    })
+    assert res.status_code == 201
+    return res.json["listing_id"]
+
+
+def test_market_prices_rollup(client, paid_seller):
+    for price in (20, 25, 30, 40):
+        _post_listing(client, paid_seller["phone"], price)
+    _post_listing(client, paid_seller["phone"], 100, location="Harare")
+
+    res = client.get("/market/prices", query_string={"product": "goats", "district": "GOKWE"})
+    assert res.status_code == 200
+    assert res.json["count"] == 4
+    assert res.json["min"] == 20
+    assert res.json["max"] == 40
+    assert res.json["mean"] == 28.75
+    assert 24 <= res.json["median"] <= 26
+
+
+def test_market_prices_deactivation(client, app, paid_seller):
+    _post_listing(client, paid_seller["phone"], 20)
+    top = _post_listing(client, paid_seller["phone"], 50)
+
+    with app.app_context():
+        db.session.get(Listing, top).deactivate()
+        db.session.commit()
+
+    res = client.get("/market/prices", query_string={"product": "Goats", "district": "Gokwe"})
+    assert res.json["count"] == 1
+    assert res.json["max"] == 20
+
+
+def test_market_prices_follow_listing_edits(client, app, paid_seller):
+    _post_listing(client, paid_seller["phone"], 20)
+    edited = _post_listing(client, paid_seller["phone"], 50)
+    alone = _post_listing(client, paid_seller["phone"], 70, location="Harare")
+
+    with app.app_context():
+        db.session.get(Listing, edited).price = 30
+        db.session.get(Listing, alone).price = 60
+        db.session.commit()
+
+    res = client.get("/market/prices", query_string={"product": "goats", "district": "gokwe"})
+    assert (res.json["count"], res.json["max"], res.json["mean"]) == (2, 30, 25)
+    res = client.get("/market/prices", query_string={"product": "goats", "district": "harare"})
+    assert (res.json["count"], res.json["min"], res.json["max"]) == (1, 60, 60)
+
+    with app.app_context():
+        listing = db.session.get(Listing, edited)
+        listing.product_name, listing.location = "Sheep", "Harare"
+        db.session.commit()
+
+    res = client.get("/market/prices", query_string={"product": "goats", "district": "gokwe"})
+    assert (res.json["count"], res.json["max"]) == (1, 20)
+    res = client.get("/market/prices", query_string={"product": "sheep", "district": "harare"})
+    assert (res.json["count"], res.json["min"]) == (1, 30)
+
+
+def test_market_prices_backfill(app, client, paid_seller):
+    _post_listing(client, paid_seller["phone"], 10, product="Maize")
+    _post_listing(client, paid_seller["phone"], 14, product="Maize")
+
+    result = app.test_cli_runner().invoke(args=["market-stats", "backfill", "--chunk-size", "1"])
+    assert "Backfill complete: 2 listings" in result.output
+
+    res = client.get("/market/prices", query_string={"product": "maize", "district": "gokwe"})
+    assert res.json["count"] == 2
+    assert res.json["mean"] == 12
+
+
+def test_market_prices_requires_product_and_district(client):
+    res = client.get("/market/prices", query_string={"product": "goats"})
+    assert res.status_code == 400
+
+
+def test_rollup_row_created_concurrently(client, paid_seller):
+    # Another worker's first listing for the day committed the row after this
+    # session last looked: the insert must not collide with it.
+    db.session.execute(MarketPriceStat.__table__.insert().values(
+        product="goats", district="gokwe", day=utc_now().date(), count=1, total=10,
+        min_price=10, max_price=10, sketch=sketch_add({}, 10.0)))
+    db.session.commit()
+    market_stats._insert_if_missing(db.session, market_stats.stat_key("Goats", "Gokwe", utc_now().date()))
+    _post_listing(client, paid_seller["phone"], 30)
+
+    res = client.get("/market/prices", query_string={"product": "goats", "district": "gokwe"})
+    assert res.json["count"] == 2
+    assert (res.json["min"], res.json["max"]) == (10, 30)
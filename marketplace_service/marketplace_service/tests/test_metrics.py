@@ -0,0 +1,13 @@
+def test_metrics_endpoint(client):
+    client.get("/health")
+    client.post("/register", json={"phone": "bad"})
+
+    res = client.get("/metrics")
+    assert res.status_code == 200
+    assert res.mimetype == "text/plain"
+
+    body = res.get_data(as_text=True)
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'http_request_duration_seconds_count{method="GET",route="/health"}' in body
+    assert 'http_request_errors_total{route="/register",status="400"}' in body
+    assert "gunicorn_worker_connections" in body
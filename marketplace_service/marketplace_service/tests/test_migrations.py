@@ -0,0 +1,36 @@
+import os
+
+import pytest
+import sqlalchemy as sa
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import upgrade
+
+from marketplace_service import app as app_module
+from marketplace_service.models.mp_models import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(app_module.__file__), os.pardir, "migrations")
+
+
+@pytest.fixture
+def empty_db_app(tmp_path, monkeypatch):
+    # Production boot: the schema comes from the migrations alone.
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'migrated.db'}")
+    monkeypatch.setattr(app_module, "PRODUCTION", True)
+    app = app_module.create_app()
+    app_module._init_migrate(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+def test_upgrade_from_empty_database_matches_the_models(empty_db_app):
+    upgrade(directory=MIGRATIONS_DIR)
+
+    with db.engine.connect() as connection:
+        diff = compare_metadata(MigrationContext.configure(connection, opts={"compare_type": True}), db.metadata)
+        # SQLite cannot reflect expression indexes, so compare_metadata skips them.
+        indexes = set(connection.scalars(sa.text("SELECT name FROM sqlite_master WHERE type = 'index'")))
+    assert diff == []
+    expected = {index.name for table in db.metadata.tables.values() for index in table.indexes}
+    assert expected <= indexes
@@ -0,0 +1,70 @@
+import json
+
+from marketplace_service import outbox
+from marketplace_service.models.mp_models import db, Listing, OutboxEvent, Seller
+
+
+class RecordingRedis:
+    """Just enough of a redis client for the relay: pipelined XADDs."""
+
+    def __init__(self):
+        self.entries = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def xadd(self, stream, fields, **kwargs):
+        self.entries.append((stream, fields))
+
+    def execute(self):
+        pass
+
+
+def _events(aggregate):
+    return [(e.event_type, e.aggregate_id) for e in
+            OutboxEvent.query.filter_by(aggregate=aggregate).order_by(OutboxEvent.id)]
+
+
+def test_changes_write_events_in_the_same_transaction(client, paid_seller):
+    res = client.post("/listings", json={
+        "phone": paid_seller["phone"],
+        "product_name": "Goats",
+        "quantity": "3",
+        "price": 25.00,
+        "location": "Gweru",
+        "category": "livestock"
+    })
+    listing_id = res.json["listing_id"]
+    assert _events("listing") == [("listing.created", listing_id)]
+
+    db.session.get(Listing, listing_id).deactivate()
+    db.session.commit()
+    latest = OutboxEvent.query.filter_by(aggregate="listing").order_by(OutboxEvent.id.desc()).first()
+    assert latest.event_type == "listing.updated"
+    assert latest.payload["changed"] == ["is_active"]
+    assert latest.payload["price"] == 25.0
+
+    # Rolled-back changes leave no events behind.
+    before = _events("seller")
+    seller = db.session.get(Seller, paid_seller["phone"])
+    seller.business_name = "Renamed"
+    db.session.flush()
+    db.session.rollback()
+    assert _events("seller") == before
+
+
+def test_relay_publishes_in_order_and_marks_published(client, test_seller):
+    redis = RecordingRedis()
+    pending = OutboxEvent.query.filter(OutboxEvent.published_at.is_(None)).count()
+    assert pending > 0
+
+    assert outbox.relay_batch(redis, batch_size=1) == 1
+    assert outbox.relay_batch(redis, batch_size=100) == pending - 1
+    assert outbox.relay_batch(redis) == 0
+
+    ids = [fields["event_id"] for _, fields in redis.entries]
+    assert ids == sorted(ids)
+    first = redis.entries[0][1]
+    assert first["type"] == "seller.created"
+    assert json.loads(first["payload"])["phone"] == test_seller["phone"]
+    assert OutboxEvent.query.filter(OutboxEvent.published_at.is_(None)).count() == 0
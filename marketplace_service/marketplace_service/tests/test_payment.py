@@ -1,3 +1,8 @@
+import time
+
+import redis
+
+
 def test_confirm_payment(client, test_seller):
     payload = {
         "phone": test_seller["phone"],
@@ -22,3 +27,50 @@ def test_invalid_payment(client, test_seller):
     res = client.post("/pay", json=payload)
     assert res.status_code == 400
     assert "phone, amount, and reference are required" in res.json["error"].lower()
+
+
+def test_payment_confirmation_unlocks_listings(client, test_seller):
+    listing = {
+        "phone": test_seller["phone"],
+        "product_name": "Goats",
+        "quantity": "5",
+        "price": 30.00,
+        "location": "Harare",
+        "category": "livestock"
+    }
+    # Caches the unpaid profile
+    assert client.post("/listings", json=listing).status_code == 403
+
+    client.post("/pay", json={
+        "phone": test_seller["phone"],
+        "amount": 5.00,
+        "method": "EcoCash",
+        "reference": "PAY000456"
+    })
+
+    # Payment is processed on a background thread, which invalidates the cache
+    for _ in range(50):
+        res = client.post("/listings", json=listing)
+        if res.status_code == 201:
+            break
+        time.sleep(0.05)
+    assert res.status_code == 201
+
+
+def test_seller_cache_outage_falls_back_to_database(app, client, test_seller, monkeypatch):
+    cache = app.extensions["seller_cache"]
+    cache._l1_evict()
+
+    def unavailable(*args, **kwargs):
+        raise redis.ConnectionError("redis is down")
+
+    monkeypatch.setattr(cache.l2, "get", unavailable)
+    monkeypatch.setattr(cache.l2, "set", unavailable)
+
+    res = client.post("/pay", json={
+        "phone": test_seller["phone"],
+        "amount": 5.00,
+        "method": "EcoCash",
+        "reference": "PAY000789"
+    })
+    assert res.status_code == 202
@@ -0,0 +1,110 @@
+import io
+import csv
+from datetime import datetime
+
+import pytest
+
+from marketplace_service import reconciliation
+from marketplace_service.models.mp_models import db, Payment, Seller
+
+ADMIN = {"X-Admin-Token": "admin-secret"}
+
+
+@pytest.fixture(autouse=True)
+def report_dir(app, tmp_path):
+    app.config["RECONCILIATION_REPORT_DIR"] = str(tmp_path)
+    app.config["ADMIN_TOKEN"] = ADMIN["X-Admin-Token"]
+    return tmp_path
+
+
+def _payment(phone, reference, amount, status="pending", method="EcoCash"):
+    db.session.add(Payment(seller_phone=phone, reference=reference, amount=amount, status=status,
+                           method=method, created_at=datetime(2025, 5, 10, 12, 0)))
+    db.session.commit()
+
+
+STATEMENT = """Transaction ID,Amount (USD),Transaction Status,Date/Time
+PAY1,$5.00,Successful,10/05/2025 09:15
+PAY2,5.00,Reversed,10/05/2025 10:00
+PAY3,7.50,Successful,11/05/2025 08:00
+PAY9,5.00,Successful,11/05/2025 09:00
+PAY1,5.00,Successful,11/05/2025 09:30
+,5.00,Successful,11/05/2025 09:45
+"""
+
+
+def test_reconcile_statement(client, app, test_seller):
+    phone = test_seller["phone"]
+    _payment(phone, "PAY1", 5)
+    _payment(phone, "PAY2", 5, status="confirmed")
+    _payment(phone, "PAY3", 5)
+    _payment(phone, "PAY4", 5, status="confirmed")
+    db.session.get(Seller, phone).is_paid = True
+    db.session.commit()
+
+    res = client.post("/payments/reconcile", data=STATEMENT.encode(), content_type="text/csv", headers=ADMIN)
+    assert res.status_code == 200
+    assert res.json["lines"] == 5
+    assert res.json["confirmed"] == 1
+    assert res.json["failed"] == 1
+    assert res.json["discrepancies"] == {
+        "amount_mismatch": 1,
+        "missing_payment": 1,
+        "duplicate_statement_line": 1,
+        "missing_reference": 1,
+        "not_in_statement": 1
+    }
+
+    statuses = dict(db.session.query(Payment.reference, Payment.status))
+    assert statuses == {"PAY1": "confirmed", "PAY2": "failed", "PAY3": "pending", "PAY4": "confirmed"}
+    # PAY4 is still confirmed, so the reversal of PAY2 does not lock the seller out.
+    assert db.session.get(Seller, phone).is_paid is True
+
+    assert client.get(res.json["report_url"]).status_code == 401
+    report = client.get(res.json["report_url"], headers=ADMIN)
+    assert report.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(report.get_data(as_text=True))))
+    assert {r["issue"] for r in rows} == set(res.json["discrepancies"])
+    assert next(r for r in rows if r["issue"] == "not_in_statement")["reference"] == "PAY4"
+
+
+def test_reversal_revokes_paid_status(client, test_seller):
+    phone = test_seller["phone"]
+    _payment(phone, "PAY7", 5, status="confirmed")
+    db.session.get(Seller, phone).is_paid = True
+    db.session.commit()
+
+    res = client.post("/payments/reconcile", data={
+        "statement": (io.BytesIO(b"Reference,Amount,Status\nPAY7,5.00,Failed\n"), "statement.csv")
+    }, headers=ADMIN)
+    assert res.status_code == 200
+    assert res.json["failed"] == 1
+    db.session.expire_all()
+    assert db.session.get(Seller, phone).is_paid is False
+
+
+def test_statement_without_required_columns(client):
+    res = client.post("/payments/reconcile", data=b"Name,Total\nx,1\n", content_type="text/csv", headers=ADMIN)
+    assert res.status_code == 400
+    assert "reference" in res.json["error"]
+
+
+def test_reconcile_requires_admin_token(client, app, test_seller):
+    _payment(test_seller["phone"], "PAY1", 5)
+    statement = b"Reference,Amount\nPAY1,5.00\n"
+
+    res = client.post("/payments/reconcile", data=statement, content_type="text/csv",
+                      headers={"X-Admin-Token": "guess"})
+    assert res.status_code == 401
+    app.config["ADMIN_TOKEN"] = None
+    assert client.post("/payments/reconcile", data=statement, content_type="text/csv").status_code == 403
+    assert db.session.query(Payment.status).scalar() == "pending"
+
+
+def test_duplicate_lines_are_caught_across_chunks(test_seller):
+    _payment(test_seller["phone"], "PAY1", 5)
+    statement = ["Reference,Amount\n", "PAY1,5.00\n", "PAY2,5.00\n", "PAY1,5.00\n"]
+
+    summary = reconciliation.reconcile(statement, io.StringIO(), chunk_size=1)
+    assert summary["confirmed"] == 1
+    assert summary["discrepancies"]["duplicate_statement_line"] == 1
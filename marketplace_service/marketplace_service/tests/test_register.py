@@ -21,3 +21,18 @@ def test_register_duplicate_phone(client):
     res = client.post("/register", json=payload)  # Duplicate attempt
     assert res.status_code == 400
     assert "seller already exists" in res.json["error"].lower()
+
+
+def test_soft_deleted_seller_is_not_found(app, client, test_seller):
+    app.config["ADMIN_TOKEN"] = "admin-secret"
+    assert client.delete(f"/sellers/{test_seller['phone']}").status_code == 401
+
+    res = client.delete(f"/sellers/{test_seller['phone']}", headers={"X-Admin-Token": "admin-secret"})
+    assert res.status_code == 200
+
+    res = client.post("/pay", json={
+        "phone": test_seller["phone"],
+        "amount": 5.00,
+        "reference": "PAY000789"
+    })
+    assert res.status_code == 404
@@ -0,0 +1,66 @@
+import pytest
+from flask import g
+from sqlalchemy import insert
+
+from marketplace_service import db_routing
+from marketplace_service.app import create_app
+from marketplace_service.models.mp_models import db, Seller, Listing
+
+
+def _replica_app(tmp_path, monkeypatch, replica_url):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'primary.db'}")
+    monkeypatch.setattr(db_routing, "DATABASE_REPLICA_URLS", [replica_url])
+    monkeypatch.setattr(db_routing, "router", db_routing.ReplicaRouter())
+    return create_app()
+
+
+@pytest.fixture
+def replica_app(tmp_path, monkeypatch):
+    app = _replica_app(tmp_path, monkeypatch, f"sqlite:///{tmp_path / 'replica.db'}")
+    with app.app_context():
+        db.create_all()
+        # Stands in for streaming replication: same schema, separate file.
+        db.metadata.create_all(app.extensions["db_replicas"]["replica_0"])
+        yield app
+        db.session.remove()
+
+
+def test_read_only_routes_use_replica(replica_app):
+    with replica_app.extensions["db_replicas"]["replica_0"].begin() as conn:
+        conn.execute(insert(Seller).values(phone="263777000999", business_name="Replica"))
+        conn.execute(insert(Listing).values(
+            id="replica-listing", seller_phone="263777000999", product_name="Goats",
+            price=20, location="Gokwe", is_active=True, is_deleted=False
+        ))
+
+    res = replica_app.test_client().get("/listings/search", query_string={
+        "product_name": "goats", "location": "gokwe"
+    })
+    assert res.status_code == 200
+    assert [m["id"] for m in res.json["matches"]] == ["replica-listing"]
+
+
+def test_reads_after_commit_go_to_primary(replica_app):
+    with replica_app.test_request_context():
+        g.db_read_only = True
+        assert db.session.query(Seller).count() == 0
+
+        db.session.add(Seller(phone="263777000998", business_name="Primary"))
+        db.session.commit()
+
+        assert db.session.query(Seller).count() == 1
+        with replica_app.extensions["db_replicas"]["replica_0"].connect() as conn:
+            assert conn.execute(db.select(db.func.count()).select_from(Seller)).scalar() == 0
+
+
+def test_unreachable_replica_falls_back_to_primary(tmp_path, monkeypatch):
+    app = _replica_app(tmp_path, monkeypatch, f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    with app.app_context():
+        db.create_all()
+        res = app.test_client().get("/listings/search", query_string={"product_name": "goats"})
+        assert res.status_code == 200
+        assert res.json["matches"] == []
+
+        metrics = app.test_client().get("/metrics").get_data(as_text=True)
+        assert 'db_pool_checkout_wait_seconds_count{bind="default"}' in metrics
+        db.session.remove()
@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+from marketplace_service.models.mp_models import db, Listing
+
+
+def _create_listing(client, phone, quantity, price, **extra):
+    res = client.post("/listings", json={
+        "phone": phone,
+        "product_name": "Goats",
+        "quantity": quantity,
+        "price": price,
+        "location": "Gweru",
+        "category": "livestock",
+        **extra
+    })
+    assert res.status_code == 201
+    return res.json["listing_id"]
+
+
+def _search(client, **params):
+    return client.get("/listings/search", query_string={"product_name": "goats", **params})
+
+
+def test_quantity_is_parsed_at_write_time(client, paid_seller):
+    phone = paid_seller["phone"]
+    tonnes = _create_listing(client, phone, "2 tonnes", 10)
+    goats = _create_listing(client, phone, "5 goats", 10)
+    vague = _create_listing(client, phone, "a few", 10)
+    explicit = _create_listing(client, phone, "two bags", 10, quantity_amount=2, quantity_unit="bags")
+
+    typed = {i: (db.session.get(Listing, i).quantity_amount, db.session.get(Listing, i).quantity_unit)
+             for i in (tonnes, goats, vague, explicit)}
+    assert typed == {tonnes: (Decimal("2000"), "kg"), goats: (Decimal("5"), "each"),
+                     vague: (None, None), explicit: (Decimal("2"), "bag")}
+
+
+def test_price_and_quantity_ranges_with_sort(client, paid_seller):
+    phone = paid_seller["phone"]
+    cheap_few = _create_listing(client, phone, "3", 20)
+    cheap_many = _create_listing(client, phone, "8 goats", 25)
+    dear_many = _create_listing(client, phone, "10 head", 45)
+    by_weight = _create_listing(client, phone, "200kg", 15)
+
+    res = _search(client, max_price=30, min_quantity=5, quantity_unit="each")
+    assert [m["id"] for m in res.json["matches"]] == [cheap_many]
+    assert res.json["matches"][0]["quantity_amount"] == 8.0
+
+    res = _search(client, sort="price_asc")
+    assert [m["id"] for m in res.json["matches"]] == [by_weight, cheap_few, cheap_many, dear_many]
+
+    res = _search(client, sort="quantity_desc", quantity_unit="head")
+    assert [m["id"] for m in res.json["matches"]] == [dear_many, cheap_many, cheap_few]
+
+    # Bounds are converted to the stored base unit.
+    res = _search(client, min_quantity="0.1", quantity_unit="tonne")
+    assert [m["id"] for m in res.json["matches"]] == [by_weight]
+
+
+def test_search_filter_validation(client):
+    assert _search(client, min_quantity=5).status_code == 400
+    assert _search(client, min_quantity=5, quantity_unit="furlongs").status_code == 400
+    assert _search(client, max_price="cheap").status_code == 400
+    assert _search(client, sort="random").status_code == 400
+
+
+def test_units_are_served_for_extraction(client):
+    units = client.get("/units").json["units"]
+
+    assert units["tonne"] == {"base_unit": "kg", "factor": 1000.0, "aliases": ["t", "ton", "tons", "tonnes"]}
+    assert "head" in units["each"]["aliases"]
@@ -0,0 +1,73 @@
+from sqlalchemy import event
+
+from marketplace_service.models.mp_models import db, Listing
+from marketplace_service.seller_summary import get_summary_cache
+
+
+def _create_listing(client, phone, product, views=0):
+    res = client.post("/listings", json={
+        "phone": phone,
+        "product_name": product,
+        "quantity": "10",
+        "price": 5.00,
+        "location": "Masvingo",
+        "category": "grains"
+    })
+    listing = db.session.get(Listing, res.json["listing_id"])
+    listing.views = views
+    db.session.commit()
+    return listing
+
+
+def test_summary_aggregates_listings_payments_and_reviews(client, paid_seller):
+    phone = paid_seller["phone"]
+    _create_listing(client, phone, "Maize", views=7)
+    _create_listing(client, phone, "Sorghum", views=3)
+    old = _create_listing(client, phone, "Rapoko", views=5)
+    old.deactivate()
+    db.session.commit()
+    client.post(f"/sellers/{phone}/reviews", json={"rating": 4})
+    client.post(f"/sellers/{phone}/reviews", json={"rating": 5})
+
+    res = client.get(f"/sellers/{phone}/summary")
+
+    assert res.status_code == 200
+    summary = res.json
+    assert summary["listings"]["active"] == 2
+    assert summary["listings"]["total"] == 3
+    assert summary["listings"]["total_views"] == 15
+    assert [l["product_name"] for l in summary["listings"]["top"]] == ["Maize", "Sorghum"]
+    assert summary["payments"]["is_paid"] is True
+    assert summary["rating"] == {"average": 4.5, "total_reviews": 2,
+                                 "distribution": {"1": 0, "2": 0, "3": 0, "4": 1, "5": 1}}
+
+
+def test_summary_is_one_query_and_cached(client, app, paid_seller):
+    phone = paid_seller["phone"]
+    for i in range(20):
+        _create_listing(client, phone, f"Product {i}", views=i)
+    get_summary_cache().invalidate(phone)
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        client.get(f"/sellers/{phone}/summary")
+        client.get(f"/sellers/{phone}/summary")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+
+    assert len(statements) == 1
+
+
+def test_summary_is_invalidated_by_writes(client, paid_seller):
+    phone = paid_seller["phone"]
+    assert client.get(f"/sellers/{phone}/summary").json["rating"]["total_reviews"] == 0
+
+    client.post(f"/sellers/{phone}/reviews", json={"rating": 3})
+
+    assert client.get(f"/sellers/{phone}/summary").json["rating"]["total_reviews"] == 1
+
+
+def test_summary_for_unknown_seller(client):
+    assert client.get("/sellers/263770000000/summary").status_code == 404
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from marketplace_service import semantic_index
+from marketplace_service.models.mp_models import db, Listing
+
+
+def _listing(client, seller, product, location, description="", category="groceries"):
+    res = client.post("/listings", json={
+        "phone": seller["phone"],
+        "product_name": product,
+        "quantity": "10",
+        "price": 3.50,
+        "location": location,
+        "description": description,
+        "category": category
+    })
+    assert res.status_code == 201
+    return res.json["listing_id"]
+
+
+@pytest.fixture
+def index_dir(app, tmp_path):
+    app.config["SEMANTIC_INDEX_DIR"] = str(tmp_path)
+    return tmp_path
+
+
+def test_semantic_search_finds_related_products(client, paid_seller, index_dir):
+    oil = _listing(client, paid_seller, "Sunflower oil 2L", "Harare", "Pure cooking oil")
+    _listing(client, paid_seller, "Goats", "Harare", category="livestock")
+
+    res = client.get("/listings/semantic_search", query_string={"q": "cooking oil"})
+    assert res.status_code == 200
+    assert [m["id"] for m in res.json["matches"]] == [oil]
+
+
+def test_semantic_search_filters_by_district_and_active(client, paid_seller, app, index_dir):
+    harare = _listing(client, paid_seller, "Sunflower oil 2L", "Harare")
+    gweru = _listing(client, paid_seller, "Sunflower oil 5L", "Gweru")
+
+    res = client.get("/listings/semantic_search", query_string={"q": "sunflower oil", "location": "gweru"})
+    assert [m["id"] for m in res.json["matches"]] == [gweru]
+
+    db.session.get(Listing, gweru).deactivate()
+    db.session.commit()
+    res = client.get("/listings/semantic_search", query_string={"q": "sunflower oil"})
+    assert [m["id"] for m in res.json["matches"]] == [harare]
+
+
+def test_index_is_shared_through_the_journal(app, client, paid_seller, index_dir):
+    first = _listing(client, paid_seller, "Maize meal 10kg", "Masvingo")
+    semantic_index.get_index(app).search("maize")
+
+    # A second worker opening the same directory sees later writes from the first.
+    other = semantic_index.SemanticIndex(semantic_index.make_embedder(), str(index_dir))
+    second = _listing(client, paid_seller, "Maize seed", "Masvingo")
+    assert {i for i, _ in other.search("maize")} == {first, second}
+
+    app.extensions["semantic_index"].compact()
+    assert {i for i, _ in other.search("maize")} == {first, second}
+
+
+def test_ivf_candidates_cover_nearest_rows():
+    rng = np.random.default_rng(1)
+    vectors = semantic_index._normalize_rows(rng.normal(size=(2000, 32)).astype(np.float32))
+    ivf = semantic_index.IVFIndex(vectors, np.arange(2000))
+    query = vectors[123]
+    assert 123 in ivf.candidates(query)
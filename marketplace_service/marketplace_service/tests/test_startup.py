@@ -0,0 +1,36 @@
+import os
+import sys
+import subprocess
+
+SERVICE_DIR = os.path.join(os.path.dirname(__file__), "..", "..")
+
+# Heavy modules that only specific code paths need; importing any of them at
+# startup slows every worker boot.
+LAZY_MODULES = ("flask_migrate", "alembic", "PIL")
+
+
+def _loaded_after(snippet):
+    code = snippet + "\nimport sys\nprint(','.join(m for m in %r if m in sys.modules))" % (LAZY_MODULES,)
+    env = dict(os.environ, DATABASE_URL="sqlite://")
+    result = subprocess.run([sys.executable, "-c", code], cwd=SERVICE_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return [m for m in result.stdout.strip().split(",") if m]
+
+
+def test_create_app_skips_heavy_imports():
+    loaded = _loaded_after("from marketplace_service.app import create_app\ncreate_app()")
+    assert loaded == []
+
+
+def test_production_does_not_create_tables():
+    env = dict(os.environ, DATABASE_URL="sqlite://", FLASK_ENV="production")
+    code = (
+        "from marketplace_service.app import create_app\n"
+        "from marketplace_service.models.mp_models import db\n"
+        "app = create_app()\n"
+        "with app.app_context():\n"
+        "    print(len(db.inspect(db.engine).get_table_names()))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=SERVICE_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "0"
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select
+
+from marketplace_service.models.mp_models import db, Listing, Payment, OutboxEvent, ARCHIVE_TABLES
+from marketplace_service.signals import listings_removed
+from marketplace_service.sweeper import expire_listings, archive_deleted
+
+
+def _listing(phone, age_days, **kwargs):
+    return Listing(
+        seller_phone=phone,
+        product_name="Goats",
+        quantity="1",
+        price=20,
+        location="Gokwe",
+        category="livestock",
+        created_at=datetime.now(timezone.utc) - timedelta(days=age_days),
+        **kwargs
+    )
+
+
+def test_expire_listings(app, test_seller):
+    old = _listing(test_seller["phone"], age_days=45)
+    fresh = _listing(test_seller["phone"], age_days=1)
+    db.session.add_all([old, fresh])
+    db.session.commit()
+
+    removed = []
+    def on_removed(sender, listing_ids, seller_phones):
+        removed.extend(listing_ids)
+
+    with listings_removed.connected_to(on_removed, app):
+        assert expire_listings(max_age_days=30, batch_size=1) == 1
+
+    assert removed == [old.id]
+    assert db.session.get(Listing, old.id).is_active is False
+    assert db.session.get(Listing, fresh.id).is_active is True
+
+
+def test_archive_deleted_rows(app, test_seller):
+    long_ago = datetime.now(timezone.utc) - timedelta(days=90)
+    listing = _listing(test_seller["phone"], age_days=100, is_deleted=True, deleted_at=long_ago)
+    recent = _listing(test_seller["phone"], age_days=1, is_deleted=True,
+                      deleted_at=datetime.now(timezone.utc))
+    payment = Payment(seller_phone=test_seller["phone"], amount=5, reference="PAY1",
+                      is_deleted=True, deleted_at=long_ago)
+    db.session.add_all([listing, recent, payment])
+    db.session.commit()
+    listing_id, recent_id, payment_id = listing.id, recent.id, payment.id
+
+    moved = archive_deleted(older_than_days=30)
+    assert moved["listings"] == 1
+    assert moved["payments"] == 1
+
+    db.session.expire_all()
+    assert db.session.get(Listing, listing_id) is None
+    assert db.session.get(Listing, recent_id) is not None
+    assert db.session.get(Payment, payment_id) is None
+
+    archived = db.session.execute(select(ARCHIVE_TABLES[Payment])).all()
+    assert [row.id for row in archived] == [payment_id]
+    assert archived[0].archived_at is not None
+
+    # Archived in the same transaction as the DELETE, so stream consumers hear about it.
+    events = db.session.execute(select(OutboxEvent.event_type, OutboxEvent.aggregate_id)
+                                .where(OutboxEvent.event_type.like("%.deleted"))).all()
+    assert sorted(events) == sorted([("listing.deleted", str(listing_id)), ("payment.deleted", str(payment_id))])
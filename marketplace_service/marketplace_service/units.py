@@ -0,0 +1,146 @@
+import os
+import re
+import time
+import logging
+import threading
+from decimal import Decimal, InvalidOperation
+
+from marketplace_service.models.mp_models import db, Unit
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------
+# Unit Table Configuration
+# --------------------------------------
+# How long a worker serves its copy of the units table before re-reading it.
+UNITS_CACHE_SEC = float(os.getenv("UNITS_CACHE_SEC", "300"))
+
+# code: (base unit, amount of base unit in one of these, aliases). Amounts are
+# stored in the base unit, so "2 tonnes" and "500kg" compare directly. Rows in
+# the units table extend or replace these.
+SEED_UNITS = {
+    "kg": ("kg", "1", ["kgs", "kilo", "kilos", "kilogram", "kilograms"]),
+    "g": ("kg", "0.001", ["gram", "grams", "gm", "gms"]),
+    "tonne": ("kg", "1000", ["t", "ton", "tons", "tonnes"]),
+    "l": ("l", "1", ["litre", "litres", "liter", "liters", "ltr", "ltrs"]),
+    "ml": ("l", "0.001", ["millilitre", "millilitres", "milliliter", "milliliters"]),
+    "each": ("each", "1", ["head", "heads", "pc", "pcs", "piece", "pieces", "unit", "units"]),
+    "dozen": ("each", "12", ["dozens", "dz"]),
+    "tray": ("each", "30", ["trays"]),
+    # Containers with no fixed weight only compare with themselves.
+    "bag": ("bag", "1", ["bags", "sack", "sacks"]),
+    "bucket": ("bucket", "1", ["buckets"]),
+    "crate": ("crate", "1", ["crates"]),
+}
+
+_QUANTITY = re.compile(r"^\s*(\d+(?:[.,]\d+)*)\s*([^\d\s].*?)?\s*$")
+_THOUSANDS = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+
+
+# --------------------------------------
+# Unit Table
+# --------------------------------------
+_lock = threading.Lock()
+_cache = {"loaded_at": None, "units": None, "aliases": None}
+
+
+def build_table(rows=()):
+    """
+    Return (units, aliases) from the seeds overlaid with `rows` of
+    (code, base_unit, factor, aliases): units maps code to
+    {"base_unit", "factor", "aliases"}, aliases maps every name to its code.
+    """
+    units = {code: {"base_unit": base, "factor": Decimal(factor), "aliases": list(aliases)}
+             for code, (base, factor, aliases) in SEED_UNITS.items()}
+    for code, base_unit, factor, names in rows:
+        units[code] = {"base_unit": base_unit, "factor": Decimal(factor), "aliases": list(names or [])}
+    aliases = {}
+    for code, unit in units.items():
+        for name in (code, *unit["aliases"]):
+            aliases[name.lower()] = code
+    return units, aliases
+
+
+def get_units():
+    """The seeds plus the units table as build_table() returns them, re-read every UNITS_CACHE_SEC."""
+    now = time.monotonic()
+    loaded_at = _cache["loaded_at"]
+    if loaded_at is None or now - loaded_at > UNITS_CACHE_SEC:
+        with _lock:
+            if _cache["loaded_at"] is loaded_at:
+                rows = db.session.query(Unit.code, Unit.base_unit, Unit.factor, Unit.aliases).all()
+                _cache["units"], _cache["aliases"] = build_table(rows)
+                _cache["loaded_at"] = now
+    return _cache["units"], _cache["aliases"]
+
+
+def clear_cache():
+    _cache["loaded_at"] = None
+
+
+# --------------------------------------
+# Quantity Parsing
+# --------------------------------------
+def _amount(text):
+    text = _THOUSANDS.sub("", str(text).strip()).replace(",", ".")
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        return None
+    return amount if amount.is_finite() and amount >= 0 else None
+
+
+def to_base(amount, unit, table=None):
+    """
+    Convert `amount` of `unit` (a code or alias) to (amount, base unit).
+    Returns (None, None) for an unknown unit or an unusable amount.
+    """
+    units, aliases = table or get_units()
+    code = aliases.get((unit or "").strip().lower())
+    amount = _amount(amount) if amount is not None else None
+    if code is None or amount is None:
+        return None, None
+    return amount * units[code]["factor"], units[code]["base_unit"]
+
+
+def parse_quantity(text, table=None):
+    """
+    Parse a free-text quantity such as "20kg", "2 tonnes" or "1,500 l" into
+    (amount, base unit). A bare number, or one followed by a word that is not
+    a unit ("5 goats"), counts items. Returns (None, None) when `text` does
+    not start with a number.
+    """
+    match = _QUANTITY.match(str(text or ""))
+    if not match:
+        return None, None
+    table = table or get_units()
+    number, unit = match.groups()
+    if unit:
+        _, aliases = table
+        first = unit.split()[0].rstrip(".").lower()
+        if unit.lower() in aliases:
+            return to_base(number, unit, table)
+        if first in aliases:
+            return to_base(number, first, table)
+    return to_base(number, "each", table)
+
+
+def resolve_quantity(data):
+    """
+    Typed quantity for a listing payload: an explicit quantity_amount and
+    quantity_unit (as the LLM extraction sends them) win over parsing the
+    free-text quantity.
+    """
+    if data.get("quantity_amount") is not None and data.get("quantity_unit"):
+        amount, unit = to_base(data["quantity_amount"], data["quantity_unit"])
+        if unit is not None:
+            return amount, unit
+        logger.warning("Unknown quantity unit %r, parsing quantity text instead", data["quantity_unit"])
+    return parse_quantity(data.get("quantity"))
+
+
+def units_json():
+    """The unit table as served by GET /units and used by the LLM field extraction."""
+    units, _ = get_units()
+    return {code: {"base_unit": unit["base_unit"], "factor": float(unit["factor"]), "aliases": unit["aliases"]}
+            for code, unit in sorted(units.items())}
@@ -0,0 +1,45 @@
+"""payment reconciliation: reconciled_at and the reference lookup index
+
+Revision ID: 056d1f01b54d
+Revises: 8854e6e6fbe4
+Create Date: 2026-10-19 08:40:00.000000
+
+Every step checks the live schema first: databases created by
+db.create_all() may already have some or all of these objects.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '056d1f01b54d'
+down_revision = '8854e6e6fbe4'
+branch_labels = None
+depends_on = None
+
+
+def _columns(inspector, table):
+    return {c['name'] for c in inspector.get_columns(table)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    for table in ('payments', 'payments_archive'):
+        if table in tables and 'reconciled_at' not in _columns(inspector, table):
+            op.add_column(table, sa.Column('reconciled_at', sa.DateTime()))
+    op.create_index('idx_payment_reference', 'payments', ['reference'], if_not_exists=True)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if 'payments' in tables:
+        op.drop_index('idx_payment_reference', table_name='payments', if_exists=True)
+    for table in ('payments', 'payments_archive'):
+        if table in tables and 'reconciled_at' in _columns(inspector, table):
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.drop_column('reconciled_at')
@@ -0,0 +1,39 @@
+"""daily price rollups per product and district
+
+Revision ID: 14c4e5794a81
+Revises: facebff2a92f
+Create Date: 2026-10-19 08:10:00.000000
+
+Created empty; fill it with `flask market-stats backfill`.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '14c4e5794a81'
+down_revision = 'facebff2a92f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'market_price_stats' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'market_price_stats',
+        sa.Column('product', sa.String(100), primary_key=True),
+        sa.Column('district', sa.String(100), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Numeric(14, 2), nullable=False),
+        sa.Column('min_price', sa.Numeric(10, 2)),
+        sa.Column('max_price', sa.Numeric(10, 2)),
+        sa.Column('sketch', sa.JSON(), nullable=False),
+    )
+
+
+def downgrade():
+    if 'market_price_stats' in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_table('market_price_stats')
@@ -0,0 +1,37 @@
+"""stored responses for Idempotency-Key replays
+
+Revision ID: 229153c2e9ad
+Revises: 3df363fb93c0
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '229153c2e9ad'
+down_revision = '3df363fb93c0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'idempotency_keys' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'idempotency_keys',
+            sa.Column('key', sa.String(255), primary_key=True),
+            sa.Column('method', sa.String(10), nullable=False),
+            sa.Column('path', sa.String(255), nullable=False),
+            sa.Column('request_hash', sa.String(64), nullable=False),
+            sa.Column('status_code', sa.Integer()),
+            sa.Column('response_body', sa.Text()),
+            sa.Column('created_at', sa.DateTime()),
+            sa.Column('completed_at', sa.DateTime()),
+        )
+    op.create_index('ix_idempotency_keys_created_at', 'idempotency_keys', ['created_at'], if_not_exists=True)
+
+
+def downgrade():
+    if 'idempotency_keys' in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_table('idempotency_keys')
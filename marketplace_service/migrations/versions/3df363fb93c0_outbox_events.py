@@ -0,0 +1,36 @@
+"""transactional outbox
+
+Revision ID: 3df363fb93c0
+Revises: 056d1f01b54d
+Create Date: 2026-10-19 08:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3df363fb93c0'
+down_revision = '056d1f01b54d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'outbox_events' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'outbox_events',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('event_type', sa.String(50), nullable=False),
+            sa.Column('aggregate', sa.String(20), nullable=False),
+            sa.Column('aggregate_id', sa.String(36), nullable=False),
+            sa.Column('payload', sa.JSON(), nullable=False),
+            sa.Column('created_at', sa.DateTime()),
+            sa.Column('published_at', sa.DateTime()),
+        )
+    op.create_index('idx_outbox_unpublished', 'outbox_events', ['published_at', 'id'], if_not_exists=True)
+
+
+def downgrade():
+    if 'outbox_events' in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_table('outbox_events')
@@ -0,0 +1,184 @@
+"""typed listing quantity, units table and search indexes
+
+Revision ID: 3f9c2a7d41b6
+Revises: a809f5b83901
+Create Date: 2026-10-19 10:00:00.000000
+
+Every step checks the live schema first: databases created by
+db.create_all() may already have some or all of these objects.
+
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d41b6'
+down_revision = 'a809f5b83901'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH = 1000
+
+QUANTITY_COLUMNS = (
+    ('quantity_amount', sa.Numeric(14, 3)),
+    ('quantity_unit', sa.String(20)),
+)
+
+# Frozen copies of marketplace_service.units as of this revision, so later
+# changes to the live seeds or parser do not change what this step does.
+SEED_UNITS = {
+    "kg": ("kg", "1", ["kgs", "kilo", "kilos", "kilogram", "kilograms"]),
+    "g": ("kg", "0.001", ["gram", "grams", "gm", "gms"]),
+    "tonne": ("kg", "1000", ["t", "ton", "tons", "tonnes"]),
+    "l": ("l", "1", ["litre", "litres", "liter", "liters", "ltr", "ltrs"]),
+    "ml": ("l", "0.001", ["millilitre", "millilitres", "milliliter", "milliliters"]),
+    "each": ("each", "1", ["head", "heads", "pc", "pcs", "piece", "pieces", "unit", "units"]),
+    "dozen": ("each", "12", ["dozens", "dz"]),
+    "tray": ("each", "30", ["trays"]),
+    "bag": ("bag", "1", ["bags", "sack", "sacks"]),
+    "bucket": ("bucket", "1", ["buckets"]),
+    "crate": ("crate", "1", ["crates"]),
+}
+
+_QUANTITY = re.compile(r"^\s*(\d+(?:[.,]\d+)*)\s*([^\d\s].*?)?\s*$")
+_THOUSANDS = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+
+SEARCH_INDEXES = (
+    ('idx_listing_search_price', ['lower(product_name)', 'lower(location)', 'price']),
+    ('idx_listing_product_price', ['lower(product_name)', 'price']),
+    ('idx_listing_product_quantity', ['lower(product_name)', 'quantity_unit', 'quantity_amount']),
+    ('idx_listing_product_created', ['lower(product_name)', 'created_at']),
+)
+
+
+def _columns(inspector, table):
+    return {c['name'] for c in inspector.get_columns(table)}
+
+
+def _build_table(rows):
+    """(units, aliases) from units rows of (code, base_unit, factor, aliases)."""
+    units, aliases = {}, {}
+    for code, base_unit, factor, names in rows:
+        units[code] = (base_unit, Decimal(factor))
+        for name in (code, *(names or [])):
+            aliases[name.lower()] = code
+    return units, aliases
+
+
+def _amount(text):
+    text = _THOUSANDS.sub("", str(text).strip()).replace(",", ".")
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        return None
+    return amount if amount.is_finite() and amount >= 0 else None
+
+
+def _parse_quantity(text, table):
+    """(amount, base unit) for free-text quantity, as units.parse_quantity() parsed it at this revision."""
+    match = _QUANTITY.match(str(text or ""))
+    if not match:
+        return None, None
+    units, aliases = table
+    number, unit = match.groups()
+    code = "each"
+    if unit:
+        first = unit.split()[0].rstrip(".").lower()
+        code = aliases.get(unit.lower()) or aliases.get(first) or "each"
+    amount = _amount(number)
+    if code not in units or amount is None:
+        return None, None
+    base_unit, factor = units[code]
+    return amount * factor, base_unit
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+
+    if 'units' not in tables:
+        op.create_table(
+            'units',
+            sa.Column('code', sa.String(20), primary_key=True),
+            sa.Column('base_unit', sa.String(20), nullable=False),
+            sa.Column('factor', sa.Numeric(14, 6), nullable=False),
+            sa.Column('aliases', sa.JSON(), nullable=False),
+        )
+    units = sa.table('units', sa.column('code'), sa.column('base_unit'), sa.column('factor'),
+                     sa.column('aliases', sa.JSON()))
+    existing = {row.code for row in bind.execute(sa.select(units.c.code))}
+    seeds = [{'code': code, 'base_unit': base, 'factor': factor, 'aliases': aliases}
+             for code, (base, factor, aliases) in SEED_UNITS.items() if code not in existing]
+    if seeds:
+        op.bulk_insert(units, seeds)
+
+    for table in ('listings', 'listings_archive'):
+        if table not in tables:
+            continue
+        present = _columns(inspector, table)
+        for name, type_ in QUANTITY_COLUMNS:
+            if name not in present:
+                op.add_column(table, sa.Column(name, type_))
+
+    # Not checked by reflection: SQLite does not report expression indexes.
+    for name, expressions in SEARCH_INDEXES:
+        op.create_index(name, 'listings', [sa.text(e) for e in expressions], if_not_exists=True)
+
+    _backfill(bind, units)
+
+
+def _backfill(bind, units):
+    """Parse quantity for live listings that have none yet; archived rows are never searched."""
+    table = _build_table(bind.execute(sa.select(units.c.code, units.c.base_unit, units.c.factor,
+                                               units.c.aliases)).all())
+    listings = sa.table('listings', sa.column('id'), sa.column('quantity'),
+                        sa.column('quantity_amount'), sa.column('quantity_unit'))
+    last_id = ''
+    while True:
+        rows = bind.execute(
+            sa.select(listings.c.id, listings.c.quantity).where(
+                listings.c.id > last_id,
+                listings.c.quantity.isnot(None),
+                listings.c.quantity_amount.is_(None),
+            ).order_by(listings.c.id).limit(BACKFILL_BATCH)
+        ).all()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            amount, unit = _parse_quantity(row.quantity, table)
+            if unit is not None:
+                updates.append({'listing_id': row.id, 'amount': amount, 'unit': unit})
+        if updates:
+            bind.execute(
+                listings.update().where(listings.c.id == sa.bindparam('listing_id')).values(
+                    quantity_amount=sa.bindparam('amount', type_=sa.Numeric(14, 3)),
+                    quantity_unit=sa.bindparam('unit')
+                ),
+                updates
+            )
+        last_id = rows[-1].id
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if 'listings' in tables:
+        for name, _ in SEARCH_INDEXES:
+            op.drop_index(name, table_name='listings', if_exists=True)
+    for table in ('listings', 'listings_archive'):
+        if table not in tables:
+            continue
+        present = _columns(inspector, table)
+        with op.batch_alter_table(table) as batch_op:
+            for name, _ in QUANTITY_COLUMNS:
+                if name in present:
+                    batch_op.drop_column(name)
+    if 'units' in tables:
+        op.drop_table('units')
@@ -0,0 +1,60 @@
+"""content-addressed listing images
+
+Revision ID: 8854e6e6fbe4
+Revises: 944250132902
+Create Date: 2026-10-19 08:30:00.000000
+
+Every step checks the live schema first: databases created by
+db.create_all() may already have some or all of these objects.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8854e6e6fbe4'
+down_revision = '944250132902'
+branch_labels = None
+depends_on = None
+
+IMAGE_COLUMNS = (
+    ('content_hash', sa.String(64)),
+    ('content_type', sa.String(50)),
+    ('size_bytes', sa.Integer()),
+    ('variants', sa.JSON()),
+)
+
+
+def _columns(inspector, table):
+    return {c['name'] for c in inspector.get_columns(table)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    for table in ('listing_images', 'listing_images_archive'):
+        if table not in tables:
+            continue
+        present = _columns(inspector, table)
+        for name, type_ in IMAGE_COLUMNS:
+            if name not in present:
+                op.add_column(table, sa.Column(name, type_))
+    op.create_index('ix_listing_images_content_hash', 'listing_images', ['content_hash'], if_not_exists=True)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if 'listing_images' in tables:
+        op.drop_index('ix_listing_images_content_hash', table_name='listing_images', if_exists=True)
+    for table in ('listing_images', 'listing_images_archive'):
+        if table not in tables:
+            continue
+        present = _columns(inspector, table)
+        with op.batch_alter_table(table) as batch_op:
+            for name, _ in IMAGE_COLUMNS:
+                if name in present:
+                    batch_op.drop_column(name)
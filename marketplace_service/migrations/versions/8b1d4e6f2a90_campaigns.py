@@ -0,0 +1,68 @@
+"""campaigns and campaign recipients
+
+Revision ID: 8b1d4e6f2a90
+Revises: 3f9c2a7d41b6
+Create Date: 2026-10-19 17:30:00.000000
+
+Every step checks the live schema first: databases created by
+db.create_all() may already have some or all of these objects.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1d4e6f2a90'
+down_revision = '3f9c2a7d41b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if 'campaigns' not in tables:
+        op.create_table(
+            'campaigns',
+            sa.Column('id', sa.String(36), primary_key=True),
+            sa.Column('name', sa.String(100), nullable=False),
+            sa.Column('message', sa.Text(), nullable=False),
+            sa.Column('audience', sa.String(20), nullable=False),
+            sa.Column('filters', sa.JSON(), nullable=False),
+            sa.Column('status', sa.String(20), nullable=False),
+            sa.Column('enqueue_cursor', sa.String(20)),
+            sa.Column('enqueued_at', sa.DateTime()),
+            sa.Column('created_at', sa.DateTime()),
+            sa.Column('completed_at', sa.DateTime()),
+        )
+    if 'campaign_recipients' not in tables:
+        op.create_table(
+            'campaign_recipients',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('campaign_id', sa.String(36), sa.ForeignKey('campaigns.id'), nullable=False),
+            sa.Column('phone', sa.String(20), nullable=False),
+            sa.Column('status', sa.String(20), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('claimed_at', sa.DateTime()),
+            sa.Column('sent_at', sa.DateTime()),
+            sa.Column('provider_message_id', sa.String(64)),
+            sa.Column('error', sa.String(255)),
+            sa.UniqueConstraint('campaign_id', 'phone', name='uq_campaign_recipient'),
+        )
+    op.create_index('idx_campaign_recipient_status', 'campaign_recipients', ['campaign_id', 'status', 'id'],
+                    if_not_exists=True)
+    if 'buyer_alerts' in tables:
+        op.create_index('idx_buyer_alert_phone', 'buyer_alerts', ['phone'], if_not_exists=True)
+
+
+def downgrade():
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'buyer_alerts' in tables:
+        op.drop_index('idx_buyer_alert_phone', table_name='buyer_alerts', if_exists=True)
+    if 'campaign_recipients' in tables:
+        op.drop_table('campaign_recipients')
+    if 'campaigns' in tables:
+        op.drop_table('campaigns')
@@ -0,0 +1,93 @@
+"""archive tables for soft-deleted rows
+
+Revision ID: 944250132902
+Revises: 14c4e5794a81
+Create Date: 2026-10-19 08:20:00.000000
+
+Plain column copies of the live tables as of this revision plus
+archived_at: no foreign keys, no secondary indexes. Columns added to the
+live tables later are added to their archive in the same revision.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '944250132902'
+down_revision = '14c4e5794a81'
+branch_labels = None
+depends_on = None
+
+
+def _columns():
+    return {
+        'listings_archive': (
+            sa.Column('id', sa.String(36), primary_key=True),
+            sa.Column('seller_phone', sa.String(20)),
+            sa.Column('product_name', sa.String(100)),
+            sa.Column('quantity', sa.String(50)),
+            sa.Column('price', sa.Numeric(10, 2)),
+            sa.Column('location', sa.String(100)),
+            sa.Column('description', sa.Text()),
+            sa.Column('category', sa.String(50)),
+            sa.Column('views', sa.Integer()),
+            sa.Column('is_active', sa.Boolean()),
+            sa.Column('created_at', sa.DateTime()),
+        ),
+        'listing_images_archive': (
+            sa.Column('id', sa.String(36), primary_key=True),
+            sa.Column('listing_id', sa.String(36)),
+            sa.Column('image_url', sa.String(255)),
+            sa.Column('is_primary', sa.Boolean()),
+            sa.Column('uploaded_at', sa.DateTime()),
+        ),
+        'payments_archive': (
+            sa.Column('id', sa.String(36), primary_key=True),
+            sa.Column('seller_phone', sa.String(20)),
+            sa.Column('amount', sa.Numeric(10, 2)),
+            sa.Column('method', sa.String(50)),
+            sa.Column('reference', sa.String(100)),
+            sa.Column('status', sa.String(20)),
+            sa.Column('created_at', sa.DateTime()),
+        ),
+        'buyer_alerts_archive': (
+            sa.Column('id', sa.String(36), primary_key=True),
+            sa.Column('phone', sa.String(20)),
+            sa.Column('product_name', sa.String(100)),
+            sa.Column('location', sa.String(100)),
+            sa.Column('is_active', sa.Boolean()),
+            sa.Column('created_at', sa.DateTime()),
+        ),
+        'buy_requests_archive': (
+            sa.Column('id', sa.String(36), primary_key=True),
+            sa.Column('phone', sa.String(20)),
+            sa.Column('product_name', sa.String(100)),
+            sa.Column('location', sa.String(100)),
+            sa.Column('quantity', sa.String(50)),
+            sa.Column('status', sa.String(20)),
+            sa.Column('created_at', sa.DateTime()),
+        ),
+    }
+
+
+def upgrade():
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    for name, columns in _columns().items():
+        if name not in tables:
+            op.create_table(
+                name,
+                *columns,
+                sa.Column('is_deleted', sa.Boolean()),
+                sa.Column('deleted_at', sa.DateTime()),
+                sa.Column('archived_at', sa.DateTime()),
+            )
+
+
+def downgrade():
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    for name in _columns():
+        if name in tables:
+            op.drop_table(name)
@@ -0,0 +1,32 @@
+"""per-seller lookup indexes for the dashboard summary
+
+Revision ID: a809f5b83901
+Revises: 229153c2e9ad
+Create Date: 2026-10-19 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a809f5b83901'
+down_revision = '229153c2e9ad'
+branch_labels = None
+depends_on = None
+
+LOOKUP_INDEXES = (
+    ('idx_listing_seller', 'listings', ['seller_phone', 'is_active']),
+    ('idx_payment_seller', 'payments', ['seller_phone', 'created_at']),
+    ('idx_review_seller', 'seller_reviews', ['seller_phone']),
+)
+
+
+def upgrade():
+    for name, table, columns in LOOKUP_INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, _ in LOOKUP_INDEXES:
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,124 @@
+"""baseline schema: sellers, listings, payments, images, buyer alerts, buy requests, reviews
+
+Revision ID: facebff2a92f
+Revises:
+Create Date: 2026-10-19 08:00:00.000000
+
+The schema as db.create_all() built it before migrations were used.
+Databases created that way already have these tables and are left alone.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'facebff2a92f'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _soft_delete():
+    return (
+        sa.Column('is_deleted', sa.Boolean()),
+        sa.Column('deleted_at', sa.DateTime()),
+    )
+
+
+def upgrade():
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'sellers' not in tables:
+        op.create_table(
+            'sellers',
+            sa.Column('phone', sa.String(20), primary_key=True, unique=True, nullable=False),
+            sa.Column('business_name', sa.String(100)),
+            sa.Column('location', sa.String(100)),
+            sa.Column('payment_method', sa.String(50)),
+            sa.Column('is_verified', sa.Boolean()),
+            sa.Column('is_paid', sa.Boolean()),
+            sa.Column('subscription_type', sa.String(20)),
+            sa.Column('last_payment_date', sa.DateTime()),
+            sa.Column('created_at', sa.DateTime()),
+            *_soft_delete(),
+        )
+    if 'listings' not in tables:
+        op.create_table(
+            'listings',
+            sa.Column('id', sa.String(36), primary_key=True),
+            sa.Column('seller_phone', sa.String(20), sa.ForeignKey('sellers.phone'), nullable=False),
+            sa.Column('product_name', sa.String(100), nullable=False),
+            sa.Column('quantity', sa.String(50)),
+            sa.Column('price', sa.Numeric(10, 2)),
+            sa.Column('location', sa.String(100)),
+            sa.Column('description', sa.Text()),
+            sa.Column('category', sa.String(50)),
+            sa.Column('views', sa.Integer()),
+            sa.Column('is_active', sa.Boolean()),
+            sa.Column('created_at', sa.DateTime()),
+            *_soft_delete(),
+        )
+        op.create_index('idx_listing_product', 'listings', ['product_name'])
+        op.create_index('idx_listing_location', 'listings', ['location'])
+    if 'payments' not in tables:
+        op.create_table(
+            'payments',
+            sa.Column('id', sa.String(36), primary_key=True),
+            sa.Column('seller_phone', sa.String(20), sa.ForeignKey('sellers.phone'), nullable=False),
+            sa.Column('amount', sa.Numeric(10, 2)),
+            sa.Column('method', sa.String(50)),
+            sa.Column('reference', sa.String(100)),
+            sa.Column('status', sa.String(20)),
+            sa.Column('created_at', sa.DateTime()),
+            *_soft_delete(),
+        )
+    if 'listing_images' not in tables:
+        op.create_table(
+            'listing_images',
+            sa.Column('id', sa.String(36), primary_key=True),
+            sa.Column('listing_id', sa.String(36), sa.ForeignKey('listings.id'), nullable=False),
+            sa.Column('image_url', sa.String(255), nullable=False),
+            sa.Column('is_primary', sa.Boolean()),
+            sa.Column('uploaded_at', sa.DateTime()),
+            *_soft_delete(),
+        )
+    if 'buyer_alerts' not in tables:
+        op.create_table(
+            'buyer_alerts',
+            sa.Column('id', sa.String(36), primary_key=True),
+            sa.Column('phone', sa.String(20), nullable=False),
+            sa.Column('product_name', sa.String(100)),
+            sa.Column('location', sa.String(100)),
+            sa.Column('is_active', sa.Boolean()),
+            sa.Column('created_at', sa.DateTime()),
+            *_soft_delete(),
+        )
+        op.create_index('idx_buyer_alert_product', 'buyer_alerts', ['product_name'])
+    if 'buy_requests' not in tables:
+        op.create_table(
+            'buy_requests',
+            sa.Column('id', sa.String(36), primary_key=True),
+            sa.Column('phone', sa.String(20), nullable=False),
+            sa.Column('product_name', sa.String(100), nullable=False),
+            sa.Column('location', sa.String(100)),
+            sa.Column('quantity', sa.String(50)),
+            sa.Column('status', sa.String(20)),
+            sa.Column('created_at', sa.DateTime()),
+            *_soft_delete(),
+        )
+    if 'seller_reviews' not in tables:
+        op.create_table(
+            'seller_reviews',
+            sa.Column('id', sa.String(36), primary_key=True),
+            sa.Column('seller_phone', sa.String(20), sa.ForeignKey('sellers.phone'), nullable=False),
+            sa.Column('rating', sa.Integer(), nullable=False),
+            sa.Column('comment', sa.Text()),
+            sa.Column('created_at', sa.DateTime()),
+        )
+
+
+def downgrade():
+    for table in ('seller_reviews', 'buy_requests', 'buyer_alerts', 'listing_images', 'payments', 'listings',
+                  'sellers'):
+        op.drop_table(table)